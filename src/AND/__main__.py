@@ -0,0 +1,91 @@
+import sys
+import argparse
+import AND.utils.logger as logger
+
+# subcommands of the training pipeline, a subcommand computes the upstream stages it needs,
+# with checkpoints the stages of an earlier subcommand are reused instead of computed again
+COMMANDS = {"clean": "load, clean and compact the contributions",
+            "pair": "create the contribution pairs of the train and test data sets",
+            "featurize": "compute the features of the contribution pairs",
+            "train": "cross validate and fit the random forest, the model artifact is saved",
+            "predict": "predict the test contribution pairs",
+            "cluster": "create the author profiles of the test data set",
+            "evaluate": "evaluate the author profiles against the ground truth",
+            "run": "run the full training pipeline"}
+
+
+def run_command(args: argparse.Namespace) -> int:
+    """
+    runs a subcommand, the pipeline and with it pandas, sklearn etc. are only imported here
+    :param args: argparse.Namespace
+    :return: int, exit code
+    """
+    from AND.utils.helpers import read_configurations
+    from AND.training.pipeline import TrainingPipeline
+
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("Start " + args.command)
+    logger.logging.info("##----------------------------------------")
+
+    logger.logging.info("## Loading config file")
+    config = read_configurations(args.config)
+    pipeline = TrainingPipeline(config, checkpoints=args.checkpoints)
+    if not pipeline.checkpoints.enabled and args.command not in ("clean", "run"):
+        logger.logging.info(">>> Checkpoints are disabled, the upstream stages are computed again")
+
+    if args.command == "clean":
+        df = pipeline.compacted.value
+        logger.logging.info(">>> Cleaned " + str(len(df)) + " contributions")
+    elif args.command == "pair" and pipeline.streaming:
+        logger.logging.info(">>> Pairs are streamed to the feature store together with their features")
+        train_data, test_data = pipeline.featurized.value
+        logger.logging.info(">>> Created " + str(len(train_data)) + " train and " + str(len(test_data)) +
+                            " test pairs")
+    elif args.command in ("pair", "featurize"):
+        train_data, test_data = (pipeline.paired if args.command == "pair" else pipeline.featurized).value
+        logger.logging.info(">>> Created " + str(len(train_data)) + " train and " + str(len(test_data)) +
+                            " test pairs")
+    elif args.command == "train":
+        pipeline.report_training(cross_validation=not args.skip_cross_validation)
+    elif args.command == "predict":
+        pipeline.report_predictions()
+    elif args.command == "cluster":
+        pipeline.report_profiles()
+    elif args.command == "evaluate":
+        pipeline.report_evaluation()
+    else:
+        pipeline.report_training()
+        pipeline.report_profiles()
+        pipeline.report_evaluation()
+    pipeline.write_profile()
+
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("Completed successfully")
+    logger.logging.info("##----------------------------------------")
+    return 0
+
+
+def run_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m AND", description="author name disambiguation")
+    parser.add_argument("--config", default="config.yaml", help="config file in config_files/")
+    parser.add_argument("--checkpoints", dest="checkpoints", action="store_const", const=True, default=None,
+                        help="reuse the stages of earlier runs, overrides the config")
+    parser.add_argument("--no-checkpoints", dest="checkpoints", action="store_const", const=False,
+                        help="compute every stage, overrides the config")
+    parser.add_argument("--log-file", default=str(logger.DEFAULT_LOG_FILE), help="file the log is written to")
+    parser.add_argument("--quiet", action="store_true", help="only log to the log file")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+    for name, description in COMMANDS.items():
+        command = commands.add_parser(name, help=description, description=description)
+        if name == "train":
+            command.add_argument("--skip-cross-validation", action="store_true",
+                                 help="only fit the random forest on the full training data set")
+    args = parser.parse_args(argv)
+
+    logger.setup_logging(args.log_file, console=not args.quiet)
+    return run_command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
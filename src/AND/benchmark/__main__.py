@@ -0,0 +1,58 @@
+import os
+import sys
+import argparse
+import AND.utils.logger as logger
+from AND.benchmark.benchmarks import BENCHMARKS, compare_results, load_results, run_benchmarks, save_results
+
+
+def run_benchmark_suite(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m AND.benchmark",
+                                     description="benchmarks of the pipeline stages on synthetic corpora")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 5000], help="numbers of contributions")
+    parser.add_argument("--only", nargs="+", help="names of the benchmarks to run, all by default")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the best run is reported")
+    parser.add_argument("--collision-rate", type=float, default=0.1, help="share of persons with a repeated name")
+    parser.add_argument("--contributions-per-person", type=float, default=4.0)
+    parser.add_argument("--max-list-length", type=int, default=3)
+    parser.add_argument("--max-locations", type=int, default=3)
+    parser.add_argument("--max-pairs", type=int, default=100000,
+                        help="pairs used by the feature, classifier and clustering benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="results/benchmarks/latest.json", help="file the results are written to")
+    parser.add_argument("--baseline", default="results/benchmarks/baseline.json", help="baseline to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="accepted relative slow down")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.only or [] if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks {}, choose from {}".format(", ".join(unknown), ", ".join(BENCHMARKS)))
+
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("Start benchmarks")
+    logger.logging.info("##----------------------------------------")
+    results = run_benchmarks(args.scales, names=args.only, repeat=args.repeat, max_pairs=args.max_pairs,
+                             seed=args.seed, collision_rate=args.collision_rate,
+                             contributions_per_person=args.contributions_per_person,
+                             max_list_length=args.max_list_length, max_locations=args.max_locations)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    save_results(results, args.output)
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        logger.logging.info(">>> Saved baseline " + args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        logger.logging.info(">>> No baseline found in " + args.baseline)
+        return 0
+
+    logger.logging.info("## Comparing with baseline " + args.baseline)
+    regressions = compare_results(results, load_results(args.baseline), tolerance=args.tolerance)
+    for scale, name, ratio in regressions:
+        logger.logging.warning("Regression of {} at {} contributions: {:.2f}x slower".format(name, scale, ratio))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    logger.setup_logging()
+    sys.exit(run_benchmark_suite())
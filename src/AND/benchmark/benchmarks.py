@@ -0,0 +1,241 @@
+import json
+import time
+import logging
+from typing import Callable, List, Tuple
+import AND.utils.logger as logger
+import AND.model.cleaning as cleaning
+import AND.model.feature_engineering as feature_engineering
+from AND.benchmark.synthetic import generate_corpus
+from AND.model.feature_matrix import DISTANCE_FEATURES, EXACT_MATCH_COLUMNS, FEATURE_NAMES, SHARED_WORDS_COLUMNS, \
+    SOUNDEX_COLUMNS, compute_feature_matrix
+from AND.model.graph import create_graph, create_profiles, get_disconnected_subgraphs
+from AND.model.precompute import ContributionCache
+from AND.model.rf_classifier import rfClassifier
+from AND.training.data_preparation import combine_data_sets, create_contribution_pairs, sample_contribution_pairs
+from AND.training.evaluation import evaluate_profiles
+
+__all__ = ['BENCHMARKS', 'run_benchmarks', 'compare_results', 'load_results', 'save_results']
+
+# a benchmark prepares its untimed input from the corpus context and returns the timed function,
+# the timed function returns the number of processed items (rows or pairs)
+Benchmark = Callable[[dict], Callable[[], int]]
+
+
+def reference_feature(function: Callable, col: str, feature: object) -> Benchmark:
+    """
+    benchmark of one feature function of feature_engineering.compute_features on the gathered pair columns
+    :param function: Callable, e.g. feature_engineering.soundex
+    :param col: str, cleaned column the feature compares
+    :param feature: str or List[str], name(s) of the feature columns
+    :return: Benchmark
+    """
+    def prepare(context: dict) -> Callable[[], int]:
+        pairs = feature_engineering.gather_pair_columns(context["pairs"], context["clean"], col)
+
+        def run() -> int:
+            function(pairs.copy(), col, col + "_2nd", feature)
+            return len(pairs)
+        return run
+    return prepare
+
+
+def cleaning_benchmark(context: dict) -> Callable[[], int]:
+    def run() -> int:
+        df = combine_data_sets(context["raw"].copy(), context["gt"])
+        return len(cleaning.cleaning_procedure(df))
+    return run
+
+
+def pairs_benchmark(context: dict) -> Callable[[], int]:
+    return lambda: len(create_contribution_pairs(context["clean"], n=context["n"]))
+
+
+def blocked_pairs_benchmark(context: dict) -> Callable[[], int]:
+    return lambda: len(create_contribution_pairs(context["clean"], n=context["n"],
+                                                 blocking={"strategy": "soundex_last_name"}))
+
+
+def sampled_pairs_benchmark(context: dict) -> Callable[[], int]:
+    return lambda: len(sample_contribution_pairs(context["clean"]))
+
+
+def precompute_benchmark(context: dict) -> Callable[[], int]:
+    def run() -> int:
+        ContributionCache(context["clean"])
+        return len(context["clean"])
+    return run
+
+
+def feature_matrix_benchmark(context: dict) -> Callable[[], int]:
+    cache = ContributionCache(context["clean"])
+    return lambda: len(compute_feature_matrix(context["pairs"], cache))
+
+
+def rf_fit_benchmark(context: dict) -> Callable[[], int]:
+    def run() -> int:
+        classifier().fit_classifier(context["features"])
+        return len(context["features"])
+    return run
+
+
+def rf_predict_benchmark(context: dict) -> Callable[[], int]:
+    fitted = classifier()
+    fitted.fit_classifier(context["features"])
+    return lambda: len(fitted.predict(context["features"].copy()))
+
+
+def clustering_benchmark(context: dict) -> Callable[[], int]:
+    def run() -> int:
+        create_profiles(context["predicted"])
+        return len(context["predicted"])
+    return run
+
+
+def clustering_networkx_benchmark(context: dict) -> Callable[[], int]:
+    def run() -> int:
+        get_disconnected_subgraphs(create_graph(context["predicted"]))
+        return len(context["predicted"])
+    return run
+
+
+def evaluate_profiles_benchmark(context: dict) -> Callable[[], int]:
+    profiles = create_profiles(context["predicted"])
+
+    def run() -> int:
+        evaluate_profiles(profiles, context["gt"])
+        return len(context["gt"])
+    return run
+
+
+def classifier() -> rfClassifier:
+    return rfClassifier(dict(max_depth=5, n_estimators=20, n_folds=3, features=FEATURE_NAMES,
+                             col_label="same_person"))
+
+
+def feature_benchmarks() -> dict:
+    """
+    benchmarks of every feature of feature_engineering.compute_features on its own
+    :return: dict, benchmark of every feature
+    """
+    benchmarks = {}
+    for col in EXACT_MATCH_COLUMNS:
+        benchmarks["feature/exact_match_" + col] = reference_feature(feature_engineering.exact_match, col,
+                                                                     "exact_match_" + col)
+    for col in SOUNDEX_COLUMNS:
+        benchmarks["feature/soundex_" + col] = reference_feature(feature_engineering.soundex, col, "soundex_" + col)
+    for col, feature in SHARED_WORDS_COLUMNS.items():
+        benchmarks["feature/" + feature] = reference_feature(feature_engineering.number_shared_in_list, col, feature)
+    benchmarks["feature/distances"] = reference_feature(feature_engineering.distance_average_work_locations,
+                                                        "workplace_locations", DISTANCE_FEATURES)
+    return benchmarks
+
+
+BENCHMARKS = {"cleaning": cleaning_benchmark,
+              "pairs": pairs_benchmark,
+              "blocked_pairs": blocked_pairs_benchmark,
+              "sampled_pairs": sampled_pairs_benchmark,
+              "precompute": precompute_benchmark,
+              "feature_matrix": feature_matrix_benchmark,
+              "rf_fit": rf_fit_benchmark,
+              "rf_predict": rf_predict_benchmark,
+              "clustering": clustering_benchmark,
+              "clustering_networkx": clustering_networkx_benchmark,
+              "evaluate_profiles": evaluate_profiles_benchmark,
+              **feature_benchmarks()}
+
+
+def prepare_context(n_contributions: int, n: int = 3, max_pairs: int = 100000, seed: int = 0, **corpus) -> dict:
+    """
+    generates a synthetic corpus and the untimed inputs of the benchmarks
+    :param n_contributions: int, size of the corpus
+    :param n: int, only take every nt-h negative pair
+    :param max_pairs: int, the feature, classifier and clustering benchmarks use at most max_pairs pairs
+    :param seed: int
+    :param corpus: further parameters of generate_corpus
+    :return: dict
+    """
+    raw, gt = generate_corpus(n_contributions, seed=seed, **corpus)
+    clean = cleaning.cleaning_procedure(combine_data_sets(raw.copy(), gt))
+    pairs = create_contribution_pairs(clean, n=n, blocking={"strategy": "soundex_last_name"})
+    if len(pairs) > max_pairs:
+        pairs = pairs.sample(max_pairs, random_state=seed).sort_index().reset_index(drop=True)
+    features = pairs.copy()
+    features[FEATURE_NAMES] = compute_feature_matrix(pairs, ContributionCache(clean))
+    predicted = features.assign(prediction=features["same_person"].values)
+    return dict(raw=raw, gt=gt, clean=clean, n=n, pairs=pairs, features=features, predicted=predicted)
+
+
+def time_benchmark(benchmark: Benchmark, context: dict, repeat: int) -> dict:
+    """
+    times a benchmark, the best of repeat runs is reported
+    :param benchmark: Benchmark
+    :param context: dict, see prepare_context
+    :param repeat: int
+    :return: dict, seconds, items and items per second
+    """
+    timings, items = [], 0
+    for _ in range(repeat):
+        run = benchmark(context)
+        start = time.perf_counter()
+        items = run()
+        timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    return dict(seconds=seconds, items=int(items), items_per_second=items / seconds if seconds > 0 else None)
+
+
+def run_benchmarks(scales: List[int], names: List[str] = None, repeat: int = 3, **context_params) -> dict:
+    """
+    runs the benchmarks on synthetic corpora of several sizes
+    :param scales: List[int], numbers of contributions
+    :param names: List[str], optional names of the benchmarks, all benchmarks by default
+    :param repeat: int, runs per benchmark
+    :param context_params: parameters of prepare_context
+    :return: dict, results by scale and benchmark
+    """
+    names = list(BENCHMARKS) if names is None else names
+    results = {}
+    for scale in scales:
+        logger.logging.info(">>> Preparing synthetic corpus of " + str(scale) + " contributions")
+        # the pipeline logs every step, only the benchmark results are of interest here
+        level = logging.root.level
+        logging.root.setLevel(logging.WARNING)
+        try:
+            context = prepare_context(scale, **context_params)
+            results[str(scale)] = {name: time_benchmark(BENCHMARKS[name], context, repeat) for name in names}
+        finally:
+            logging.root.setLevel(level)
+        for name, result in results[str(scale)].items():
+            logger.logging.info(">>> {:>8} {:<45} {:10.4f} s {:>10} items".format(
+                scale, name, result["seconds"], result["items"]))
+    return results
+
+
+def save_results(results: dict, path: str) -> None:
+    with open(path, "w") as handle:
+        json.dump(dict(created=time.strftime("%Y-%m-%dT%H:%M:%S"), results=results), handle, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as handle:
+        return json.load(handle)["results"]
+
+
+def compare_results(results: dict, baseline: dict, tolerance: float = 0.2) -> List[Tuple[str, str, float]]:
+    """
+    compares benchmark results with a baseline, the benchmarks that exist in both are compared
+    :param results: dict, see run_benchmarks
+    :param baseline: dict, see run_benchmarks
+    :param tolerance: float, relative slow down that is accepted
+    :return: List[Tuple], the regressions as (scale, benchmark, slow down factor)
+    """
+    regressions = []
+    for scale, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            reference = baseline.get(scale, {}).get(name)
+            if reference is None or reference["seconds"] <= 0:
+                continue
+            ratio = result["seconds"] / reference["seconds"]
+            logger.logging.info(">>> {:>8} {:<45} {:6.2f}x of baseline".format(scale, name, ratio))
+            if ratio > 1 + tolerance:
+                regressions.append((scale, name, ratio))
+    return regressions
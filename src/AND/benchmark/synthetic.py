@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from typing import List, Tuple
+
+__all__ = ['generate_corpus']
+
+SYLLABLES = ["an", "be", "chi", "do", "el", "fa", "gu", "han", "i", "jo", "ka", "li", "mar", "no", "o", "pe",
+             "qu", "ro", "sa", "ta", "u", "vi", "wei", "xu", "ya", "zo", "mül", "ßen"]
+MIDDLE_NAMES = ["", "", "", "A.", "J.", "K", "Marie", "van", "de la"]
+WORKPLACE_TYPES = ["University of", "Institute for", "Dept. of", "Max-Planck-Institute", "Lab.", "College"]
+WORDS = ["machine", "learning", "physics", "optics", "bio-chemistry", "data", "science", "graph", "theory",
+         "language", "vision", "robotics", "genetics", "climate", "finance", "networks", "quantum", "materials"]
+PUNCTUATION = ["", "", "", ".", ";", " / ", "-", ", ", " (", ") ", ":", "[", "]"]
+
+
+def make_names(rng: np.random.Generator, n: int, min_syllables: int, max_syllables: int) -> List[str]:
+    """
+    random capitalized names built from syllables
+    :param rng: np.random.Generator
+    :param n: int, number of names
+    :param min_syllables: int
+    :param max_syllables: int
+    :return: List[str]
+    """
+    lengths = rng.integers(min_syllables, max_syllables + 1, size=n)
+    syllables = rng.integers(0, len(SYLLABLES), size=int(lengths.sum()))
+    offsets = np.r_[0, np.cumsum(lengths)]
+    return ["".join(SYLLABLES[k] for k in syllables[start:stop]).capitalize()
+            for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+def make_phrases(rng: np.random.Generator, n: int, vocabulary: List[str]) -> List[str]:
+    """
+    random phrases of one to three words joined by punctuation, e.g. focus areas or organisations
+    :param rng: np.random.Generator
+    :param n: int, number of phrases
+    :param vocabulary: List[str]
+    :return: List[str]
+    """
+    phrases = []
+    for length in rng.integers(1, 4, size=n):
+        words = [vocabulary[k] for k in rng.integers(0, len(vocabulary), size=length)]
+        separators = [PUNCTUATION[k] or " " for k in rng.integers(0, len(PUNCTUATION), size=length - 1)]
+        phrase = words[0]
+        for separator, word in zip(separators, words[1:]):
+            phrase += separator + word
+        phrases.append(phrase.title() if rng.random() < 0.5 else phrase)
+    return phrases
+
+
+def generate_corpus(n_contributions: int, collision_rate: float = 0.1, contributions_per_person: float = 4.0,
+                    max_list_length: int = 3, max_locations: int = 3, n_vocabulary: int = 200,
+                    seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    generates a synthetic corpus of contributions with the schema of the raw data and its ground truth.
+    Every person has a name, a home workplace, home locations and a personal vocabulary of focus areas,
+    gpes and orgs, the contributions of a person sample from them with some noise
+    :param n_contributions: int, number of contributions
+    :param collision_rate: float, probability that a person gets the name of an earlier person
+    :param contributions_per_person: float, mean number of contributions of a person
+    :param max_list_length: int, maximum length of the lists focus_areas, gpes and orgs
+    :param max_locations: int, maximum number of work locations of a contribution
+    :param n_vocabulary: int, number of distinct phrases of every list column
+    :param seed: int
+    :return: Tuple[pd.DataFrame], the contributions and the ground truth
+    """
+    rng = np.random.default_rng(seed)
+    counts = 1 + rng.poisson(max(contributions_per_person - 1, 0), size=n_contributions)
+    n_persons = int(np.searchsorted(np.cumsum(counts), n_contributions)) + 1
+    counts = counts[:n_persons]
+    counts[-1] -= counts.sum() - n_contributions
+
+    # person attributes, colliding persons copy the name of a random earlier person
+    first_names = np.array(make_names(rng, n_persons, 1, 2), dtype=object)
+    last_names = np.array(make_names(rng, n_persons, 1, 3), dtype=object)
+    middle_names = np.array(MIDDLE_NAMES, dtype=object)[rng.integers(0, len(MIDDLE_NAMES), size=n_persons)]
+    collisions = np.flatnonzero(rng.random(n_persons) < collision_rate)
+    collisions = collisions[collisions > 0]
+    sources = (rng.random(len(collisions)) * collisions).astype(np.int64)
+    first_names[collisions] = first_names[sources]
+    last_names[collisions] = last_names[sources]
+    middle_names[collisions] = middle_names[sources]
+
+    workplaces = [WORKPLACE_TYPES[k] + " " + name for k, name in
+                  zip(rng.integers(0, len(WORKPLACE_TYPES), size=n_persons), make_names(rng, n_persons, 2, 3))]
+    home_locations = np.c_[rng.uniform(-60, 70, size=n_persons), rng.uniform(-170, 170, size=n_persons)]
+    vocabularies = {col: make_phrases(rng, n_vocabulary, WORDS) for col in ["focus_areas", "gpes", "orgs"]}
+    vocabularies["gpes"] = make_names(rng, n_vocabulary, 1, 3)
+    interests = {col: rng.integers(0, n_vocabulary, size=(n_persons, max(max_list_length, 1) * 2))
+                 for col in vocabularies}
+
+    persons = np.repeat(np.arange(n_persons), counts)
+    rows = {"contribution_id": ["c" + str(k) for k in range(n_contributions)],
+            "first_name": [], "middle_name": [], "last_name": [], "full_name": [], "workplace": [],
+            "workplace_locations": [], "focus_areas": [], "gpes": [], "orgs": []}
+    list_lengths = {col: rng.integers(0, max_list_length + 1, size=n_contributions) for col in vocabularies}
+    location_counts = rng.integers(0, max_locations + 1, size=n_contributions)
+    noise = rng.random((n_contributions, 3))
+    for k, person in enumerate(persons):
+        first, middle, last = first_names[person], middle_names[person], last_names[person]
+        if noise[k, 0] < 0.1:
+            # abbreviated first name
+            first = first[0] + "."
+        rows["first_name"].append(first)
+        rows["middle_name"].append(middle)
+        rows["last_name"].append(last)
+        rows["full_name"].append(" ".join(name for name in (first, middle, last) if name))
+        rows["workplace"].append(workplaces[person] if noise[k, 1] < 0.8 else workplaces[rng.integers(0, n_persons)])
+        rows["workplace_locations"].append(
+            [[float(home_locations[person, 0] + rng.normal(0, 0.5)), float(home_locations[person, 1] + rng.normal(0, 0.5))]
+             for _ in range(location_counts[k])])
+        for col, vocabulary in vocabularies.items():
+            picks = rng.choice(interests[col][person], size=list_lengths[col][k], replace=False) \
+                if list_lengths[col][k] <= interests[col].shape[1] else interests[col][person]
+            rows[col].append([vocabulary[pick] for pick in picks])
+        if noise[k, 2] < 0.05:
+            rows["focus_areas"][-1] = None
+
+    df = pd.DataFrame(rows)
+    gt = pd.DataFrame({"contributionId": rows["contribution_id"], "personId": ["p" + str(p) for p in persons]})
+    return df, gt
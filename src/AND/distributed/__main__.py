@@ -0,0 +1,132 @@
+import os
+import sys
+import secrets
+import argparse
+import AND.utils.logger as logger
+from AND.utils.helpers import read_configurations
+from AND.distributed.coordinator import AUTHKEY_VARIABLE, Coordinator, is_loopback, run_worker, start_local_workers
+
+
+def run_distributed(config: dict, n_shards: int = None, n_workers: int = None) -> list:
+    """
+    disambiguates the whole corpus in shards: the contributions are partitioned by blocking key, the workers
+    clean, pair, featurize, predict and cluster the shards with the saved model and the profiles of the shards
+    are merged with a global union-find into one profile store.
+    Only the partitioning and the shards are bounded in memory, the merge still holds the contribution ids and
+    profile labels of the whole corpus and the evaluation loads the whole ground truth and all profiles
+    :param config: dict, see read_configurations, the section distributed configures the run, workers on other
+                   hosts need distributed.host and distributed.authkey
+    :param n_shards: int, overrides distributed.n_shards
+    :param n_workers: int, overrides distributed.n_workers, 0 only waits for workers that connect on their own
+    :return: List[set], the author profiles
+    """
+    from AND.distributed.sharding import merge_shard_profiles, partition_contributions, shard_keys
+    from AND.model.graph import labels_to_profiles
+    from AND.training.evaluation import evaluate_clustering
+    from AND.utils.data_loader import GROUND_TRUTH_COLUMNS, load_table
+    from AND.utils.file import FileUtil
+    from AND.utils.profile_store import ProfileStore
+
+    file_util = FileUtil(config)
+    distributed = config.get("distributed", {})
+    n_shards = n_shards or distributed.get("n_shards", 8)
+    n_workers = distributed.get("n_workers", 2) if n_workers is None else n_workers
+    blocking = config.get("blocking")
+    if not os.path.exists(file_util.model_path):
+        raise FileNotFoundError("No model artifact in " + file_util.model_path + ", train a model first")
+    # the coordinator unpickles the messages of the workers, without a configured key it only listens on this host
+    # with a fresh key per run, which the local workers get through the environment
+    host = distributed.get("host", "127.0.0.1")
+    if distributed.get("authkey"):
+        authkey = str(distributed["authkey"]).encode("utf-8")
+    elif is_loopback(host):
+        authkey = secrets.token_hex(32).encode("utf-8")
+    else:
+        raise ValueError("distributed.host " + str(host) + " is not a loopback address, "
+                         "set a secret distributed.authkey to let workers on other hosts connect")
+
+    logger.logging.info("## Partitioning the contributions into " + str(n_shards) + " shards")
+    keys = distributed.get("keys") or shard_keys(blocking)
+    gt_path = file_util.gt_path if os.path.exists(file_util.gt_path) else None
+    tasks = partition_contributions(file_util.data_path, gt_path, os.path.join(file_util.distributed_path, "shards"),
+                                    n_shards, keys, chunksize=file_util.chunksize)
+    for task in tasks:
+        task.update(model_path=file_util.model_path, blocking=blocking, n_jobs=distributed.get("n_jobs", 1),
+                    chunk_size=config.get("parallel", {}).get("chunk_size", 1000000))
+
+    logger.logging.info("## Disambiguating the shards")
+    coordinator = Coordinator(tasks, (host, distributed.get("port", 0)), authkey,
+                              max_attempts=distributed.get("max_attempts", 2))
+    logger.logging.info(">>> Coordinator listening on {}:{}".format(*coordinator.address))
+    processes = start_local_workers(coordinator.address, authkey, n_workers,
+                                    log_path=os.path.dirname(os.path.abspath(logger.DEFAULT_LOG_FILE)))
+    try:
+        results = coordinator.wait(processes)
+    finally:
+        coordinator.close()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except Exception:
+                process.kill()
+
+    logger.logging.info("## Merging the profiles of the shards")
+    contribution_ids, labels = merge_shard_profiles([ProfileStore(results[shard]["profiles"])
+                                                     for shard in sorted(results)])
+    profiles = labels_to_profiles(contribution_ids, labels)
+    ProfileStore.write(os.path.join(file_util.distributed_path, "profiles"), profiles,
+                       meta=dict(config=config, keys=keys, shards={shard: dict(result, profiles=None)
+                                                                   for shard, result in results.items()}))
+    logger.logging.info(">>> Created " + str(len(profiles)) + " author profiles from " +
+                        str(sum(result["pairs"] for result in results.values())) + " pairs")
+
+    if gt_path is not None:
+        scores = evaluate_clustering(profiles, load_table(gt_path, GROUND_TRUTH_COLUMNS, file_util.cache_path,
+                                                          file_util.chunksize))
+        logger.logging.info("B-cubed f1-score is {:.4f}, pairwise f1-score is {:.4f}".format(
+            scores["bcubed_f1"], scores["pairwise_f1"]))
+    return profiles
+
+
+def run_distributed_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m AND.distributed",
+                                     description="sharded disambiguation of the whole corpus with the saved model")
+    parser.add_argument("--config", default="config.yaml", help="config file in config_files/")
+    parser.add_argument("--shards", type=int, help="number of shards, overrides distributed.n_shards")
+    parser.add_argument("--workers", type=int, help="local worker processes, overrides distributed.n_workers")
+    parser.add_argument("--log-file", default=str(logger.DEFAULT_LOG_FILE), help="file the log is written to")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    worker = commands.add_parser("worker", help="connect to a coordinator and disambiguate the shards it hands out")
+    worker.add_argument("--address", required=True, help="host:port of the coordinator")
+    worker.add_argument("--name", default="worker-" + str(os.getpid()), help="name of the worker")
+    worker.add_argument("--authkey", help="key of the coordinator, by default $" + AUTHKEY_VARIABLE +
+                                          " or distributed.authkey of the config")
+    worker.add_argument("--log-file", default=None, help="file the log of the worker is written to")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        logger.setup_logging(args.log_file, console=args.log_file is None)
+        authkey = args.authkey or os.environ.get(AUTHKEY_VARIABLE) or \
+            read_configurations(args.config).get("distributed", {}).get("authkey")
+        if not authkey:
+            parser.error("worker needs the key of the coordinator, --authkey, $" + AUTHKEY_VARIABLE +
+                         " or distributed.authkey of the config")
+        host, port = args.address.rsplit(":", 1)
+        processed = run_worker((host, int(port)), str(authkey).encode("utf-8"), args.name)
+        logger.logging.info(">>> Worker " + args.name + " processed " + str(processed) + " shards")
+        return 0
+
+    logger.setup_logging(args.log_file)
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("Start distributed disambiguation")
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("## Loading config file")
+    run_distributed(read_configurations(args.config), n_shards=args.shards, n_workers=args.workers)
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("Completed successfully")
+    logger.logging.info("##----------------------------------------")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_distributed_cli())
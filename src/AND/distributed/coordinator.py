@@ -0,0 +1,206 @@
+import os
+import sys
+import queue
+import socket
+import ipaddress
+import threading
+import traceback
+import subprocess
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Tuple
+import AND.utils.logger as logger
+
+__all__ = ['Coordinator', 'is_loopback', 'run_worker', 'start_local_workers']
+
+# environment variable that passes the authentication key to the local workers
+AUTHKEY_VARIABLE = "AND_AUTHKEY"
+
+
+def is_loopback(host: str) -> bool:
+    """
+    whether a host resolves to a loopback address, so a socket bound to it only accepts connections of this host
+    :param host: str, host name or ip address
+    :return: bool
+    """
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (socket.gaierror, ValueError):
+        return False
+
+
+class Coordinator:
+    """
+    Hands out the shard tasks to the workers that connect to its socket and collects their results.
+    Every worker gets its own thread, the protocol is a sequence of pickled messages on an authenticated
+    multiprocessing connection:
+    worker       {"type": "ready", "worker": name}
+    coordinator  {"type": "task", "task": {...}} or {"type": "stop"}
+    worker       {"type": "result", "shard": k, "result": {...}} or {"type": "error", "shard": k, "error": "..."}
+    A task whose worker fails or disconnects is handed out again until it was tried max_attempts times.
+    """
+
+    def __init__(self, tasks: List[dict], address: Tuple[str, int], authkey: bytes, max_attempts: int = 2):
+        """
+        :param tasks: List[dict], tasks with a unique key shard
+        :param address: Tuple, host and port of the socket, port 0 picks a free port
+        :param authkey: bytes, key the workers authenticate with, the messages are unpickled, so only hosts that
+                        know the key may connect
+        :param max_attempts: int, attempts per task
+        """
+        self.tasks = {task["shard"]: task for task in tasks}
+        self.max_attempts = max_attempts
+        self.pending = queue.Queue()
+        for task in tasks:
+            self.pending.put(task)
+        self.attempts = {shard: 0 for shard in self.tasks}
+        self.results = {}
+        self.errors = {}
+        self.workers = []
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        if not self.tasks:
+            self.done.set()
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self) -> None:
+        while not self.done.is_set():
+            try:
+                connection = self.listener.accept()
+            except Exception as error:
+                # closing the listener ends the loop, a failed authentication only drops that connection
+                if self.done.is_set():
+                    return
+                logger.logging.info(">>> Rejected worker connection: " + str(error))
+                continue
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+    def serve(self, connection) -> None:
+        """
+        hands out tasks to one worker until all tasks are done
+        :param connection: multiprocessing.connection.Connection
+        :return: None
+        """
+        task, worker = None, "unknown"
+        try:
+            worker = connection.recv()["worker"]
+            with self.lock:
+                self.workers.append(worker)
+            logger.logging.info(">>> Worker " + worker + " connected")
+            while not self.done.is_set():
+                try:
+                    task = self.pending.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                with self.lock:
+                    self.attempts[task["shard"]] += 1
+                connection.send({"type": "task", "task": task})
+                reply = connection.recv()
+                if reply["type"] == "result":
+                    self.finish(task["shard"], reply["result"], worker)
+                else:
+                    self.retry(task, reply["error"], worker)
+                task = None
+            connection.send({"type": "stop"})
+        except (EOFError, OSError) as error:
+            if task is not None:
+                self.retry(task, "lost connection to the worker: " + repr(error), worker)
+        finally:
+            connection.close()
+
+    def finish(self, shard: int, result: dict, worker: str) -> None:
+        with self.lock:
+            self.results[shard] = result
+            logger.logging.info(">>> Shard {} done by {}, {} of {} shards".format(
+                shard, worker, len(self.results), len(self.tasks)))
+            self.check_done()
+
+    def retry(self, task: dict, error: str, worker: str) -> None:
+        with self.lock:
+            logger.logging.warning("Shard {} failed on worker {}: {}".format(task["shard"], worker, error))
+            if self.attempts[task["shard"]] < self.max_attempts:
+                self.pending.put(task)
+            else:
+                self.errors[task["shard"]] = error
+                self.check_done()
+
+    def check_done(self) -> None:
+        if len(self.results) + len(self.errors) == len(self.tasks):
+            self.done.set()
+
+    def wait(self, processes: List[subprocess.Popen] = None) -> Dict[int, dict]:
+        """
+        waits until every task is done or failed for good
+        :param processes: List[subprocess.Popen], optional local workers, waiting stops if all of them exited
+        :return: Dict[int, dict], the results by shard
+        """
+        while not self.done.wait(0.5):
+            if processes and all(process.poll() is not None for process in processes):
+                raise RuntimeError("All local workers exited before the shards were done, see their logs")
+        if self.errors:
+            raise RuntimeError("Shards {} failed: {}".format(sorted(self.errors), self.errors))
+        return dict(self.results)
+
+    def close(self) -> None:
+        self.done.set()
+        self.listener.close()
+
+
+def start_local_workers(address: Tuple[str, int], authkey: bytes, n_workers: int,
+                        log_path: str = None) -> List[subprocess.Popen]:
+    """
+    starts workers as separate python processes on this host, each stands in for a node
+    :param address: Tuple, host and port of the coordinator
+    :param authkey: bytes
+    :param n_workers: int
+    :param log_path: str, optional directory of the worker logs
+    :return: List[subprocess.Popen]
+    """
+    source = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([source] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    env[AUTHKEY_VARIABLE] = authkey.decode("utf-8")
+    processes = []
+    for k in range(n_workers):
+        command = [sys.executable, "-m", "AND.distributed", "worker", "--address", "{}:{}".format(*address),
+                   "--name", "worker-{}".format(k)]
+        if log_path is not None:
+            command += ["--log-file", os.path.join(log_path, "worker-{}.log".format(k))]
+        processes.append(subprocess.Popen(command, env=env))
+    return processes
+
+
+def run_worker(address: Tuple[str, int], authkey: bytes, name: str) -> int:
+    """
+    connects to a coordinator and disambiguates the shards it hands out until it says stop,
+    the model artifact of a task is loaded once per worker
+    :param address: Tuple, host and port of the coordinator
+    :param authkey: bytes
+    :param name: str, name of the worker in the log of the coordinator
+    :return: int, number of processed shards
+    """
+    from AND.model.artifact import ModelArtifact
+    from AND.distributed.sharding import disambiguate_shard
+
+    artifacts = {}
+    processed = 0
+    connection = Client(address, authkey=authkey)
+    try:
+        connection.send({"type": "ready", "worker": name})
+        while True:
+            message = connection.recv()
+            if message["type"] == "stop":
+                return processed
+            task = message["task"]
+            logger.logging.info("## Disambiguating shard " + str(task["shard"]))
+            try:
+                artifact = artifacts.setdefault(task["model_path"], ModelArtifact(task["model_path"]))
+                result = disambiguate_shard(task["path"], artifact.classifier, blocking=task.get("blocking"),
+                                            n_jobs=task.get("n_jobs", 1), chunk_size=task.get("chunk_size", 1000000))
+                connection.send({"type": "result", "shard": task["shard"], "result": result})
+                processed += 1
+            except Exception:
+                connection.send({"type": "error", "shard": task["shard"], "error": traceback.format_exc()})
+    finally:
+        connection.close()
@@ -0,0 +1,218 @@
+import os
+import time
+import shutil
+import zlib
+import numpy as np
+import pandas as pd
+from typing import List, Tuple
+import AND.model.cleaning as cleaning
+import AND.utils.logger as logger
+from AND.model.blocking import BLOCKING_KEYS
+from AND.model.feature_matrix import compute_features_vectorized
+from AND.model.graph import UnionFind, create_profiles
+from AND.model.precompute import ContributionCache
+from AND.model.rf_classifier import rfClassifier
+from AND.training.data_preparation import combine_data_sets, create_contribution_pairs
+from AND.utils.data_loader import CONTRIBUTION_COLUMNS, GROUND_TRUTH_COLUMNS, iterate_json_chunks
+from AND.utils.profile_store import ProfileStore
+
+__all__ = ['shard_keys', 'assign_shards', 'partition_contributions', 'disambiguate_shard', 'merge_shard_profiles']
+
+# raw name columns the blocking keys are computed from
+KEY_COLUMNS = ["first_name", "last_name"]
+
+
+def shard_keys(blocking: dict = None) -> List[str]:
+    """
+    blocking keys the contributions are partitioned by, the key of the blocking strategy if it has one.
+    Contributions that share a key end up in the same shard, so a blocking strategy with a key creates the same
+    candidate pairs per shard as on the whole corpus. Any other strategy, or no blocking at all,
+    only pairs contributions of the same shard.
+    :param blocking: dict, optional blocking configuration
+    :return: List[str], names of BLOCKING_KEYS
+    """
+    if blocking and blocking.get("strategy") in BLOCKING_KEYS:
+        return [blocking["strategy"]]
+    return ["soundex_last_name"]
+
+
+def hash_modulo(values, n: int) -> np.ndarray:
+    """
+    crc32 of the values as strings modulo n, it does not depend on the process or the chunk
+    :param values: iterable of str or int
+    :param n: int
+    :return: np.ndarray
+    """
+    return np.array([zlib.crc32(str(value).encode("utf-8")) % n for value in values], dtype=np.int64)
+
+
+def assign_shards(df: pd.DataFrame, keys: List[str], n_shards: int) -> pd.DataFrame:
+    """
+    shards of the contributions, a contribution is sent to the shard of each of its blocking keys, the shard of a key
+    is its crc32 modulo the number of shards, so it does not depend on the chunk the contribution is read with.
+    Contributions without any key are never paired and are sent to the shard of their contribution_id
+    :param df: pd.DataFrame, raw contributions with the columns contribution_id and KEY_COLUMNS
+    :param keys: List[str], names of BLOCKING_KEYS
+    :param n_shards: int
+    :return: pd.DataFrame, with the columns contribution_id and shard, one row per contribution and shard
+    """
+    names = df[["contribution_id"] + KEY_COLUMNS].copy()
+    for col in KEY_COLUMNS:
+        names = cleaning.clean_name(names, col)
+
+    assignments = []
+    has_key = np.zeros(len(df), dtype=bool)
+    for key in keys:
+        values = BLOCKING_KEYS[key](names).replace("", np.nan)
+        valid = values.notna().values
+        has_key |= valid
+        assignments.append(pd.DataFrame({"contribution_id": df["contribution_id"].values[valid],
+                                         "shard": hash_modulo(values.values[valid], n_shards)}))
+    assignments.append(pd.DataFrame({"contribution_id": df["contribution_id"].values[~has_key],
+                                     "shard": hash_modulo(df["contribution_id"].values[~has_key], n_shards)}))
+    return pd.concat(assignments, ignore_index=True).drop_duplicates().reset_index(drop=True)
+
+
+def write_buckets(df: pd.DataFrame, path: str, name: str, n_buckets: int) -> None:
+    """
+    writes the rows of a data frame into the bucket of their contributionId, path/bucket-b/name.pkl
+    :param df: pd.DataFrame, with the column contributionId
+    :param path: str, directory of the buckets
+    :param name: str, file name of the rows in each bucket
+    :param n_buckets: int
+    :return: None
+    """
+    for bucket, part in df.groupby(hash_modulo(df["contributionId"].values, n_buckets)):
+        directory = os.path.join(path, "bucket-{}".format(bucket))
+        os.makedirs(directory, exist_ok=True)
+        part.reset_index(drop=True).to_pickle(os.path.join(directory, name + ".pkl"))
+
+
+def read_parts(path: str, prefix: str, columns: List[str]) -> pd.DataFrame:
+    """
+    concatenates the pickled parts in a directory whose file names start with prefix
+    :param path: str, directory
+    :param prefix: str
+    :param columns: List[str], columns of the empty data frame without any part
+    :return: pd.DataFrame
+    """
+    files = sorted(file for file in os.listdir(path) if file.startswith(prefix)) if os.path.exists(path) else []
+    if not files:
+        return pd.DataFrame(columns=columns)
+    return pd.concat([pd.read_pickle(os.path.join(path, file)) for file in files], ignore_index=True)
+
+
+def partition_contributions(data_path: str, gt_path: str, path: str, n_shards: int, keys: List[str],
+                            chunksize: int = 100000) -> List[dict]:
+    """
+    streams the contributions chunk wise into the directories of their shards, the chunks of a shard are pickled.
+    The ground truth has no names, it is routed to the shards with a hash join on disk: the shard assignments of
+    every chunk and the chunks of the ground truth are written into n_shards buckets by contribution id, then
+    one bucket at a time is joined and its ground truth is written to the shards. So a process holds a chunk of the
+    contributions or of the ground truth, or the assignments and ground truth of one bucket, never the whole corpus.
+    The shards of an earlier run in path are removed
+    :param data_path: str, JSON file of the contributions
+    :param gt_path: str, JSON file of the ground truth, None without ground truth
+    :param path: str, directory of the shards
+    :param n_shards: int
+    :param keys: List[str], names of BLOCKING_KEYS
+    :param chunksize: int, records per chunk of a JSON Lines file
+    :return: List[dict], the tasks of the shards that hold contributions
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    buckets = os.path.join(path, "buckets")
+    rows = {}
+    for chunk_id, chunk in enumerate(iterate_json_chunks(data_path, CONTRIBUTION_COLUMNS, chunksize)):
+        assigned = assign_shards(chunk, keys, n_shards)
+        parts = chunk.merge(assigned, on="contribution_id")
+        for shard, part in parts.groupby("shard"):
+            directory = os.path.join(path, "shard-{}".format(shard))
+            os.makedirs(directory, exist_ok=True)
+            part.drop(columns="shard").reset_index(drop=True).to_pickle(
+                os.path.join(directory, "contributions-{}.pkl".format(chunk_id)))
+            rows[shard] = rows.get(shard, 0) + len(part)
+        if gt_path is not None:
+            write_buckets(assigned.rename(columns={"contribution_id": "contributionId"}), buckets,
+                          "shards-{}".format(chunk_id), n_shards)
+    logger.logging.info(">>> Partitioned " + str(sum(rows.values())) + " contributions into " + str(len(rows)) +
+                        " shards")
+
+    if gt_path is not None and rows:
+        for chunk_id, chunk in enumerate(iterate_json_chunks(gt_path, GROUND_TRUTH_COLUMNS, chunksize)):
+            write_buckets(chunk, buckets, "ground_truth-{}".format(chunk_id), n_shards)
+        for bucket in sorted(os.listdir(buckets)):
+            directory = os.path.join(buckets, bucket)
+            shards = read_parts(directory, "shards-", ["contributionId", "shard"])
+            gt = read_parts(directory, "ground_truth-", GROUND_TRUTH_COLUMNS)
+            for shard, part in gt.merge(shards, on="contributionId").groupby("shard"):
+                part.drop(columns="shard").reset_index(drop=True).to_pickle(
+                    os.path.join(path, "shard-{}".format(shard), "ground_truth-{}.pkl".format(bucket.split("-")[1])))
+        shutil.rmtree(buckets)
+    return [dict(shard=int(shard), path=os.path.join(path, "shard-{}".format(shard)), rows=rows[shard])
+            for shard in sorted(rows)]
+
+
+def read_shard(path: str) -> pd.DataFrame:
+    """
+    contributions of a shard combined with its ground truth
+    :param path: str, directory of the shard
+    :return: pd.DataFrame
+    """
+    df = read_parts(path, "contributions-", CONTRIBUTION_COLUMNS)
+    return combine_data_sets(df, read_parts(path, "ground_truth-", GROUND_TRUTH_COLUMNS))
+
+
+def disambiguate_shard(path: str, classifier: rfClassifier, blocking: dict = None, n_jobs: int = 1,
+                       chunk_size: int = 1000000) -> dict:
+    """
+    cleans, pairs, featurizes, predicts and clusters the contributions of a shard,
+    the profiles of the shard are written as a profile store into path/profiles/
+    :param path: str, directory of the shard
+    :param classifier: rfClassifier, fitted classifier
+    :param blocking: dict, optional blocking configuration
+    :param n_jobs: int, number of worker processes of the shard
+    :param chunk_size: int, pairs per chunk of the feature computation
+    :return: dict, the profile store and the counts and seconds of the shard
+    """
+    start = time.perf_counter()
+    df = cleaning.compact_contributions(cleaning.cleaning_procedure(read_shard(path), n_jobs=n_jobs))
+    df_pairs = create_contribution_pairs(df, n=1, blocking=blocking, n_jobs=n_jobs)
+    df_pairs = compute_features_vectorized(df_pairs, ContributionCache(df), n_jobs=n_jobs, chunk_size=chunk_size,
+                                           features=classifier.features)
+    df_pairs = classifier.predict(df_pairs)
+    profiles = create_profiles(df_pairs, nodes=list(df["contribution_id"].unique()))
+    ProfileStore.write(os.path.join(path, "profiles"), profiles)
+    return dict(profiles=os.path.join(path, "profiles"), rows=len(df), pairs=len(df_pairs),
+                n_profiles=len(profiles), seconds=time.perf_counter() - start)
+
+
+def merge_shard_profiles(stores: List[ProfileStore]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    merges the profiles of the shards, the profiles of the shards are the nodes of a global union-find and
+    the profiles that share a contribution, which was sent to several shards, are merged
+    :param stores: List[ProfileStore], profiles of the shards
+    :return: Tuple[np.ndarray], the contribution ids and their profile labels
+    """
+    ids, nodes, n_nodes = [], [], 0
+    for store in stores:
+        store_ids, labels = store.labels()
+        ids.append(store_ids)
+        nodes.append(labels + n_nodes)
+        n_nodes += len(store)
+    if not ids:
+        return np.array([], dtype=object), np.array([], dtype=np.int64)
+    ids, nodes = np.concatenate(ids), np.concatenate(nodes)
+
+    codes, contribution_ids = pd.factorize(ids)
+    _, first = np.unique(codes, return_index=True)
+    first_nodes = nodes[first[codes]]
+    union_find = UnionFind()
+    for node, other in zip(nodes[nodes != first_nodes].tolist(), first_nodes[nodes != first_nodes].tolist()):
+        union_find.union(node, other)
+    roots = np.arange(n_nodes, dtype=np.int64)
+    for node in union_find.items:
+        roots[node] = union_find.items[union_find.find(node)]
+    logger.logging.info(">>> Merged " + str(n_nodes) + " shard profiles into " +
+                        str(len(np.unique(roots[nodes]))) + " profiles")
+    return np.asarray(contribution_ids, dtype=object), roots[nodes[first]]
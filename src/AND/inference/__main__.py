@@ -0,0 +1,27 @@
+import AND.utils.logger as logger
+from AND.utils.helpers import read_configurations
+from AND.utils.file import FileUtil
+from AND.model.artifact import ModelArtifact
+from AND.inference.server import serve
+
+
+def run_inference_server():
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("Start inference server")
+    logger.logging.info("##----------------------------------------")
+
+    logger.logging.info("## Loading config file")
+    config = read_configurations()
+    file_util = FileUtil(config)
+    inference = config.get("inference", {})
+
+    logger.logging.info("## Loading model artifact")
+    artifact = ModelArtifact(file_util.model_path,
+                             n_jobs=inference.get("n_jobs", 1),
+                             batch_size=inference.get("batch_size", 100000))
+    serve(artifact, host=inference.get("host", "127.0.0.1"), port=inference.get("port", 8765))
+
+
+if __name__ == "__main__":
+    logger.setup_logging()
+    run_inference_server()
@@ -0,0 +1,95 @@
+import json
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+import AND.utils.logger as logger
+from AND.model.artifact import ModelArtifact
+
+__all__ = ['create_server', 'serve']
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints of the inference server
+    GET  /health   meta data of the loaded model
+    POST /predict  {"features": [[...], ...]} rows in the order of the model features
+                   or {"pairs": [{"<feature>": value, ...}, ...]},
+                   answers {"prediction": [...], "probability": [...]}
+    """
+    artifact = None
+
+    def send_json(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, dict(error="Unknown path " + self.path))
+            return
+        self.send_json(200, dict(status="ok", model=self.artifact.meta))
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.send_json(404, dict(error="Unknown path " + self.path))
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            predictions, probabilities = self.artifact.predict_pairs(request_matrix(request, self.artifact.features))
+        except (ValueError, KeyError, TypeError) as error:
+            self.send_json(400, dict(error=str(error)))
+            return
+        self.send_json(200, dict(prediction=predictions.tolist(), probability=probabilities.tolist()))
+
+    def log_message(self, format, *args):
+        logger.logging.debug(format % args)
+
+
+def request_matrix(request: dict, features: list) -> np.ndarray:
+    """
+    feature matrix of a prediction request
+    :param request: dict, with the key features or pairs
+    :param features: list, feature names of the model
+    :return: np.ndarray
+    """
+    if "features" in request:
+        return np.array(request["features"], dtype=np.float32).reshape(-1, len(features))
+    if "pairs" in request:
+        return np.array([[pair[name] for name in features] for pair in request["pairs"]],
+                        dtype=np.float32).reshape(-1, len(features))
+    raise KeyError("The request needs the key features or pairs")
+
+
+def create_server(artifact: ModelArtifact, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """
+    creates the inference server, the model is loaded before the server accepts requests
+    :param artifact: ModelArtifact
+    :param host: str
+    :param port: int, 0 picks a free port
+    :return: ThreadingHTTPServer
+    """
+    artifact.load()
+    handler = type("ArtifactInferenceHandler", (InferenceHandler,), dict(artifact=artifact))
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(artifact: ModelArtifact, host: str = "127.0.0.1", port: int = 8765) -> Tuple[str, int]:
+    """
+    serves predictions of the artifact until the process is interrupted
+    :param artifact: ModelArtifact
+    :param host: str
+    :param port: int
+    :return: Tuple, the address the server listened on
+    """
+    server = create_server(artifact, host, port)
+    logger.logging.info(">>> Serving predictions on http://{}:{}".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return server.server_address[:2]
@@ -0,0 +1,152 @@
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Union
+import AND.utils.logger as logger
+from AND.model.cleaning import CLEANING_VERSION
+from AND.model.rf_classifier import rfClassifier
+
+__all__ = ['ARTIFACT_VERSION', 'ModelArtifact', 'save_model']
+
+# version of the layout of the artifact file
+ARTIFACT_VERSION = 1
+
+
+def save_model(classifier: rfClassifier, path: str) -> dict:
+    """
+    saves a fitted classifier as a versioned artifact together with the feature list and the cleaning version,
+    the file is written to a temporary file first and then renamed so readers never see a partial artifact
+    :param classifier: rfClassifier, fitted classifier
+    :param path: str, file of the artifact
+    :return: dict, meta data of the artifact
+    """
+    if classifier.clf is None:
+        raise ValueError("The classifier has to be fitted before it can be saved")
+    import sklearn
+    meta = dict(artifact_version=ARTIFACT_VERSION,
+                cleaning_version=CLEANING_VERSION,
+                sklearn_version=sklearn.__version__,
+                created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                features=list(classifier.features),
+                col_label=classifier.col_label,
+                max_depth=classifier.max_depth,
+                n_estimators=classifier.n_estimators,
+                n_folds=classifier.n_folds)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as handle:
+        pickle.dump(dict(meta=meta, clf=classifier.clf), handle, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    logger.logging.info(">>> Saved model artifact to " + path)
+    return meta
+
+
+class ModelArtifact:
+    """
+    A model artifact written by save_model. The file is only read on first use, loading checks that the
+    artifact was written with the current artifact layout and cleaning rules.
+    predict_pairs scores feature matrices in chunks with a thread pool, the trees of the forest are
+    evaluated without holding the GIL, so the threads share one copy of the model.
+    """
+
+    def __init__(self, path: str, n_jobs: int = 1, batch_size: int = 100000):
+        """
+        :param path: str, file of the artifact
+        :param n_jobs: int, number of threads that score the chunks
+        :param batch_size: int, number of pairs per chunk
+        """
+        self.path = path
+        self.n_jobs = n_jobs
+        self.batch_size = batch_size
+        self._meta = None
+        self._classifier = None
+
+    def load(self) -> rfClassifier:
+        """
+        reads the artifact
+        :return: rfClassifier
+        """
+        with open(self.path, "rb") as handle:
+            artifact = pickle.load(handle)
+        meta = artifact["meta"]
+        if meta["artifact_version"] != ARTIFACT_VERSION:
+            raise ValueError("Model artifact {} has version {}, expected version {}".format(
+                self.path, meta["artifact_version"], ARTIFACT_VERSION))
+        if meta["cleaning_version"] != CLEANING_VERSION:
+            raise ValueError("Model artifact {} was trained on data of cleaning version {}, "
+                             "the current cleaning version is {}".format(self.path, meta["cleaning_version"],
+                                                                        CLEANING_VERSION))
+        classifier = rfClassifier(dict(max_depth=meta["max_depth"],
+                                       n_estimators=meta["n_estimators"],
+                                       n_folds=meta["n_folds"],
+                                       features=meta["features"],
+                                       col_label=meta["col_label"]))
+        classifier.clf = artifact["clf"]
+        classifier.importances = artifact["clf"].feature_importances_
+        self._meta, self._classifier = meta, classifier
+        logger.logging.info(">>> Loaded model artifact " + self.path + " created " + meta["created"])
+        return classifier
+
+    @property
+    def classifier(self) -> rfClassifier:
+        if self._classifier is None:
+            self.load()
+        return self._classifier
+
+    @property
+    def meta(self) -> dict:
+        if self._meta is None:
+            self.load()
+        return self._meta
+
+    @property
+    def features(self) -> list:
+        return self.meta["features"]
+
+    def is_compatible(self, config: dict) -> bool:
+        """
+        whether the artifact exists, can be loaded and was trained with the features and the forest parameters
+        of the configuration and the current cleaning rules
+        :param config: dict, the rfClassifier section of the configuration
+        :return: bool
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            meta = self.meta
+        except (ValueError, pickle.UnpicklingError, EOFError) as error:
+            logger.logging.info(">>> Model artifact " + self.path + " can not be loaded: " + str(error))
+            return False
+        expected = dict(features=list(config["features"]), max_depth=config["max_depth"],
+                        n_estimators=config["n_estimators"], cleaning_version=CLEANING_VERSION)
+        changed = [name for name, value in expected.items() if meta.get(name) != value]
+        if changed:
+            logger.logging.info(">>> Model artifact " + self.path + " differs in " + ", ".join(changed))
+        return not changed
+
+    def predict_pairs(self, X: Union[np.ndarray, pd.DataFrame]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        predicted labels and probabilities of the positive class of a feature matrix
+        :param X: np.ndarray with the columns in the order of the features of the artifact,
+                  or pd.DataFrame with the feature columns
+        :return: Tuple[np.ndarray], labels and probabilities
+        """
+        classifier = self.classifier
+        if isinstance(X, pd.DataFrame):
+            X = X[classifier.features].values
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(classifier.features):
+            raise ValueError("Expected a feature matrix with {} columns".format(len(classifier.features)))
+        if len(X) <= self.batch_size or self.n_jobs == 1:
+            chunks = [classifier.predict_scores(X[start:start + self.batch_size])
+                      for start in range(0, len(X), self.batch_size)]
+        else:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                chunks = list(executor.map(classifier.predict_scores,
+                                           [X[start:start + self.batch_size]
+                                            for start in range(0, len(X), self.batch_size)]))
+        if not chunks:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
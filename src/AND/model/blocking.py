@@ -0,0 +1,233 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Tuple
+from AND.model.precompute import soundex_codes
+from AND.model.similarity import NameIndex, name_ngrams
+
+__all__ = ['BLOCKING_STRATEGIES', 'BLOCKING_KEYS', 'create_candidate_pairs', 'blocking_recall']
+
+
+def text_column(df: pd.DataFrame, col: str) -> pd.Series:
+    """
+    a cleaned string column with missing values as empty strings, dictionary encoded columns are decoded
+    :param df: pd.DataFrame, cleaned contributions
+    :param col: str
+    :return: pd.Series
+    """
+    return df[col].astype(object).fillna("")
+
+
+def pairs_from_keys(keys: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    creates all pairs of rows that share the same blocking key, rows with an empty key are not paired
+    :param keys: pd.Series, one blocking key per contribution
+    :return: Tuple[np.ndarray], positional indices (left, right) with left < right
+    """
+    codes, _ = pd.factorize(keys.replace("", np.nan))
+    valid = np.flatnonzero(codes >= 0)
+    order = valid[np.argsort(codes[valid], kind="stable")]
+    sorted_codes = codes[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else np.array([], dtype=int)
+    sizes = np.diff(np.r_[starts, len(order)])
+
+    left = [np.array([], dtype=np.int64)]
+    right = [np.array([], dtype=np.int64)]
+    for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+        block = order[start:start + size]
+        i, j = np.triu_indices(size, k=1)
+        left.append(block[i])
+        right.append(block[j])
+    return np.concatenate(left).astype(np.int64), np.concatenate(right).astype(np.int64)
+
+
+def unique_pairs(left: np.ndarray, right: np.ndarray, n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    orders each pair such that left < right, removes self pairs and duplicates
+    :param left: np.ndarray
+    :param right: np.ndarray
+    :param n_rows: int, number of contributions
+    :return: Tuple[np.ndarray], sorted by (left, right)
+    """
+    lo = np.minimum(left, right).astype(np.int64)
+    hi = np.maximum(left, right).astype(np.int64)
+    keys = np.unique(lo[lo != hi] * n_rows + hi[lo != hi])
+    return keys // n_rows, keys % n_rows
+
+
+def soundex_last_name_keys(df: pd.DataFrame) -> pd.Series:
+    """
+    blocking keys from the soundex code of the cleaned last name
+    :param df: pd.DataFrame, cleaned contributions
+    :return: pd.Series, missing keys are NaN
+    """
+    codes = soundex_codes(df["last_name_cleaned"].values)
+    return pd.Series(codes, index=df.index).where(codes >= 0)
+
+
+def first_initial_last_name_keys(df: pd.DataFrame) -> pd.Series:
+    """
+    blocking keys from the first initial of the first name combined with the cleaned last name
+    :param df: pd.DataFrame, cleaned contributions
+    :return: pd.Series, missing keys are empty strings
+    """
+    last_names = text_column(df, "last_name_cleaned")
+    initials = text_column(df, "first_name_cleaned").str[:1]
+    return (initials + " " + last_names).where(last_names != "", "")
+
+
+def soundex_last_name(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    blocks contributions by the soundex code of the cleaned last name
+    :param df: pd.DataFrame, cleaned contributions
+    :return: Tuple[np.ndarray]
+    """
+    return pairs_from_keys(soundex_last_name_keys(df).reset_index(drop=True))
+
+
+def first_initial_last_name(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    blocks contributions by the first initial of the first name combined with the cleaned last name
+    :param df: pd.DataFrame, cleaned contributions
+    :return: Tuple[np.ndarray]
+    """
+    return pairs_from_keys(first_initial_last_name_keys(df).reset_index(drop=True))
+
+
+def sorted_neighbourhood(df: pd.DataFrame, window: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    sorts the contributions by last name and first name and pairs every contribution
+    with the window - 1 contributions that follow it in the sort order
+    :param df: pd.DataFrame, cleaned contributions
+    :param window: int, size of the sliding window
+    :return: Tuple[np.ndarray]
+    """
+    keys = (text_column(df, "last_name_cleaned") + " " + text_column(df, "first_name_cleaned")).values
+    order = np.argsort(keys, kind="stable")
+    left = [order[:-offset] for offset in range(1, window) if offset < len(order)]
+    right = [order[offset:] for offset in range(1, window) if offset < len(order)]
+    if not left:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return unique_pairs(np.concatenate(left), np.concatenate(right), len(order))
+
+
+def lsh_name_ngrams(df: pd.DataFrame, col: str = "full_name_cleaned", ngram: int = 3, bands: int = 8,
+                    rows: int = 2, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    MinHash locality sensitive hashing over the character n-grams of the names,
+    contributions are paired if their signatures collide in at least one band
+    :param df: pd.DataFrame, cleaned contributions
+    :param col: str, name column that is hashed
+    :param ngram: int, length of the character n-grams
+    :param bands: int, number of LSH bands
+    :param rows: int, number of MinHash values per band
+    :param seed: int, seed of the hash functions
+    :return: Tuple[np.ndarray]
+    """
+    prime = np.int64(2 ** 31 - 1)
+    random_state = np.random.RandomState(seed)
+    a = random_state.randint(1, prime, size=(bands * rows, 1)).astype(np.int64)
+    b = random_state.randint(0, prime, size=(bands * rows, 1)).astype(np.int64)
+
+    grams = [name_ngrams(s, ngram) for s in text_column(df, col).values]
+    lengths = np.array([len(g) for g in grams])
+    owners = np.flatnonzero(lengths > 0)
+    if len(owners) < 2:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    hashes = np.fromiter((h for g in grams for h in g), dtype=np.int64, count=int(lengths.sum())) % prime
+    offsets = np.r_[0, np.cumsum(lengths[owners])[:-1]]
+    signatures = np.minimum.reduceat((a * hashes + b) % prime, offsets, axis=1).T
+
+    left, right = [], []
+    for band in range(bands):
+        _, codes = np.unique(signatures[:, band * rows:(band + 1) * rows], axis=0, return_inverse=True)
+        band_left, band_right = pairs_from_keys(pd.Series(codes.ravel()))
+        left.append(owners[band_left])
+        right.append(owners[band_right])
+    return unique_pairs(np.concatenate(left), np.concatenate(right), len(df))
+
+
+def linked_value_pairs(codes: np.ndarray, first: np.ndarray, second: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    pairs all contributions of value first[k] with all contributions of value second[k]
+    :param codes: np.ndarray, value id of every contribution, -1 for missing values
+    :param first: np.ndarray, value ids of the linked values
+    :param second: np.ndarray, value ids of the linked values
+    :return: Tuple[np.ndarray], positional indices (left, right)
+    """
+    valid = np.flatnonzero(codes >= 0)
+    members = valid[np.argsort(codes[valid], kind="stable")]
+    counts = np.bincount(codes[valid], minlength=max(codes.max(initial=-1) + 1, 0)).astype(np.int64)
+    starts = np.cumsum(counts) - counts
+
+    sizes = counts[first] * counts[second]
+    links = np.repeat(np.arange(len(first), dtype=np.int64), sizes)
+    combination = np.arange(sizes.sum(), dtype=np.int64) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    i, j = np.divmod(combination, counts[second][links])
+    return members[starts[first][links] + i], members[starts[second][links] + j]
+
+
+def ngram_top_k(df: pd.DataFrame, col: str = "full_name_cleaned", k: int = 10, ngram: int = 3,
+                min_similarity: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    pairs the contributions of every distinct name with the contributions of its k nearest names
+    in a character n-gram index of the distinct names
+    :param df: pd.DataFrame, cleaned contributions
+    :param col: str, name column that is indexed
+    :param k: int, number of nearest names, the name itself included
+    :param ngram: int, length of the character n-grams
+    :param min_similarity: float, minimum cosine similarity of the n-gram vectors of linked names
+    :return: Tuple[np.ndarray]
+    """
+    codes, names = pd.factorize(text_column(df, col).replace("", np.nan).values)
+    first, second, _ = NameIndex(list(names), ngram=ngram).top_k(k=k, min_similarity=min_similarity)
+    left, right = linked_value_pairs(codes, first, second)
+    return unique_pairs(left, right, len(df))
+
+
+BLOCKING_KEYS: Dict[str, Callable] = {
+    "soundex_last_name": soundex_last_name_keys,
+    "first_initial_last_name": first_initial_last_name_keys,
+}
+
+BLOCKING_STRATEGIES: Dict[str, Callable] = {
+    "soundex_last_name": soundex_last_name,
+    "first_initial_last_name": first_initial_last_name,
+    "sorted_neighbourhood": sorted_neighbourhood,
+    "lsh_name_ngrams": lsh_name_ngrams,
+    "ngram_top_k": ngram_top_k,
+}
+
+
+def create_candidate_pairs(df: pd.DataFrame, strategy: str, **params) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    creates the candidate pairs of contributions whose blocking keys collide
+    :param df: pd.DataFrame, cleaned contributions
+    :param strategy: str, one of BLOCKING_STRATEGIES
+    :param params: additional parameters of the blocking strategy
+    :return: Tuple[np.ndarray], positional indices (left, right) with left < right, sorted by (left, right)
+    """
+    if strategy not in BLOCKING_STRATEGIES:
+        raise ValueError("Unknown blocking strategy '{}', choose one of {}".format(
+            strategy, ", ".join(BLOCKING_STRATEGIES)))
+    left, right = BLOCKING_STRATEGIES[strategy](df, **params)
+    return unique_pairs(left, right, len(df))
+
+
+def blocking_recall(df: pd.DataFrame, left: np.ndarray, right: np.ndarray, col: str = "personId") -> float:
+    """
+    fraction of the true matching pairs (same person, left < right) that are candidate pairs
+    :param df: pd.DataFrame, contributions with ground truth
+    :param left: np.ndarray, positional indices of the candidate pairs
+    :param right: np.ndarray, positional indices of the candidate pairs
+    :param col: str, ground truth column
+    :return: float
+    """
+    sizes = df[col].value_counts().values.astype(np.int64)
+    n_true_pairs = int((sizes * (sizes - 1) // 2).sum())
+    if n_true_pairs == 0:
+        return 1.0
+    persons = df[col].values
+    n_found = int((persons[left] == persons[right]).sum())
+    return n_found / n_true_pairs
@@ -1,85 +1,208 @@
+import numpy as np
 import pandas as pd
 import re
-from typing import List
+from typing import Callable, List
+from AND.utils.parallel import run_in_pool
 
-__all__ = ['cleaning_procedure']
+__all__ = ['cleaning_procedure', 'compact_contributions', 'CLEANING_VERSION']
 
+# version of the cleaning rules, increase it whenever the cleaned values change,
+# model artifacts record it because a model only fits data cleaned with the same rules
+CLEANING_VERSION = 2
 
-def clean_name(df: pd.DataFrame, col: str) -> pd.DataFrame:
+NAME_COLUMNS = ["full_name",
+                "middle_name",
+                "last_name",
+                "first_name",
+                "workplace"]
+
+LIST_COLUMNS = ["focus_areas",
+                "gpes",
+                "orgs"]
+
+# columns of the cleaned contributions that are dictionary encoded by compact_contributions
+CATEGORICAL_COLUMNS = ["contribution_id", "personId"] + [col + "_cleaned" for col in NAME_COLUMNS]
+
+# names: drop dots and replace hyphens by a space
+NAME_TABLE = str.maketrans({".": None, "-": " "})
+# list entries: replace punctuation and brackets by a space
+LIST_TABLE = str.maketrans({c: " " for c in "./-,;:[]()"})
+MULTIPLE_SPACES = re.compile(" +")
+
+
+def normalize_name(s: str) -> str:
     """
-    cleans a column of type str
-    :param df: pd.DataFrame
-    :param col: str, name of the column
-    :return: pd.DataFrame
+    cleaned value of a name, non strings become NaN like with the pandas str accessor
+    :param s: str
+    :return: str
     """
-    df[col + "_cleaned"] = df[col].str.replace(".", "", regex=True)
-    df[col + "_cleaned"] = df[col + "_cleaned"].str.replace("-", " ", regex=True)
-    df[col + "_cleaned"] = df[col + "_cleaned"].str.lower()
-    df[col + "_cleaned"] = df[col + "_cleaned"].str.replace(' +', ' ', regex=True)
-    return df
+    if not isinstance(s, str):
+        return np.nan
+    return MULTIPLE_SPACES.sub(" ", s.translate(NAME_TABLE).lower())
+
+
+def normalize_list_entry(s: str) -> str:
+    """
+    cleaned value of an entry of a list of strings
+    :param s: str
+    :return: str
+    """
+    return MULTIPLE_SPACES.sub(" ", s.lower().translate(LIST_TABLE))
+
+
+def normalize_values(normalize: Callable[[str], str], values: List[str]) -> List[str]:
+    """
+    normalizes a list of distinct values, module level so it can run in a worker process
+    :param normalize: Callable, normalize_name or normalize_list_entry
+    :param values: List[str]
+    :return: List[str]
+    """
+    return [normalize(s) for s in values]
 
 
 def clean_list_of_strings(l: List[str]) -> List[str]:
     """
     cleans a list of strings
     :param l: List[str]
-    :return: List[str]
+    :return: List[str], a new list, l is not modified
     """
     if l:
-        for k, s in enumerate(l):
-            s = s.lower()
-            s = s.replace('.', ' ')
-            s = s.replace('/', ' ')
-            s = s.replace('-', ' ')
-            s = s.replace(',', ' ')
-            s = s.replace(';', ' ')
-            s = s.replace(':', ' ')
-            s = s.replace('[', ' ')
-            s = s.replace(']', ' ')
-            s = s.replace('(', ' ')
-            s = s.replace(')', ' ')
-            s = re.sub(' +', ' ', s)
-            l[k] = s
-        return l
+        return [normalize_list_entry(s) for s in l]
     else:
         return []
 
 
+def name_uniques(values: np.ndarray):
+    """
+    distinct values of a column of type str
+    :param values: np.ndarray
+    :return: Tuple, codes of the values (-1 for missing values) and the distinct values
+    """
+    codes, uniques = pd.factorize(values)
+    return codes, list(uniques)
+
+
+def list_uniques(values: np.ndarray):
+    """
+    distinct strings of a column of type List[str], entries that are not strings, e.g. None, are dropped from
+    the lists, otherwise their code -1 would pick the last distinct string in rebuild_lists
+    :param values: np.ndarray, lists of strings
+    :return: Tuple, codes of the flattened strings, the list lengths and the distinct strings
+    """
+    lists = [[s for s in l if isinstance(s, str)] if l else [] for l in values]
+    lengths = np.array([len(l) for l in lists], dtype=np.int64)
+    codes, uniques = pd.factorize(pd.Series([s for l in lists for s in l], dtype=object))
+    return codes, lengths, list(uniques)
+
+
+def rebuild_names(values: np.ndarray, codes: np.ndarray, cleaned: List[str]) -> np.ndarray:
+    """
+    cleaned column of type str from the cleaned distinct values, missing values are kept as they are
+    :param values: np.ndarray, raw column
+    :param codes: np.ndarray
+    :param cleaned: List[str], cleaned distinct values
+    :return: np.ndarray
+    """
+    result = np.empty(len(cleaned) + 1, dtype=object)
+    result[:-1] = cleaned
+    result = result.take(codes)
+    missing = codes == -1
+    result[missing] = values[missing]
+    return result
+
+
+def rebuild_lists(codes: np.ndarray, lengths: np.ndarray, cleaned: List[str]) -> List[List[str]]:
+    """
+    cleaned column of type List[str] from the cleaned distinct strings, every row gets a new list
+    :param codes: np.ndarray, codes of the flattened strings
+    :param lengths: np.ndarray, number of strings per row
+    :param cleaned: List[str], cleaned distinct strings
+    :return: List[List[str]]
+    """
+    flat = [cleaned[code] for code in codes]
+    offsets = np.r_[0, np.cumsum(lengths)]
+    return [flat[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+def clean_name(df: pd.DataFrame, col: str) -> pd.DataFrame:
+    """
+    cleans a column of type str, every distinct value is cleaned once
+    :param df: pd.DataFrame
+    :param col: str, name of the column
+    :return: pd.DataFrame
+    """
+    values = df[col].values
+    codes, uniques = name_uniques(values)
+    df[col + "_cleaned"] = rebuild_names(values, codes, normalize_values(normalize_name, uniques))
+    return df
+
+
 def clean_str_list(df: pd.DataFrame, col: str) -> pd.DataFrame:
     """
-    cleans a column of type List[str]
+    cleans a column of type List[str], every distinct string is cleaned once
     :param df: pd.DataFrame
     :param col: str, name of the column
     :return: pd.DataFrame
     """
-    df[col + "_cleaned"] = df[col].apply(clean_list_of_strings)
+    codes, lengths, uniques = list_uniques(df[col].values)
+    df[col + "_cleaned"] = rebuild_lists(codes, lengths, normalize_values(normalize_list_entry, uniques))
     return df
 
 
-def cleaning_procedure(df: pd.DataFrame) -> pd.DataFrame:
+def cleaning_procedure(df: pd.DataFrame, n_jobs: int = 1) -> pd.DataFrame:
     """
-    cleans multiple columns of the data set
+    cleans multiple columns of the data set, the raw columns are dropped
     :param df: pd.DataFrame
+    :param n_jobs: int, number of worker processes that clean the distinct values of the columns
     :return: pd.DataFrame
     """
-    df = clean_name(df, col="full_name")
-    df = clean_name(df, col="middle_name")
-    df = clean_name(df, col="last_name")
-    df = clean_name(df, col="first_name")
-    df = clean_name(df, col="workplace")
+    if n_jobs == 1:
+        for col in NAME_COLUMNS:
+            df = clean_name(df, col=col)
+        for col in LIST_COLUMNS:
+            df = clean_str_list(df, col=col)
+    else:
+        # only the distinct values are sent to the workers
+        names = {col: name_uniques(df[col].values) for col in NAME_COLUMNS}
+        lists = {col: list_uniques(df[col].values) for col in LIST_COLUMNS}
+        tasks = [(normalize_name, names[col][1]) for col in NAME_COLUMNS] + \
+                [(normalize_list_entry, lists[col][2]) for col in LIST_COLUMNS]
+        cleaned = run_in_pool(normalize_values, tasks, n_jobs)
+        for col, values in zip(NAME_COLUMNS, cleaned):
+            df[col + "_cleaned"] = rebuild_names(df[col].values, names[col][0], values)
+        for col, values in zip(LIST_COLUMNS, cleaned[len(NAME_COLUMNS):]):
+            df[col + "_cleaned"] = rebuild_lists(lists[col][0], lists[col][1], values)
 
-    df = clean_str_list(df, col="focus_areas")
-    df = clean_str_list(df, col="gpes")
-    df = clean_str_list(df, col="orgs")
+    df = df.drop(NAME_COLUMNS + LIST_COLUMNS, axis=1)
+    return df
 
-    droplist = ["full_name",
-                "middle_name",
-                "last_name",
-                "first_name",
-                "workplace",
-                "focus_areas",
-                "gpes",
-                "orgs"]
 
-    df = df.drop(droplist, axis=1)
+def location_array(locations: List[List[float]]) -> np.ndarray:
+    """
+    work locations of a contribution as one float64 array of shape (k, 2)
+    :param locations: List[List[float]], (lat, lon) coordinates
+    :return: np.ndarray
+    """
+    if not isinstance(locations, (list, np.ndarray)) or len(locations) == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    return np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+
+
+def compact_contributions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    compact representation of the cleaned contributions, the ids and the cleaned names are dictionary encoded
+    as categoricals so every distinct string is stored once and pairs gather integer codes instead of objects,
+    the work locations are stored as one float64 array per contribution instead of nested lists of floats,
+    the lists of strings keep the interned strings of the cleaning
+    :param df: pd.DataFrame, cleaned contributions, see cleaning_procedure
+    :return: pd.DataFrame
+    """
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    if "workplace_locations" in df.columns:
+        locations = np.empty(len(df), dtype=object)
+        locations[:] = [location_array(l) for l in df["workplace_locations"].values]
+        df["workplace_locations"] = locations
     return df
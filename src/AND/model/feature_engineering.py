@@ -1,5 +1,4 @@
 import pandas as pd
-import mpu
 import numpy as np
 import jellyfish
 from typing import List, Tuple
@@ -71,6 +70,7 @@ def haversine_distance_work_locations(l1: List[List[float]], l2: List[List[float
     if len(l1) == 0 or len(l2) == 0:
         return 99999,99999,99999
     else:
+        import mpu
         distances = []
         for t1 in l1:
             for t2 in l2:
@@ -92,13 +92,34 @@ def distance_average_work_locations(df: pd.DataFrame, col1: str, col2: str, feat
     return df
 
 
-def compute_features(df: pd.DataFrame) -> pd.DataFrame:
+def gather_pair_columns(df: pd.DataFrame, contributions: pd.DataFrame, col: str) -> pd.DataFrame:
+    """
+    gathers a column of the contributions for both contributions of every pair
+    :param df: pd.DataFrame, dataset with the positional indices (left, right) of the pairwise contributions
+    :param contributions: pd.DataFrame, the contributions the indices refer to
+    :param col: str, column name of the contributions
+    :return: pd.DataFrame, with the columns col and col + "_2nd"
+    """
+    values = contributions[col].values
+    return pd.DataFrame({col: values.take(df["left"].values),
+                         col + "_2nd": values.take(df["right"].values)},
+                        index=df.index)
+
+
+def compute_features(df: pd.DataFrame, contributions: pd.DataFrame = None) -> pd.DataFrame:
     """
     compute multiple features for the similarity classification task
-    :param df:
+    :param df: pd.DataFrame, dataset with pairwise contributions
+    :param contributions: pd.DataFrame, optional, if given df holds the positional indices (left, right)
+    of the pairs in contributions and the columns are gathered on demand
     :return: pd.DataFrame
     """
 
+    def pair_columns(col: str) -> pd.DataFrame:
+        if contributions is None:
+            return df
+        return gather_pair_columns(df, contributions, col)
+
     columns = ['first_name_cleaned',
                'middle_name_cleaned',
                'last_name_cleaned',
@@ -107,33 +128,33 @@ def compute_features(df: pd.DataFrame) -> pd.DataFrame:
 
     logger.logging.info(">>> Computing exact matches")
     for col in columns:
-        df = exact_match(df, col1=col, col2=col + "_2nd", feature_name="exact_match_" + col)
+        feature_name = "exact_match_" + col
+        df[feature_name] = exact_match(pair_columns(col), col1=col, col2=col + "_2nd",
+                                       feature_name=feature_name)[feature_name]
 
     logger.logging.info(">>> Computing soundex exact matches")
     columns.remove("full_name_cleaned")
 
     for col in columns:
-        df = soundex(df, col1=col, col2=col + "_2nd", feature_name="soundex_" + col)
+        feature_name = "soundex_" + col
+        df[feature_name] = soundex(pair_columns(col), col1=col, col2=col + "_2nd",
+                                   feature_name=feature_name)[feature_name]
 
     logger.logging.info(">>> Computing number of shared words")
-    df = number_shared_in_list(df,
-                               col1="focus_areas_cleaned",
-                               col2="focus_areas_cleaned_2nd",
-                               feature_name="no_shared_focus_area")
-    df = number_shared_in_list(df,
-                               col1="gpes_cleaned",
-                               col2="gpes_cleaned_2nd",
-                               feature_name="no_shared_gpes")
-    df = number_shared_in_list(df,
-                               col1="orgs_cleaned",
-                               col2="orgs_cleaned_2nd",
-                               feature_name="no_shared_orgs")
+    shared_words = {"focus_areas_cleaned": "no_shared_focus_area",
+                    "gpes_cleaned": "no_shared_gpes",
+                    "orgs_cleaned": "no_shared_orgs"}
+    for col, feature_name in shared_words.items():
+        df[feature_name] = number_shared_in_list(pair_columns(col),
+                                                 col1=col,
+                                                 col2=col + "_2nd",
+                                                 feature_name=feature_name)[feature_name]
 
     logger.logging.info(">>> Computing distances between work locations")
     dist_features = ["min_distance_km", "max_distance_km", "mean_distance_km"]
-    df = distance_average_work_locations(df,
-                                         col1="workplace_locations",
-                                         col2="workplace_locations_2nd",
-                                         feature_names=dist_features)
+    df[dist_features] = distance_average_work_locations(pair_columns("workplace_locations"),
+                                                        col1="workplace_locations",
+                                                        col2="workplace_locations_2nd",
+                                                        feature_names=dist_features)[dist_features]
 
     return df
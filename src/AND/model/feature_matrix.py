@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+from typing import List, Tuple
+import AND.utils.logger as logger
+import AND.utils.profiling as profiling
+from AND.model.precompute import ContributionCache
+from AND.model.haversine import LocationDistanceMemo, distance_features
+from AND.model.similarity import SIMILARITY_FUNCTIONS, SimilarityMemo, pair_similarities
+from AND.utils.parallel import SharedArrays, attach_shared_arrays, release_shared_arrays, run_in_pool, split_range
+
+__all__ = ['FEATURE_NAMES', 'SIMILARITY_FEATURES', 'stored_features', 'compute_feature_matrix',
+           'compute_features_vectorized']
+
+EXACT_MATCH_COLUMNS = ['first_name_cleaned',
+                       'middle_name_cleaned',
+                       'last_name_cleaned',
+                       'full_name_cleaned',
+                       'workplace_cleaned']
+
+SOUNDEX_COLUMNS = ['first_name_cleaned',
+                   'middle_name_cleaned',
+                   'last_name_cleaned',
+                   'workplace_cleaned']
+
+SHARED_WORDS_COLUMNS = {'focus_areas_cleaned': 'no_shared_focus_area',
+                        'gpes_cleaned': 'no_shared_gpes',
+                        'orgs_cleaned': 'no_shared_orgs'}
+
+DISTANCE_FEATURES = ['min_distance_km', 'max_distance_km', 'mean_distance_km']
+
+# string similarities of the distinct values, computed only for the features a model uses
+SIMILARITY_COLUMNS = {'jaro_winkler': ['first_name_cleaned',
+                                       'last_name_cleaned',
+                                       'full_name_cleaned',
+                                       'workplace_cleaned'],
+                      'levenshtein': ['full_name_cleaned',
+                                      'workplace_cleaned']}
+
+SIMILARITY_FEATURES = [function + "_" + col for function, columns in SIMILARITY_COLUMNS.items() for col in columns]
+
+FEATURE_NAMES = (["exact_match_" + col for col in EXACT_MATCH_COLUMNS] +
+                 ["soundex_" + col for col in SOUNDEX_COLUMNS] +
+                 list(SHARED_WORDS_COLUMNS.values()) +
+                 DISTANCE_FEATURES +
+                 SIMILARITY_FEATURES)
+
+
+def stored_features(features: List[str] = None) -> List[str]:
+    """
+    columns of the feature matrix that are kept in data frames, feature stores and checkpoints,
+    the similarity features that are not needed are all NaN and are dropped
+    :param features: List[str], optional features that are needed, by default all features are kept
+    :return: List[str], in the order of FEATURE_NAMES
+    """
+    return [name for name in FEATURE_NAMES if features is None or name not in SIMILARITY_FEATURES or name in features]
+
+
+def ragged_positions(offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    positions of the elements of the given rows in a flat ragged array
+    :param offsets: np.ndarray, offsets of the ragged array
+    :param rows: np.ndarray, rows that are gathered
+    :return: Tuple[np.ndarray], flat positions and the index into rows each position belongs to
+    """
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows), dtype=np.int64), lengths)
+    positions = np.arange(lengths.sum(), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return positions + starts[owners], owners
+
+
+def count_shared_tokens(ids: np.ndarray, offsets: np.ndarray, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    number of tokens shared by the contributions of every pair
+    :param ids: np.ndarray, flat token ids, unique per contribution
+    :param offsets: np.ndarray, offsets of the token ids
+    :param left: np.ndarray, positional indices of the pairs
+    :param right: np.ndarray, positional indices of the pairs
+    :return: np.ndarray
+    """
+    n_tokens = ids.max(initial=0) + 1
+    left_positions, left_owners = ragged_positions(offsets, left)
+    right_positions, right_owners = ragged_positions(offsets, right)
+    keys = np.sort(np.concatenate([left_owners * n_tokens + ids[left_positions],
+                                   right_owners * n_tokens + ids[right_positions]]))
+    shared = keys[1:][keys[1:] == keys[:-1]] // n_tokens
+    return np.bincount(shared, minlength=len(left))
+
+
+def compute_feature_matrix(df: pd.DataFrame, cache: ContributionCache, batch_size: int = 100000,
+                           memoize_distances: bool = True, out: np.ndarray = None,
+                           features: List[str] = None) -> np.ndarray:
+    """
+    computes all features of the pairs column wise and batch wise into one float32 matrix,
+    the values are identical to feature_engineering.compute_features
+    :param df: pd.DataFrame, dataset with the positional indices (left, right) of the pairwise contributions
+    :param cache: ContributionCache, precomputed attributes of the contributions the indices refer to
+    :param batch_size: int, number of pairs per batch
+    :param memoize_distances: bool, keep the distances of location pairs and the similarities of value pairs
+    across batches
+    :param out: np.ndarray, optional float32 array of shape (n_pairs, len(FEATURE_NAMES)) the features are written to
+    :param features: List[str], optional features that are needed, the similarity features that are not needed
+    are NaN, by default all features are computed
+    :return: np.ndarray, shape (n_pairs, len(FEATURE_NAMES)), columns in the order of FEATURE_NAMES
+    """
+    exact_codes = [cache.value_codes[col] for col in EXACT_MATCH_COLUMNS]
+    phonetic_codes = [cache.soundex_codes[col] for col in SOUNDEX_COLUMNS]
+    tokens = [cache.tokens[col] for col in SHARED_WORDS_COLUMNS]
+    memo = LocationDistanceMemo(len(cache.locations)) if memoize_distances else None
+    similarities = [(function, col) for function, columns in SIMILARITY_COLUMNS.items() for col in columns]
+    similarity_memos = {name: SimilarityMemo(len(cache.strings(col)), max_size=1000000)
+                        for name, (function, col) in zip(SIMILARITY_FEATURES, similarities)
+                        if memoize_distances and (features is None or name in features)}
+
+    left_all = df["left"].values.astype(np.int64)
+    right_all = df["right"].values.astype(np.int64)
+    matrix = np.empty((len(df), len(FEATURE_NAMES)), dtype=np.float32) if out is None else out
+
+    for start in range(0, len(df), batch_size):
+        logger.logging.info(">>> Computing features for pairs " + str(start) + " of " + str(len(df)))
+        left = left_all[start:start + batch_size]
+        right = right_all[start:start + batch_size]
+        batch = matrix[start:start + batch_size]
+        column = 0
+
+        with profiling.section("exact_match", len(left)):
+            for codes in exact_codes:
+                batch[:, column] = (codes[left] == codes[right]) & (codes[left] >= 0)
+                column += 1
+
+        with profiling.section("soundex", len(left)):
+            for codes in phonetic_codes:
+                batch[:, column] = (codes[left] == codes[right]) & (codes[left] >= 0)
+                column += 1
+
+        with profiling.section("shared_words", len(left)):
+            for ids, offsets in tokens:
+                batch[:, column] = count_shared_tokens(ids, offsets, left, right)
+                column += 1
+
+        with profiling.section("distance", len(left)):
+            batch[:, column:column + len(DISTANCE_FEATURES)] = distance_features(cache.location_ids,
+                                                                                 cache.location_offsets,
+                                                                                 cache.locations,
+                                                                                 left, right, memo=memo)
+            column += len(DISTANCE_FEATURES)
+
+        with profiling.section("similarity", len(left)):
+            for name, (function, col) in zip(SIMILARITY_FEATURES, similarities):
+                if features is None or name in features:
+                    batch[:, column] = pair_similarities(SIMILARITY_FUNCTIONS[function], cache.strings(col),
+                                                         cache.value_codes[col], left, right,
+                                                         memo=similarity_memos.get(name))
+                else:
+                    batch[:, column] = np.nan
+                column += 1
+    return matrix
+
+
+def feature_shard_worker(descriptors: dict, start: int, stop: int, batch_size: int, memoize_distances: bool,
+                         features: List[str] = None) -> None:
+    """
+    computes the features of the pairs start:stop of the shared pair indices into the shared feature matrix
+    :param descriptors: dict, descriptors of the shared cache arrays, pair indices and feature matrix
+    :param start: int, first pair of the shard
+    :param stop: int, end of the shard
+    :param batch_size: int, number of pairs per batch
+    :param memoize_distances: bool, keep the distances of location pairs across batches
+    :param features: List[str], optional features that are needed
+    :return: None
+    """
+    arrays, handles = attach_shared_arrays(descriptors)
+    try:
+        pairs = pd.DataFrame({"left": arrays.pop("left")[start:stop], "right": arrays.pop("right")[start:stop]})
+        matrix = arrays.pop("matrix")
+        compute_feature_matrix(pairs, ContributionCache.from_arrays(arrays), batch_size=batch_size,
+                               memoize_distances=memoize_distances, out=matrix[start:stop], features=features)
+        del pairs, matrix
+    finally:
+        release_shared_arrays(arrays, handles)
+
+
+def compute_feature_matrix_parallel(df: pd.DataFrame, cache: ContributionCache, n_jobs: int,
+                                    chunk_size: int = 1000000, batch_size: int = 100000,
+                                    memoize_distances: bool = True, features: List[str] = None) -> np.ndarray:
+    """
+    computes the feature matrix in shards of chunk_size pairs in a process pool, the cache, the pair indices
+    and the feature matrix are placed in shared memory so the workers do not copy them
+    :param df: pd.DataFrame, dataset with the positional indices (left, right) of the pairwise contributions
+    :param cache: ContributionCache, precomputed attributes of the contributions the indices refer to
+    :param n_jobs: int, number of worker processes
+    :param chunk_size: int, number of pairs per shard
+    :param batch_size: int, number of pairs per batch within a shard
+    :param memoize_distances: bool, keep the distances of location pairs across batches of a shard
+    :param features: List[str], optional features that are needed
+    :return: np.ndarray, shape (n_pairs, len(FEATURE_NAMES))
+    """
+    arrays = cache.to_arrays()
+    arrays["left"] = df["left"].values.astype(np.int64)
+    arrays["right"] = df["right"].values.astype(np.int64)
+    arrays["matrix"] = np.empty((len(df), len(FEATURE_NAMES)), dtype=np.float32)
+    shared = SharedArrays(arrays)
+    try:
+        shards = split_range(np.ones(len(df)), max(int(np.ceil(len(df) / chunk_size)), 1))
+        logger.logging.info(">>> Computing features in " + str(len(shards)) + " shards with " + str(n_jobs) + " jobs")
+        run_in_pool(feature_shard_worker,
+                    [(shared.descriptors, start, stop, batch_size, memoize_distances, features)
+                     for start, stop in shards],
+                    n_jobs=n_jobs)
+        matrix = shared.arrays["matrix"].copy()
+    finally:
+        shared.close()
+    return matrix
+
+
+def compute_features_vectorized(df: pd.DataFrame, cache: ContributionCache, batch_size: int = 100000,
+                                memoize_distances: bool = True, n_jobs: int = 1,
+                                chunk_size: int = 1000000, features: List[str] = None) -> pd.DataFrame:
+    """
+    adds the feature matrix of the pairs as columns to the dataset, the columns of stored_features
+    :param df: pd.DataFrame, dataset with the positional indices (left, right) of the pairwise contributions
+    :param cache: ContributionCache, precomputed attributes of the contributions the indices refer to
+    :param batch_size: int, number of pairs per batch
+    :param memoize_distances: bool, keep the distances of location pairs across batches
+    :param n_jobs: int, number of worker processes, the features are computed in the main process if 1
+    :param chunk_size: int, number of pairs per shard of a worker process
+    :param features: List[str], optional features that are needed, see compute_feature_matrix
+    :return: pd.DataFrame
+    """
+    if n_jobs > 1 and len(df) > chunk_size:
+        matrix = compute_feature_matrix_parallel(df, cache, n_jobs, chunk_size=chunk_size, batch_size=batch_size,
+                                                 memoize_distances=memoize_distances, features=features)
+    else:
+        matrix = compute_feature_matrix(df, cache, batch_size=batch_size, memoize_distances=memoize_distances,
+                                        features=features)
+    names = stored_features(features)
+    if len(names) < len(FEATURE_NAMES):
+        matrix = matrix[:, [FEATURE_NAMES.index(name) for name in names]]
+    return pd.concat([df.drop(columns=FEATURE_NAMES, errors="ignore"),
+                      pd.DataFrame(matrix, columns=names, index=df.index)], axis=1)
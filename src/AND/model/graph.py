@@ -1,21 +1,107 @@
-import networkx as nx
+import numpy as np
 import pandas as pd
-from typing import List
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from typing import Callable, Hashable, List, Tuple
+import AND.utils.logger as logger
 
-__all__ = ['create_graph','get_disconnected_subgraphs']
+__all__ = ['create_graph','get_disconnected_subgraphs','UnionFind','connected_component_labels',
+           'labels_to_profiles','create_profiles','ProbabilityClustering','cluster_by_probability']
 
-def create_graph(df:pd.DataFrame) -> nx.Graph:
+
+class UnionFind:
+    """
+    Disjoint sets of contribution ids with path compression and union by size,
+    the members of every set are kept at its root, so the profiles can be extended
+    with new contributions and edges without rebuilding them
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.items = []
+        self.parent = []
+        self.members = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self.index
+
+    def add(self, item: Hashable) -> int:
+        """
+        adds an item as its own set if it is not known yet
+        :param item: Hashable, contribution id
+        :return: int, position of the item
+        """
+        if item not in self.index:
+            self.index[item] = len(self.items)
+            self.items.append(item)
+            self.parent.append(len(self.parent))
+            self.members[len(self.items) - 1] = {item}
+        return self.index[item]
+
+    def find(self, item: Hashable) -> int:
+        """
+        root position of the set of an item
+        :param item: Hashable, contribution id
+        :return: int
+        """
+        root = self.add(item)
+        while self.parent[root] != root:
+            root = self.parent[root]
+        position = self.index[item]
+        while self.parent[position] != root:
+            self.parent[position], position = root, self.parent[position]
+        return root
+
+    def union(self, item1: Hashable, item2: Hashable) -> bool:
+        """
+        merges the sets of two items
+        :param item1: Hashable, contribution id
+        :param item2: Hashable, contribution id
+        :return: bool, False if the items were already in the same set
+        """
+        root1, root2 = self.find(item1), self.find(item2)
+        if root1 == root2:
+            return False
+        if len(self.members[root1]) < len(self.members[root2]):
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.members[root1] |= self.members.pop(root2)
+        return True
+
+    def group(self, item: Hashable) -> set:
+        """
+        the set of an item
+        :param item: Hashable, contribution id
+        :return: set
+        """
+        return self.members[self.find(item)]
+
+    def groups(self) -> List[set]:
+        """
+        the sets of items, e.g. the author profiles
+        :return: List[set]
+        """
+        return [set(members) for members in self.members.values()]
+
+
+def create_graph(df:pd.DataFrame, nodes:List = None) -> 'nx.Graph':
     """
     Creates a graph from the data set containing the predictions
     nodes are contribution_ids
     nodes are connected with edges if the pairwise prediction was positive (1)
     :param df:
+    :param nodes: optional list of all contribution_ids, by default the contribution_ids of the pairs in df
     :return:
     """
-    nodes1 = list(df["contribution_id"].unique())
-    nodes2 = list(df["contribution_id_2nd"].unique())
-    nodes1.extend(nodes2)
-    nodes = list(set(nodes1))
+    if nodes is None:
+        nodes1 = list(df["contribution_id"].unique())
+        nodes2 = list(df["contribution_id_2nd"].unique())
+        nodes1.extend(nodes2)
+        nodes = list(set(nodes1))
+    import networkx as nx
     G = nx.Graph()
     G.add_nodes_from(nodes)
 
@@ -27,13 +113,263 @@ def create_graph(df:pd.DataFrame) -> nx.Graph:
 
     return G
 
-def get_disconnected_subgraphs(G:nx.Graph)->List[set]:
+def get_disconnected_subgraphs(G:'nx.Graph')->List[set]:
     """
     Finds the connected components and returns the contributions of the subgraphs
     :param G: nx.Graph
     :return: List[set]
     """
+    import networkx as nx
     subgraphs = []
     for connected_component in nx.connected_components(G):
         subgraphs.append(connected_component)
-    return subgraphs
\ No newline at end of file
+    return subgraphs
+
+
+def shared_categories(df:pd.DataFrame) -> pd.Index:
+    """
+    categories of the contribution ids of the pairs if both id columns are dictionary encoded alike
+    :param df: pd.DataFrame, with the columns contribution_id and contribution_id_2nd
+    :return: pd.Index, None if the ids are not categoricals of the same categories
+    """
+    dtypes = df["contribution_id"].dtype, df["contribution_id_2nd"].dtype
+    if not all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+        return None
+    if not dtypes[0].categories.equals(dtypes[1].categories):
+        return None
+    return dtypes[0].categories
+
+
+def connected_component_labels(df:pd.DataFrame, nodes:List = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the connected components of the positively predicted pairs on integer encoded contribution_ids
+    with scipy's sparse graph routines instead of a networkx graph, dictionary encoded contribution_ids
+    are not decoded before the profiles are built
+    :param df: pd.DataFrame, with the columns contribution_id, contribution_id_2nd and prediction
+    :param nodes: optional list of all contribution_ids, by default the contribution_ids of the pairs in df
+    :return: Tuple[np.ndarray], the contribution_ids and the component label of every contribution_id
+    """
+    categories = shared_categories(df)
+    if categories is not None and nodes is not None:
+        node_codes = categories.get_indexer(np.asarray(nodes, dtype=object))
+        categories = categories if (node_codes >= 0).all() else None
+
+    if categories is not None:
+        # dictionary encoded contribution ids, the components are found on the category codes
+        ids = [df[col].cat.codes.values.astype(np.int64) for col in ("contribution_id", "contribution_id_2nd")]
+        nodes = pd.unique(np.concatenate(ids)) if nodes is None else node_codes
+    else:
+        ids = [np.asarray(df[col].values, dtype=object) for col in ("contribution_id", "contribution_id_2nd")]
+        nodes = pd.unique(np.concatenate(ids)) if nodes is None else np.asarray(nodes, dtype=object)
+    positive = (df["prediction"] == 1).values
+    edges = ids[0][positive], ids[1][positive]
+    codes, contribution_ids = pd.factorize(np.concatenate([nodes, edges[0], edges[1]]))
+    if categories is not None:
+        contribution_ids = categories.take(contribution_ids)
+
+    n_nodes, n_edges = len(contribution_ids), len(edges[0])
+    left = codes[len(nodes):len(nodes) + n_edges]
+    right = codes[len(nodes) + n_edges:]
+    adjacency = coo_matrix((np.ones(n_edges, dtype=np.int8), (left, right)), shape=(n_nodes, n_nodes))
+    _, labels = connected_components(adjacency, directed=False)
+    return np.asarray(contribution_ids, dtype=object), labels
+
+
+def labels_to_profiles(contribution_ids:np.ndarray, labels:np.ndarray) -> List[set]:
+    """
+    Converts a component label array into the contributions of every component
+    :param contribution_ids: np.ndarray
+    :param labels: np.ndarray, component label of every contribution_id
+    :return: List[set]
+    """
+    order = np.argsort(labels, kind="stable")
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    return [set(profile) for profile in np.split(contribution_ids[order], boundaries) if len(profile)]
+
+
+def create_profiles(df:pd.DataFrame, nodes:List = None) -> List[set]:
+    """
+    Creates the author profiles, the same profiles as get_disconnected_subgraphs(create_graph(df, nodes))
+    at a fraction of the memory
+    :param df: pd.DataFrame, with the columns contribution_id, contribution_id_2nd and prediction
+    :param nodes: optional list of all contribution_ids, by default the contribution_ids of the pairs in df
+    :return: List[set]
+    """
+    contribution_ids, labels = connected_component_labels(df, nodes)
+    return labels_to_profiles(contribution_ids, labels)
+
+
+class ProbabilityClustering:
+    """
+    Merges contributions into profiles along the scored pairs in descending order of their probability.
+    Only pairs with a probability of at least threshold merge profiles, pairs whose contributions are already
+    in the same profile change nothing and are skipped. With average linkage two profiles are only merged
+    if the mean probability of all scored pairs between them reaches the threshold, max_cluster_size caps
+    the size of a profile, both stop single false positive pairs from merging large profiles.
+    """
+
+    def __init__(self, threshold: float = 0.5, linkage: str = "single", max_cluster_size: int = None,
+                 nodes: List = None, union_find: UnionFind = None):
+        if linkage not in ("single", "average"):
+            raise ValueError("Unknown linkage '{}', choose single or average".format(linkage))
+        self.threshold = threshold
+        self.linkage = linkage
+        self.max_cluster_size = max_cluster_size
+        self.union_find = UnionFind() if union_find is None else union_find
+        self.links = {}
+        for node in nodes if nodes is not None else []:
+            self.union_find.add(node)
+
+    def same_profile(self, contribution_ids: np.ndarray, contribution_ids_2nd: np.ndarray) -> np.ndarray:
+        """
+        mask of the pairs whose contributions are already in the same profile
+        :param contribution_ids: np.ndarray
+        :param contribution_ids_2nd: np.ndarray
+        :return: np.ndarray
+        """
+        return np.array([self.union_find.find(c1) == self.union_find.find(c2)
+                         for c1, c2 in zip(contribution_ids, contribution_ids_2nd)], dtype=bool)
+
+    def add_link(self, root1: int, root2: int, probability: float) -> None:
+        """
+        adds the probability of a scored pair to the link between two profiles, both profiles share the link
+        :param root1: int, root of the first profile
+        :param root2: int, root of the second profile
+        :param probability: float
+        :return: None
+        """
+        link = self.links.setdefault(root1, {}).get(root2)
+        if link is None:
+            link = [0.0, 0]
+            self.links[root1][root2] = link
+            self.links.setdefault(root2, {})[root1] = link
+        link[0] += probability
+        link[1] += 1
+
+    def merge_links(self, root: int, old_root: int) -> None:
+        """
+        moves the links of a profile that was merged into another profile to the new root
+        :param root: int, root of the merged profile
+        :param old_root: int, former root of the profile that was merged
+        :return: None
+        """
+        for neighbour, link in self.links.pop(old_root, {}).items():
+            del self.links[neighbour][old_root]
+            if neighbour == root:
+                continue
+            existing = self.links.setdefault(root, {}).get(neighbour)
+            if existing is None:
+                self.links[root][neighbour] = link
+                self.links[neighbour][root] = link
+            else:
+                existing[0] += link[0]
+                existing[1] += link[1]
+
+    def merge(self, contribution_id: Hashable, contribution_id_2nd: Hashable) -> bool:
+        """
+        merges the profiles of two contributions if the linkage criteria are met
+        :param contribution_id: Hashable
+        :param contribution_id_2nd: Hashable
+        :return: bool, True if two profiles were merged
+        """
+        root1, root2 = self.union_find.find(contribution_id), self.union_find.find(contribution_id_2nd)
+        if root1 == root2:
+            return False
+        members = self.union_find.members
+        if self.max_cluster_size and len(members[root1]) + len(members[root2]) > self.max_cluster_size:
+            return False
+        if self.linkage == "average":
+            total, count = self.links[root1][root2]
+            if total / count < self.threshold:
+                return False
+        self.union_find.union(contribution_id, contribution_id_2nd)
+        if self.linkage == "average":
+            root = self.union_find.find(contribution_id)
+            self.merge_links(root, root2 if root == root1 else root1)
+        return True
+
+    def add_scored_pairs(self, contribution_ids: np.ndarray, contribution_ids_2nd: np.ndarray,
+                         probabilities: np.ndarray) -> int:
+        """
+        adds scored pairs and merges profiles along them in descending order of probability
+        :param contribution_ids: np.ndarray
+        :param contribution_ids_2nd: np.ndarray
+        :param probabilities: np.ndarray, probability that the pairs are the same person
+        :return: int, number of merges
+        """
+        if self.linkage == "average":
+            for c1, c2, probability in zip(contribution_ids, contribution_ids_2nd, probabilities):
+                root1, root2 = self.union_find.find(c1), self.union_find.find(c2)
+                if root1 != root2:
+                    self.add_link(root1, root2, probability)
+
+        merges = 0
+        for position in np.argsort(-np.asarray(probabilities), kind="stable"):
+            if probabilities[position] < self.threshold:
+                break
+            merges += self.merge(contribution_ids[position], contribution_ids_2nd[position])
+        return merges
+
+    def add_pairs_lazily(self, df: pd.DataFrame, score: Callable[[pd.DataFrame], np.ndarray],
+                         chunk_size: int = 100000) -> int:
+        """
+        scores the pairs chunk by chunk and adds them, pairs whose contributions are already
+        in the same profile are not scored
+        :param df: pd.DataFrame, with the columns contribution_id and contribution_id_2nd
+        :param score: function that returns the probabilities of a data frame of pairs
+        :param chunk_size: int, number of pairs per chunk
+        :return: int, number of scored pairs
+        """
+        n_scored = 0
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size]
+            chunk = chunk[~self.same_profile(chunk["contribution_id"].values, chunk["contribution_id_2nd"].values)]
+            if len(chunk) == 0:
+                continue
+            n_scored += len(chunk)
+            self.add_scored_pairs(chunk["contribution_id"].values, chunk["contribution_id_2nd"].values, score(chunk))
+        return n_scored
+
+    def profiles(self) -> List[set]:
+        """
+        the profiles
+        :return: List[set]
+        """
+        return self.union_find.groups()
+
+
+def cluster_by_probability(df:pd.DataFrame, threshold:float = 0.5, linkage:str = "single",
+                           max_cluster_size:int = None, nodes:List = None,
+                           score:Callable[[pd.DataFrame], np.ndarray] = None,
+                           chunk_size:int = 100000) -> List[set]:
+    """
+    Creates the author profiles from the predicted probabilities of the pairs, see ProbabilityClustering.
+    Single linkage without max_cluster_size is computed as the connected components of the pairs above the threshold
+    :param df: pd.DataFrame, with the columns contribution_id, contribution_id_2nd and probability
+    :param threshold: float, minimum probability of a pair (or mean probability with average linkage) to merge
+    :param linkage: str, single or average
+    :param max_cluster_size: int, optional maximum size of a profile
+    :param nodes: optional list of all contribution_ids, by default the contribution_ids of the pairs in df
+    :param score: optional function that returns the probabilities of a data frame of pairs, if given df is scored
+    lazily chunk by chunk and pairs whose contributions are already in the same profile are not scored
+    :param chunk_size: int, number of pairs per chunk in the lazy mode
+    :return: List[set]
+    """
+    if score is None and linkage == "single" and not max_cluster_size:
+        # without a size cap single linkage merges every pair above the threshold in any order, so the profiles
+        # are the connected components of these pairs and are found without merging pair by pair
+        edges = df[["contribution_id", "contribution_id_2nd"]].copy()
+        edges["prediction"] = (df["probability"].values >= threshold).astype(np.int8)
+        return create_profiles(edges, nodes=nodes)
+    if nodes is None:
+        nodes = pd.unique(np.concatenate([df["contribution_id"].values, df["contribution_id_2nd"].values]))
+    clustering = ProbabilityClustering(threshold=threshold, linkage=linkage, max_cluster_size=max_cluster_size,
+                                       nodes=nodes)
+    if score is None:
+        clustering.add_scored_pairs(df["contribution_id"].values, df["contribution_id_2nd"].values,
+                                    df["probability"].values)
+        return clustering.profiles()
+
+    n_scored = clustering.add_pairs_lazily(df, score, chunk_size=chunk_size)
+    logger.logging.info(">>> Scored " + str(n_scored) + " of " + str(len(df)) + " pairs")
+    return clustering.profiles()
@@ -0,0 +1,140 @@
+import numpy as np
+from typing import Tuple
+
+__all__ = ['LocationDistanceMemo', 'haversine_km', 'distance_features']
+
+NO_DISTANCE = 99999
+EARTH_RADIUS_KM = 6371
+
+
+class LocationDistanceMemo:
+    """
+    Distances in km between pairs of distinct locations that were already computed.
+    Many contributions share the same institutes, so the same location pairs reappear in many batches.
+    A location pair is keyed by lower_id * n_locations + higher_id, the keys are kept sorted.
+    """
+
+    def __init__(self, n_locations: int, max_size: int = 10000000):
+        self.n_locations = n_locations
+        self.max_size = max_size
+        self.keys = np.array([], dtype=np.int64)
+        self.values = np.array([], dtype=np.float64)
+
+    def lookup(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        looks up the distances of the location pairs
+        :param keys: np.ndarray, keys of the location pairs
+        :return: Tuple[np.ndarray], mask of the keys that were found and their distances
+        """
+        positions = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        found = self.keys[positions] == keys if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        values = np.where(found, self.values[positions] if len(self.values) else 0.0, np.nan)
+        return found, values
+
+    def update(self, keys: np.ndarray, values: np.ndarray) -> None:
+        """
+        adds the distances of new location pairs as long as the memo is not full
+        :param keys: np.ndarray, keys of location pairs that are not in the memo yet
+        :param values: np.ndarray, their distances
+        :return: None
+        """
+        free = self.max_size - len(self.keys)
+        if free <= 0:
+            return
+        keys = np.concatenate([self.keys, keys[:free]])
+        values = np.concatenate([self.values, values[:free]])
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.values = keys[order], values[order]
+
+
+def haversine_km(coordinates1: np.ndarray, coordinates2: np.ndarray) -> np.ndarray:
+    """
+    haversine distance in km between arrays of (lat, lon) coordinates,
+    the same formula as mpu.haversine_distance
+    :param coordinates1: np.ndarray, shape (m, 2)
+    :param coordinates2: np.ndarray, shape (m, 2)
+    :return: np.ndarray
+    """
+    lat1, lon1 = coordinates1[:, 0], coordinates1[:, 1]
+    lat2, lon2 = coordinates2[:, 0], coordinates2[:, 1]
+    dlat = np.radians(lat2 - lat1)
+    dlon = np.radians(lon2 - lon1)
+    a = np.sin(dlat / 2) * np.sin(dlat / 2) + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * \
+        np.sin(dlon / 2) * np.sin(dlon / 2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def location_pair_distances(locations: np.ndarray, ids1: np.ndarray, ids2: np.ndarray,
+                            memo: LocationDistanceMemo = None) -> np.ndarray:
+    """
+    distances in km between pairs of distinct locations, every distinct location pair is computed once
+    :param locations: np.ndarray, distinct (lat, lon) coordinates of shape (k, 2)
+    :param ids1: np.ndarray, location ids
+    :param ids2: np.ndarray, location ids
+    :param memo: LocationDistanceMemo, optional memo of already computed location pairs
+    :return: np.ndarray
+    """
+    keys, inverse = np.unique(np.minimum(ids1, ids2) * len(locations) + np.maximum(ids1, ids2),
+                              return_inverse=True)
+    if memo is None:
+        found, distances = np.zeros(len(keys), dtype=bool), np.empty(len(keys), dtype=np.float64)
+    else:
+        found, distances = memo.lookup(keys)
+
+    missing = keys[~found]
+    lower, higher = np.divmod(missing, len(locations))
+    distances[~found] = haversine_km(locations[lower], locations[higher])
+    if memo is not None:
+        memo.update(missing, distances[~found])
+    return distances[inverse.ravel()]
+
+
+def distance_features(location_ids: np.ndarray, offsets: np.ndarray, locations: np.ndarray, left: np.ndarray,
+                      right: np.ndarray, memo: LocationDistanceMemo = None,
+                      max_combinations: int = 10000000) -> np.ndarray:
+    """
+    min, max and mean distance between all combinations of the work locations of every pair,
+    distances are truncated as in feature_engineering.haversine_distance_work_locations
+    and pairs where one contribution has no locations get 99999
+    :param location_ids: np.ndarray, flat location ids of all contributions
+    :param offsets: np.ndarray, offsets[k]:offsets[k + 1] are the locations of contribution k
+    :param locations: np.ndarray, distinct (lat, lon) coordinates the location ids refer to
+    :param left: np.ndarray, positional indices of the pairs
+    :param right: np.ndarray, positional indices of the pairs
+    :param memo: LocationDistanceMemo, optional memo of already computed location pairs
+    :param max_combinations: int, maximum number of location combinations that are expanded at once
+    :return: np.ndarray, shape (n_pairs, 3)
+    """
+    result = np.full((len(left), 3), NO_DISTANCE, dtype=np.float64)
+    left_lengths = offsets[left + 1] - offsets[left]
+    right_lengths = offsets[right + 1] - offsets[right]
+    counts = left_lengths * right_lengths
+    ends = np.cumsum(counts)
+    if len(ends) == 0 or ends[-1] == 0:
+        return result
+
+    # split the pairs into chunks with at most max_combinations location combinations (at least one pair)
+    boundaries = np.searchsorted(ends, np.arange(max_combinations, ends[-1], max_combinations), side="right")
+    boundaries = np.unique(np.r_[0, boundaries, len(left)])
+
+    for chunk_start, chunk_end in zip(boundaries[:-1], boundaries[1:]):
+        chunk = slice(chunk_start, chunk_end)
+        chunk_counts = counts[chunk]
+        if chunk_counts.sum() == 0:
+            continue
+        owners = np.repeat(np.arange(chunk_end - chunk_start, dtype=np.int64), chunk_counts)
+        combination = np.arange(chunk_counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(chunk_counts) - chunk_counts,
+                                                                                 chunk_counts)
+        i, j = np.divmod(combination, right_lengths[chunk][owners])
+        ids1 = location_ids[offsets[left[chunk]][owners] + i]
+        ids2 = location_ids[offsets[right[chunk]][owners] + j]
+        distances = np.floor(location_pair_distances(locations, ids1, ids2, memo) / 1000)
+
+        has_locations = chunk_counts > 0
+        starts = (np.cumsum(chunk_counts) - chunk_counts)[has_locations]
+        chunk_result = result[chunk]
+        chunk_result[has_locations, 0] = np.minimum.reduceat(distances, starts)
+        chunk_result[has_locations, 1] = np.maximum.reduceat(distances, starts)
+        chunk_result[has_locations, 2] = np.floor(np.add.reduceat(distances, starts) / chunk_counts[has_locations])
+    return result
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+from typing import Hashable, List, Tuple
+import AND.utils.logger as logger
+from AND.model.blocking import BLOCKING_KEYS
+from AND.model.feature_matrix import compute_features_vectorized
+from AND.model.graph import ProbabilityClustering, UnionFind
+from AND.model.precompute import ContributionCache
+from AND.model.rf_classifier import rfClassifier
+
+__all__ = ['IncrementalDisambiguator']
+
+
+class IncrementalDisambiguator:
+    """
+    Assigns new contributions to existing author profiles without a full rerun.
+    Every new contribution is only paired with the known contributions that share its blocking key,
+    the pairs are scored with the fitted classifier and pairs with a probability of at least threshold
+    are merged into the profiles with a union-find structure, so the cost of an update depends on the
+    new contributions and their blocks, not on the size of the corpus. Pairs are scored lazily in chunks,
+    pairs whose contributions already ended up in the same profile are not scored.
+    """
+
+    def __init__(self, classifier: rfClassifier, contributions: pd.DataFrame, profiles: List[set],
+                 blocking_strategy: str = "soundex_last_name", threshold: float = 0.5, chunk_size: int = 10000):
+        """
+        :param classifier: rfClassifier, fitted classifier
+        :param contributions: pd.DataFrame, cleaned contributions of the existing profiles
+        :param profiles: List[set], existing profiles, e.g. FileUtil.load_profiles()
+        :param blocking_strategy: str, key based blocking strategy, one of BLOCKING_KEYS
+        :param threshold: float, minimum probability of a pair to merge two profiles
+        :param chunk_size: int, number of pairs that are scored at once
+        """
+        if blocking_strategy not in BLOCKING_KEYS:
+            raise ValueError("Incremental blocking needs a key based strategy, choose one of {}".format(
+                ", ".join(BLOCKING_KEYS)))
+        self.classifier = classifier
+        self.blocking_key = BLOCKING_KEYS[blocking_strategy]
+        self.frames = []
+        self.frame_of = {}
+        self.block_index = {}
+        self.union_find = UnionFind()
+        self.clustering = ProbabilityClustering(threshold=threshold, union_find=self.union_find)
+        self.chunk_size = chunk_size
+
+        for profile in profiles:
+            profile = list(profile)
+            for contribution_id in profile:
+                self.union_find.union(profile[0], contribution_id)
+        self.add_to_index(contributions)
+
+    def add_to_index(self, df: pd.DataFrame) -> None:
+        """
+        stores cleaned contributions and their blocking keys
+        :param df: pd.DataFrame
+        :return: None
+        """
+        frame = df.set_index("contribution_id", drop=False)
+        number = len(self.frames)
+        self.frames.append(frame)
+        for contribution_id, key in zip(frame["contribution_id"].values, self.blocking_key(frame).values):
+            self.frame_of[contribution_id] = number
+            self.union_find.add(contribution_id)
+            if pd.isna(key) or (isinstance(key, str) and key == ""):
+                continue
+            self.block_index.setdefault(key, []).append(contribution_id)
+
+    def gather(self, contribution_ids: List[Hashable]) -> pd.DataFrame:
+        """
+        gathers known contributions by their ids
+        :param contribution_ids: List[Hashable]
+        :return: pd.DataFrame
+        """
+        by_frame = {}
+        for contribution_id in contribution_ids:
+            by_frame.setdefault(self.frame_of[contribution_id], []).append(contribution_id)
+        parts = [self.frames[number].loc[ids] for number, ids in sorted(by_frame.items())]
+        if not parts:
+            return self.frames[0].iloc[0:0] if self.frames else pd.DataFrame()
+        return pd.concat(parts)
+
+    def candidate_pairs(self, df_new: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        pairs of the new contributions with the known contributions and with each other that share a blocking key
+        :param df_new: pd.DataFrame, cleaned new contributions
+        :return: Tuple[pd.DataFrame], the involved contributions and the pairs with indices into them
+        """
+        keys_new = self.blocking_key(df_new)
+        candidate_ids = list(dict.fromkeys(contribution_id
+                                           for key in keys_new.dropna().unique() if key != ""
+                                           for contribution_id in self.block_index.get(key, [])))
+        table = pd.concat([self.gather(candidate_ids), df_new], ignore_index=True)
+        n_known = len(candidate_ids)
+
+        blocks = pd.DataFrame({"key": self.blocking_key(table).values, "position": np.arange(len(table))})
+        blocks = blocks[blocks["key"].notna() & (blocks["key"] != "")]
+        pairs = blocks[blocks["position"] >= n_known].merge(blocks, on="key", suffixes=("_2nd", ""))
+        pairs = pairs[pairs["position"] < pairs["position_2nd"]]
+
+        left = pairs["position"].values.astype(np.int64)
+        right = pairs["position_2nd"].values.astype(np.int64)
+        contribution_ids = table["contribution_id"].values
+        df_pairs = pd.DataFrame({"left": left,
+                                 "right": right,
+                                 "contribution_id": contribution_ids.take(left),
+                                 "contribution_id_2nd": contribution_ids.take(right)})
+        return table, df_pairs
+
+    def add_contributions(self, df_new: pd.DataFrame) -> List[set]:
+        """
+        assigns new contributions to the profiles
+        :param df_new: pd.DataFrame, cleaned new contributions, known contribution ids are skipped
+        :return: List[set], the profiles that contain the new contributions
+        """
+        df_new = df_new.drop_duplicates("contribution_id")
+        df_new = df_new[~df_new["contribution_id"].isin(self.frame_of)].reset_index(drop=True)
+        if df_new.empty:
+            return []
+
+        table, df_pairs = self.candidate_pairs(df_new)
+        logger.logging.info(">>> Created " + str(len(df_pairs)) + " candidate pairs of " + str(len(df_new)) +
+                            " new contributions")
+        self.add_to_index(df_new)
+        if len(df_pairs) > 0:
+            cache = ContributionCache(table)
+            n_scored = self.clustering.add_pairs_lazily(
+                df_pairs, lambda chunk: self.classifier.predict_proba(
+                    compute_features_vectorized(chunk, cache, features=self.classifier.features)),
+                chunk_size=self.chunk_size)
+            logger.logging.info(">>> Scored " + str(n_scored) + " of " + str(len(df_pairs)) + " candidate pairs")
+
+        roots = set(self.union_find.find(contribution_id) for contribution_id in df_new["contribution_id"].values)
+        return [set(self.union_find.members[root]) for root in roots]
+
+    def profile_of(self, contribution_id: Hashable) -> set:
+        """
+        the profile of a single contribution
+        :param contribution_id: Hashable
+        :return: set
+        """
+        return set(self.union_find.group(contribution_id))
+
+    def profiles(self) -> List[set]:
+        """
+        all profiles
+        :return: List[set]
+        """
+        return self.union_find.groups()
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+import jellyfish
+from typing import Dict, List, Tuple
+from AND.model.similarity import decode_strings, encode_strings
+
+__all__ = ['ContributionCache']
+
+NAME_COLUMNS = ['first_name_cleaned',
+                'middle_name_cleaned',
+                'last_name_cleaned',
+                'full_name_cleaned',
+                'workplace_cleaned']
+
+LIST_COLUMNS = ['focus_areas_cleaned',
+                'gpes_cleaned',
+                'orgs_cleaned']
+
+
+def soundex_key(s: str) -> str:
+    """
+    soundex code of a string, empty strings and undecodable strings get an empty key
+    :param s: str
+    :return: str
+    """
+    try:
+        if len(s) == 0:
+            return ""
+        return jellyfish.soundex(s)
+    except UnicodeDecodeError:
+        return ""
+
+
+def encode_soundex(key: str) -> int:
+    """
+    encodes a soundex code (letter followed by three digits) as an integer, the encoding does not depend
+    on the data set so codes of different caches can be compared, an empty key is encoded as -1
+    :param key: str
+    :return: int
+    """
+    if len(key) == 0:
+        return -1
+    digits = key[1:]
+    return ord(key[0]) * 1000 + int(digits) if digits.isdigit() else ord(key[0]) * 1000 + 999
+
+
+def value_codes(values: np.ndarray) -> np.ndarray:
+    """
+    integer codes of the values, equal values get equal codes and missing values get -1
+    :param values: np.ndarray
+    :return: np.ndarray
+    """
+    return distinct_values(values)[0]
+
+
+def distinct_values(values: np.ndarray) -> Tuple[np.ndarray, list]:
+    """
+    integer codes and distinct values, the codes of a categorical are its category codes
+    :param values: np.ndarray
+    :return: Tuple, codes (-1 for missing values) and the distinct values the codes refer to
+    """
+    if isinstance(values, pd.Categorical):
+        return values.codes.astype(np.int64), list(values.categories)
+    codes, uniques = pd.factorize(values)
+    return codes, list(uniques)
+
+
+def soundex_codes(values: np.ndarray) -> np.ndarray:
+    """
+    integer soundex codes of the values, soundex is computed once per distinct value or once per category
+    of a categorical, missing, empty and undecodable strings get -1
+    :param values: np.ndarray
+    :return: np.ndarray
+    """
+    if isinstance(values, pd.Categorical):
+        codes, uniques = values.codes, values.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    unique_codes = np.array([encode_soundex(soundex_key(s)) if isinstance(s, str) else -1 for s in uniques] + [-1],
+                            dtype=np.int64)
+    return unique_codes[codes]
+
+
+def token_ids(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    interns the strings of a column of type List[str], every contribution is represented by the sorted
+    set of its token ids
+    :param values: np.ndarray, lists of strings
+    :return: Tuple[np.ndarray], flat token ids and offsets with offsets[k]:offsets[k + 1] the tokens of row k
+    """
+    lists = [l if isinstance(l, list) else [] for l in values]
+    lengths = np.array([len(l) for l in lists], dtype=np.int64)
+    codes, _ = pd.factorize(pd.Series([s for l in lists for s in l], dtype=object))
+    owners = np.repeat(np.arange(len(lists), dtype=np.int64), lengths)
+
+    # drop duplicated tokens of a row and sort the tokens of every row
+    keys = np.unique(owners * (codes.max(initial=0) + 1) + codes)
+    owners, ids = np.divmod(keys, codes.max(initial=0) + 1)
+    offsets = np.r_[0, np.cumsum(np.bincount(owners, minlength=len(lists)))].astype(np.int64)
+    return ids.astype(np.int64), offsets
+
+
+def flat_locations(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    flattens a column of type List[List[float]] with the (lat, lon) work locations, or of arrays of shape (k, 2)
+    of the compact contributions, every distinct location is stored once
+    :param values: np.ndarray, lists or arrays of coordinates
+    :return: Tuple[np.ndarray], flat location ids, offsets and the distinct coordinates of shape (k, 2)
+    """
+    lists = [l if isinstance(l, (list, np.ndarray)) else [] for l in values]
+    lengths = np.array([len(l) for l in lists], dtype=np.int64)
+    if all(isinstance(l, list) for l in lists):
+        coordinates = np.array([t for l in lists for t in l], dtype=np.float64).reshape(-1, 2)
+    else:
+        coordinates = np.concatenate([np.asarray(l, dtype=np.float64).reshape(-1, 2) for l in lists] +
+                                     [np.empty((0, 2), dtype=np.float64)])
+    locations, location_ids = np.unique(coordinates, axis=0, return_inverse=True)
+    offsets = np.r_[0, np.cumsum(lengths)].astype(np.int64)
+    return location_ids.ravel().astype(np.int64), offsets, locations
+
+
+class ContributionCache:
+    """
+    Attributes of the cleaned contributions that are computed once per contribution before pairing,
+    the pair features only compare integers and intersect sorted integer arrays.
+    Pairs index the contributions by their position in the data frame the cache was built from.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.n_contributions = df.shape[0]
+        self.value_codes, self.values = {}, {}
+        for col in NAME_COLUMNS:
+            self.value_codes[col], values = distinct_values(df[col].values)
+            self.values[col] = encode_strings(values)
+        self.decoded = {}
+        self.soundex_codes = {col: soundex_codes(df[col].values) for col in NAME_COLUMNS}
+        self.tokens = {col: token_ids(df[col].values) for col in LIST_COLUMNS}
+        self.location_ids, self.location_offsets, self.locations = flat_locations(df["workplace_locations"].values)
+
+    def __len__(self) -> int:
+        return self.n_contributions
+
+    def strings(self, col: str) -> List[str]:
+        """
+        distinct values of a name column, value_codes[col] are positions in this list
+        :param col: str, one of NAME_COLUMNS
+        :return: List[str]
+        """
+        if col not in self.decoded:
+            self.decoded[col] = decode_strings(*self.values[col])
+        return self.decoded[col]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        flat dict of all arrays of the cache, e.g. to place them in shared memory
+        :return: Dict[str, np.ndarray]
+        """
+        arrays = {"location_ids": self.location_ids,
+                  "location_offsets": self.location_offsets,
+                  "locations": self.locations}
+        for col in NAME_COLUMNS:
+            arrays["value_codes/" + col] = self.value_codes[col]
+            arrays["soundex_codes/" + col] = self.soundex_codes[col]
+            arrays["value_bytes/" + col], arrays["value_offsets/" + col] = self.values[col]
+        for col in LIST_COLUMNS:
+            arrays["token_ids/" + col], arrays["token_offsets/" + col] = self.tokens[col]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'ContributionCache':
+        """
+        rebuilds a cache from the arrays of to_arrays without copying them
+        :param arrays: Dict[str, np.ndarray]
+        :return: ContributionCache
+        """
+        cache = cls.__new__(cls)
+        cache.n_contributions = len(arrays["location_offsets"]) - 1
+        cache.value_codes = {col: arrays["value_codes/" + col] for col in NAME_COLUMNS}
+        cache.soundex_codes = {col: arrays["soundex_codes/" + col] for col in NAME_COLUMNS}
+        cache.values = {col: (arrays["value_bytes/" + col], arrays["value_offsets/" + col]) for col in NAME_COLUMNS}
+        cache.decoded = {}
+        cache.tokens = {col: (arrays["token_ids/" + col], arrays["token_offsets/" + col]) for col in LIST_COLUMNS}
+        cache.location_ids = arrays["location_ids"]
+        cache.location_offsets = arrays["location_offsets"]
+        cache.locations = arrays["locations"]
+        return cache
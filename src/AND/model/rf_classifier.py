@@ -1,11 +1,34 @@
-from sklearn.datasets import make_classification
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import cross_validate
+import inspect
 import numpy as np
 import pandas as pd
-from typing import List
+from typing import List, Tuple, Union
+from AND.utils.feature_store import FeatureStore
 
-__all__ = ['rfClassifier']
+__all__ = ['rfClassifier', 'person_folds']
+
+
+def person_folds(groups: np.ndarray, groups_2nd: np.ndarray, n_folds: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    train and validation rows of the folds of a cross validation that never splits a person: the persons are
+    assigned to the folds with GroupKFold on the pairs of their left contribution, a pair is validated in the fold
+    of its persons and trained on in the other folds. A negative pair of persons of two different folds is dropped
+    from the splits that validate one of them, so no person is both in the training and the validation rows
+    :param groups: np.ndarray, person of the left contribution of every pair
+    :param groups_2nd: np.ndarray, person of the right contribution of every pair
+    :param n_folds: int
+    :return: List[Tuple[np.ndarray]], positions of the training and the validation rows of every fold
+    """
+    from sklearn.model_selection import GroupKFold
+
+    codes, uniques = pd.factorize(np.concatenate([groups, groups_2nd]))
+    left, right = codes[:len(groups)], codes[len(groups):]
+    # persons that are never on the left are spread over the folds
+    folds = np.arange(len(uniques)) % n_folds
+    for k, (_, rows) in enumerate(GroupKFold(n_splits=n_folds).split(left, groups=left)):
+        folds[left[rows]] = k
+    left, right = folds[left], folds[right]
+    return [(np.flatnonzero((left != k) & (right != k)), np.flatnonzero((left == k) & (right == k)))
+            for k in range(n_folds)]
 
 
 class rfClassifier:
@@ -15,45 +38,191 @@ class rfClassifier:
         self.n_folds = config["n_folds"]
         self.features = config["features"]
         self.col_label = config["col_label"]
+        # total number of cores of cross validation and training
+        self.n_jobs = config.get("n_jobs", 1)
+        # columns of the persons of the two contributions of a pair, the folds of the cross validation never
+        # split a person, see person_folds
+        self.col_group = config.get("col_group", "person_group")
+        self.col_group_2nd = config.get("col_group_2nd", "person_group_2nd")
+        self.group_folds = config.get("group_folds", True)
+        # share of the pairs used for cross validation and training
+        self.subsample = config.get("subsample")
+        # column with the sampling weights of the pairs, used for training if sample_weights is set
+        self.col_weight = config.get("col_weight", "sample_weight")
+        self.sample_weights = config.get("sample_weights", False)
         self.cv_scores = None
         self.clf = None
         self.importances = None
 
-    def run_cross_validation(self, df_train: pd.DataFrame) -> dict:
+    def get_data(self, data: Union[pd.DataFrame, FeatureStore],
+                 rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        float32 feature matrix and int8 labels of a data frame or a feature store,
+        the matrix is built without an intermediate float64 or object copy.
+        The matrix is held in memory, of a feature store only the given rows are read
+        :param data: pd.DataFrame or FeatureStore
+        :param rows: np.ndarray, optional sorted positions of the rows, all rows by default
+        :return: Tuple[np.ndarray]
+        """
+        if isinstance(data, FeatureStore):
+            return data.features(self.features, rows=rows), self.get_column(data, self.col_label, rows).astype(np.int8)
+        if rows is not None:
+            data = data.iloc[rows]
+        return data[self.features].to_numpy(dtype=np.float32), data[self.col_label].to_numpy(dtype=np.int8)
+
+    @staticmethod
+    def get_column(data: Union[pd.DataFrame, FeatureStore], name: str, rows: np.ndarray = None) -> np.ndarray:
+        """
+        values of a column of a data frame or a feature store, None if there is no such column
+        :param data: pd.DataFrame or FeatureStore
+        :param name: str
+        :param rows: np.ndarray, optional sorted positions of the rows, all rows by default
+        :return: np.ndarray
+        """
+        if isinstance(data, FeatureStore):
+            values = data.column(name) if name in data.dtypes else None
+        else:
+            values = data[name].values if name in data.columns else None
+        if values is None:
+            return None
+        return np.asarray(values if rows is None else values[rows])
+
+    def get_groups(self, data: Union[pd.DataFrame, FeatureStore],
+                   rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        persons of the left and the right contribution of the pairs for the cross validation,
+        None for a column the data does not have
+        :param data: pd.DataFrame or FeatureStore
+        :param rows: np.ndarray, optional sorted positions of the rows, all rows by default
+        :return: Tuple[np.ndarray]
+        """
+        return self.get_column(data, self.col_group, rows), self.get_column(data, self.col_group_2nd, rows)
+
+    def get_weights(self, data: Union[pd.DataFrame, FeatureStore], rows: np.ndarray = None) -> np.ndarray:
+        """
+        sampling weights of the pairs, None if sample_weights is not set or the data has no weight column
+        :param data: pd.DataFrame or FeatureStore
+        :param rows: np.ndarray, optional sorted positions of the rows, all rows by default
+        :return: np.ndarray
+        """
+        if not self.sample_weights:
+            return None
+        return self.get_column(data, self.col_weight, rows)
+
+    def get_training_data(self, data: Union[pd.DataFrame, FeatureStore]) -> Tuple[np.ndarray, ...]:
+        """
+        feature matrix, labels, groups (see get_groups) and weights of the rows used for training,
+        a random share of the rows if subsample is set. The cross validation and the fit need the matrix in memory,
+        so of a feature store only the subsample is read, without subsample the whole training matrix is loaded
+        :param data: pd.DataFrame or FeatureStore
+        :return: Tuple[np.ndarray]
+        """
+        rows = None
+        if self.subsample is not None and self.subsample < 1:
+            rows = np.sort(np.random.default_rng(0).choice(len(data), size=int(len(data) * self.subsample),
+                                                           replace=False))
+        X, y = self.get_data(data, rows)
+        return X, y, self.get_groups(data, rows), self.get_weights(data, rows)
+
+    def parallel_jobs(self) -> Tuple[int, int]:
+        """
+        splits the core budget n_jobs into parallel folds and parallel trees per fold
+        :return: Tuple[int], jobs of the folds and jobs of the trees
+        """
+        n_jobs = max(self.n_jobs, 1)
+        fold_jobs = min(self.n_folds, n_jobs)
+        return fold_jobs, max(n_jobs // fold_jobs, 1)
+
+    def run_cross_validation(self, df_train: Union[pd.DataFrame, FeatureStore]) -> dict:
         """
         performs cross validation and return cv f1 scores
-        :param df_train: pd.DataFrame
+        :param df_train: pd.DataFrame or FeatureStore
         :param col_label: str, label column
         :return: List[float]
         """
+        # sklearn is only imported where a forest is fitted, it dominates the import time of the package
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.model_selection import GroupKFold, cross_validate
+
+        fold_jobs, tree_jobs = self.parallel_jobs()
         clf = RandomForestClassifier(
             max_depth=self.max_depth,
             random_state=0,
-            n_estimators=self.n_estimators
+            n_estimators=self.n_estimators,
+            n_jobs=tree_jobs
         )
 
-        X_train = df_train[self.features].values
-        y_train = df_train[self.col_label].values
-        self.cv_scores = cross_validate(clf, X_train, y_train, cv=self.n_folds, scoring=["f1", "precision", "recall"],
-                                        verbose=1, return_train_score=True)
+        X_train, y_train, (groups, groups_2nd), weights = self.get_training_data(df_train)
+        if not self.group_folds or groups is None:
+            cv, groups = self.n_folds, None
+        elif groups_2nd is None:
+            # pairs without the person of the right contribution are grouped by the left one only
+            cv = GroupKFold(n_splits=self.n_folds)
+        else:
+            cv, groups = person_folds(groups, groups_2nd, self.n_folds), None
+        fit_params = {}
+        if weights is not None:
+            # the fit parameters are called fit_params before scikit-learn 1.4 and params since
+            keyword = "params" if "params" in inspect.signature(cross_validate).parameters else "fit_params"
+            fit_params[keyword] = {"sample_weight": weights}
+        self.cv_scores = cross_validate(clf, X_train, y_train, groups=groups, cv=cv,
+                                        scoring=["f1", "precision", "recall"], n_jobs=fold_jobs,
+                                        verbose=1, return_train_score=True, **fit_params)
         return self.cv_scores
 
-    def fit_classifier(self, df_train: pd.DataFrame) -> dict:
+    def fit_classifier(self, df_train: Union[pd.DataFrame, FeatureStore]) -> dict:
+        from sklearn.ensemble import RandomForestClassifier
+
         clf = RandomForestClassifier(
             max_depth=self.max_depth,
             random_state=0,
-            n_estimators=self.n_estimators
+            n_estimators=self.n_estimators,
+            n_jobs=max(self.n_jobs, 1)
         )
 
-        X_train = df_train[self.features].values
-        y_train = df_train[self.col_label].values
-        clf.fit(X_train, y_train)
+        X_train, y_train, _, weights = self.get_training_data(df_train)
+        clf.fit(X_train, y_train, sample_weight=weights)
         self.clf = clf
         self.importances = clf.feature_importances_
         return self.importances
 
+    def predict_scores(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        predicted labels and probabilities of the positive class with a single pass over the trees,
+        the labels equal RandomForestClassifier.predict
+        :param X: np.ndarray, feature matrix
+        :return: Tuple[np.ndarray], labels and probabilities
+        """
+        probabilities = self.clf.predict_proba(X)
+        predictions = self.clf.classes_.take(np.argmax(probabilities, axis=1))
+        if 1 in self.clf.classes_:
+            return predictions, probabilities[:, list(self.clf.classes_).index(1)]
+        return predictions, np.zeros(len(X))
+
+    def predict_proba(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        probabilities that the pairs are the same person
+        :param df: pd.DataFrame
+        :return: np.ndarray
+        """
+        return self.predict_scores(df[self.features].to_numpy(dtype=np.float32))[1]
+
     def predict(self, df: pd.DataFrame) -> pd.DataFrame:
-        X = df[self.features].values
-        predictions = self.clf.predict(X)
+        X = df[self.features].to_numpy(dtype=np.float32)
+        predictions, probabilities = self.predict_scores(X)
         df["prediction"] = predictions
+        df["probability"] = probabilities
         return df
+
+    def predict_store(self, store: FeatureStore, batch_size: int = 1000000) -> FeatureStore:
+        """
+        predicts the pairs of a feature store batch wise and writes the columns prediction and probability to the store
+        :param store: FeatureStore
+        :param batch_size: int
+        :return: FeatureStore
+        """
+        for start, stop in store.iter_batches(batch_size):
+            predictions, probabilities = self.predict_scores(store.features(self.features, start, stop))
+            store.write_column("prediction", predictions.astype(np.int8), start=start)
+            store.write_column("probability", probabilities.astype(np.float32), start=start)
+        return store
@@ -0,0 +1,182 @@
+import zlib
+import numpy as np
+import jellyfish
+from scipy.sparse import csr_matrix
+from typing import Callable, Dict, List, Tuple
+from AND.model.haversine import LocationDistanceMemo
+
+__all__ = ['SIMILARITY_FUNCTIONS', 'SimilarityMemo', 'NameIndex', 'encode_strings', 'decode_strings',
+           'levenshtein_similarity', 'name_ngrams', 'pair_similarities']
+
+
+def levenshtein_similarity(s1: str, s2: str) -> float:
+    """
+    levenshtein distance normalized by the length of the longer string as a similarity in [0, 1]
+    :param s1: str
+    :param s2: str
+    :return: float
+    """
+    longest = max(len(s1), len(s2))
+    if longest == 0:
+        return 1.0
+    return 1.0 - jellyfish.levenshtein_distance(s1, s2) / longest
+
+
+SIMILARITY_FUNCTIONS: Dict[str, Callable[[str, str], float]] = {
+    "jaro_winkler": jellyfish.jaro_winkler_similarity,
+    "levenshtein": levenshtein_similarity,
+}
+
+
+class SimilarityMemo(LocationDistanceMemo):
+    """
+    Similarities of pairs of distinct values of a column that were already computed, the same sorted key memo
+    as the location distances with a pair of value ids keyed by lower_id * n_values + higher_id.
+    """
+
+
+def encode_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    encodes strings as one flat utf-8 byte array, e.g. to place the distinct values of a column in shared memory
+    :param values: List[str]
+    :return: Tuple[np.ndarray], bytes and offsets with offsets[k]:offsets[k + 1] the bytes of value k
+    """
+    encoded = [str(s).encode("utf-8") for s in values]
+    offsets = np.r_[0, np.cumsum([len(b) for b in encoded], dtype=np.int64)].astype(np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8).copy(), offsets
+
+
+def decode_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """
+    decodes the strings of encode_strings
+    :param data: np.ndarray, utf-8 bytes
+    :param offsets: np.ndarray
+    :return: List[str]
+    """
+    raw = np.asarray(data).tobytes()
+    bounds = np.asarray(offsets).tolist()
+    return [raw[start:stop].decode("utf-8") for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def pair_similarities(function: Callable[[str, str], float], values: List[str], codes: np.ndarray,
+                      left: np.ndarray, right: np.ndarray, memo: SimilarityMemo = None) -> np.ndarray:
+    """
+    string similarity of the values of every pair, every distinct pair of values is computed once,
+    pairs with a missing value get 0 and pairs of equal values get 1
+    :param function: Callable, symmetric similarity of two strings, e.g. one of SIMILARITY_FUNCTIONS
+    :param values: List[str], distinct values of the column
+    :param codes: np.ndarray, value id of every contribution, -1 for missing values
+    :param left: np.ndarray, positional indices of the pairs
+    :param right: np.ndarray, positional indices of the pairs
+    :param memo: SimilarityMemo, optional memo of already computed value pairs
+    :return: np.ndarray
+    """
+    result = np.zeros(len(left), dtype=np.float64)
+    codes1, codes2 = codes[left], codes[right]
+    valid = (codes1 >= 0) & (codes2 >= 0)
+    codes1, codes2 = codes1[valid], codes2[valid]
+    keys, inverse = np.unique(np.minimum(codes1, codes2) * len(values) + np.maximum(codes1, codes2),
+                              return_inverse=True)
+    if memo is None:
+        found, similarities = np.zeros(len(keys), dtype=bool), np.empty(len(keys), dtype=np.float64)
+    else:
+        found, similarities = memo.lookup(keys)
+
+    missing = keys[~found]
+    lower, higher = np.divmod(missing, len(values))
+    similarities[~found] = [1.0 if i == j else function(values[i], values[j])
+                            for i, j in zip(lower.tolist(), higher.tolist())]
+    if memo is not None:
+        memo.update(missing, similarities[~found])
+    result[valid] = similarities[inverse.ravel()]
+    return result
+
+
+def name_ngrams(s: str, n: int) -> List[int]:
+    """
+    hashed character n-grams of a padded string
+    :param s: str
+    :param n: int, length of the n-grams
+    :return: List[int]
+    """
+    if len(s) == 0:
+        return []
+    s = " " + s + " "
+    return list(set(zlib.crc32(s[k:k + n].encode("utf-8")) for k in range(max(len(s) - n + 1, 1))))
+
+
+class NameIndex:
+    """
+    Character n-gram index of distinct names for top-k nearest name lookups. A name is the normalized
+    binary vector of its n-grams, names are compared by cosine similarity with sparse matrix products,
+    so a lookup only touches the names that share at least one n-gram with the query.
+    """
+
+    def __init__(self, names: List[str], ngram: int = 3):
+        self.names = list(names)
+        self.ngram = ngram
+        self.vocabulary = {}
+        self.matrix = self.vectorize(self.names, extend=True)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def vectorize(self, names: List[str], extend: bool = False) -> csr_matrix:
+        """
+        normalized n-gram vectors of names, n-grams that are not in the vocabulary only count for the norm
+        :param names: List[str]
+        :param extend: bool, add unknown n-grams to the vocabulary
+        :return: csr_matrix, shape (len(names), len(vocabulary))
+        """
+        rows, columns, weights = [], [], []
+        for row, name in enumerate(names):
+            grams = name_ngrams(name, self.ngram) if isinstance(name, str) else []
+            for gram in grams:
+                column = self.vocabulary.setdefault(gram, len(self.vocabulary)) if extend \
+                    else self.vocabulary.get(gram)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+                    weights.append(1 / np.sqrt(len(grams)))
+        return csr_matrix((np.array(weights, dtype=np.float64), (np.array(rows, dtype=np.int64),
+                                                                 np.array(columns, dtype=np.int64))),
+                          shape=(len(names), len(self.vocabulary)))
+
+    def top_k(self, names: List[str] = None, k: int = 10, min_similarity: float = 0.0,
+              batch_size: int = 10000) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        the k most similar indexed names of every query name, ties are broken by the position in the index
+        :param names: List[str], query names, by default the indexed names themselves
+        :param k: int
+        :param min_similarity: float, names below this cosine similarity are not returned
+        :param batch_size: int, number of query names per sparse matrix product
+        :return: Tuple[np.ndarray], query positions, positions of the indexed names and their similarities
+        """
+        queries = self.matrix if names is None else self.vectorize(names)
+        rows, columns, similarities = [], [], []
+        for start in range(0, queries.shape[0], batch_size):
+            products = (queries[start:start + batch_size] @ self.matrix.T).tocoo()
+            keep = products.data >= max(min_similarity, 1e-12)
+            row, column, similarity = products.row[keep] + start, products.col[keep], products.data[keep]
+            order = np.lexsort((column, -similarity, row))
+            row, column, similarity = row[order], column[order], similarity[order]
+            starts = np.flatnonzero(np.r_[True, row[1:] != row[:-1]]) if len(row) else np.array([], dtype=int)
+            ranks = np.arange(len(row)) - np.repeat(starts, np.diff(np.r_[starts, len(row)]))
+            rows.append(row[ranks < k])
+            columns.append(column[ranks < k])
+            similarities.append(similarity[ranks < k])
+        if not rows:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        return (np.concatenate(rows).astype(np.int64), np.concatenate(columns).astype(np.int64),
+                np.concatenate(similarities))
+
+    def nearest(self, name: str, k: int = 10, min_similarity: float = 0.0) -> List[Tuple[str, float]]:
+        """
+        the k most similar indexed names of a single name
+        :param name: str
+        :param k: int
+        :param min_similarity: float
+        :return: List[Tuple[str, float]], names and cosine similarities, most similar first
+        """
+        _, positions, similarities = self.top_k([name], k=k, min_similarity=min_similarity)
+        return [(self.names[position], float(similarity)) for position, similarity in zip(positions, similarities)]
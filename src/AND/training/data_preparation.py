@@ -1,10 +1,13 @@
 import pandas as pd
-from typing import List
+from typing import Callable, Iterator, List, Tuple
 import random
 import numpy as np
 import AND.utils.logger as logger
+from AND.model.blocking import BLOCKING_KEYS, create_candidate_pairs, blocking_recall
+from AND.utils.parallel import SharedArrays, attach_shared_arrays, release_shared_arrays, run_in_pool, split_range
 
-__all__ = ['combine_data_sets', 'create_train_test', 'create_contribution_pairs']
+__all__ = ['combine_data_sets', 'create_train_test', 'create_contribution_pairs', 'iterate_contribution_pairs',
+           'sample_contribution_pairs']
 
 
 def combine_data_sets(df_contr: pd.DataFrame, df_gt: pd.DataFrame) -> pd.DataFrame:
@@ -36,48 +39,382 @@ def create_train_test(df: pd.DataFrame, persons: List[str], ratio: float) -> Lis
     return [df_train, df_test]
 
 
-def create_contribution_pairs(df: pd.DataFrame, n: int) -> pd.DataFrame:
+def person_codes(df: pd.DataFrame) -> np.ndarray:
     """
-    creates pairs of contributions
+    integer codes of the personId column, contributions without personId get -1
     :param df: pd.DataFrame
-    :param n: int, only take every nt-h negative pair into the traning set
-    :return df_pairs:  pd.DataFrame
+    :return: np.ndarray
+    """
+    codes, _ = pd.factorize(df["personId"].values)
+    return codes.astype(np.int64)
+
+
+def subsample_negative_pairs(persons: np.ndarray, left: np.ndarray, right: np.ndarray, n: int,
+                             count: int = 0) -> Tuple[np.ndarray, int]:
+    """
+    keeps all positive pairs and every n-th negative pair
+    :param persons: np.ndarray, person codes of every contribution, see person_codes
+    :param left: np.ndarray, positional indices of the pairs
+    :param right: np.ndarray, positional indices of the pairs
+    :param n: int, only take every nt-h negative pair
+    :param count: int, number of negative pairs seen before these pairs
+    :return: Tuple[np.ndarray, int], mask of the kept pairs and the updated negative pair count
+    """
+    negative = (persons[left] != persons[right]) | (persons[left] < 0)
+    ranks = count + np.cumsum(negative)
+    keep = ~negative | (ranks % n == 0)
+    return keep, int(ranks[-1]) if len(ranks) else count
+
+
+def negative_pair_counts(persons: np.ndarray) -> np.ndarray:
+    """
+    number of negative pairs (k, m) with m >= k for every contribution k
+    :param persons: np.ndarray, person codes of every contribution, see person_codes
+    :return: np.ndarray
+    """
+    n_rows = len(persons)
+    groups = pd.Series(persons).groupby(persons)
+    same_later = (groups.transform("size") - groups.cumcount()).values
+    same_later[persons < 0] = 0
+    return (n_rows - np.arange(n_rows)) - same_later
+
+
+def all_pair_indices(persons: np.ndarray, n: int, start: int = 0, stop: int = None,
+                     count: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    enumerates every pair (k, m) with start <= k < stop and k <= m of the contributions
+    and subsamples the negative pairs
+    :param persons: np.ndarray, person codes of every contribution, see person_codes
+    :param n: int, only take every nt-h negative pair
+    :param start: int, first contribution k
+    :param stop: int, end of the contributions k, all contributions if None
+    :param count: int, number of negative pairs of the contributions before start
+    :return: Tuple[np.ndarray], positional indices (left, right)
     """
-    columns = ['contribution_id',
-               'first_name_cleaned',
-               'middle_name_cleaned',
-               'last_name_cleaned',
-               'full_name_cleaned',
-               'workplace_cleaned',
-               'workplace_locations',
-               'focus_areas_cleaned',
-               'orgs_cleaned',
-               'gpes_cleaned',
-               'personId']
-
-    columns_part_2 = [c + "_2nd" for c in columns]
-
-    array = df[columns].values
-    data_dict = {}
-
-    count = 0
-    for k in range(0, array.shape[0]):
+    n_rows = len(persons)
+    stop = n_rows if stop is None else stop
+    left, right = [np.array([], dtype=np.int64)], [np.array([], dtype=np.int64)]
+
+    for k in range(start, stop):
         if k % 1000 == 0:
-            logger.logging.info(">>> Created pairs for " + str(k) + " of " + str(array.shape[0]) + " contributions")
-        for m in range(k, array.shape[0]):
-            values1 = array[k]
-            values2 = array[m]
-            if values1[10] == values2[10]:
-                values = np.concatenate([values1, values2], axis=0)
-                data_dict["row_" + str(k) + "_" + str(m)] = values
-            else:
-                count += 1
-                if count % n == 0:
-                    values = np.concatenate([values1, values2], axis=0)
-                    data_dict["row_" + str(k) + "_" + str(m)] = values
-
-    columns.extend(columns_part_2)
-    df_pairs = pd.DataFrame.from_dict(data_dict, orient='index', columns=columns)
-    df_pairs["same_person"] = df_pairs["personId_2nd"] == df_pairs["personId"]
-    df_pairs["same_person"] = df_pairs["same_person"].astype(int)
+            logger.logging.info(">>> Created pairs for " + str(k) + " of " + str(n_rows) + " contributions")
+        candidates = np.arange(k, n_rows, dtype=np.int64)
+        keep, count = subsample_negative_pairs(persons, np.full(len(candidates), k), candidates, n, count)
+        left.append(np.full(int(keep.sum()), k, dtype=np.int64))
+        right.append(candidates[keep])
+    return np.concatenate(left), np.concatenate(right)
+
+
+def pair_shard_worker(descriptors: dict, n: int, start: int, stop: int, count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    enumerates the pairs of the contributions start:stop with the shared person codes
+    :param descriptors: dict, descriptors of the shared person codes
+    :param n: int, only take every nt-h negative pair
+    :param start: int, first contribution of the shard
+    :param stop: int, end of the shard
+    :param count: int, number of negative pairs of the contributions before start
+    :return: Tuple[np.ndarray], positional indices (left, right)
+    """
+    arrays, handles = attach_shared_arrays(descriptors)
+    try:
+        return all_pair_indices(arrays["persons"], n, start=start, stop=stop, count=count)
+    finally:
+        release_shared_arrays(arrays, handles)
+
+
+def all_pair_indices_parallel(persons: np.ndarray, n: int, n_jobs: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    enumerates all pairs in shards of contributions in a process pool, every shard starts with the number
+    of negative pairs before it, so the result is identical to all_pair_indices
+    :param persons: np.ndarray, person codes of every contribution, see person_codes
+    :param n: int, only take every nt-h negative pair
+    :param n_jobs: int, number of worker processes
+    :return: Tuple[np.ndarray], positional indices (left, right)
+    """
+    n_rows = len(persons)
+    counts_before = np.r_[0, np.cumsum(negative_pair_counts(persons))]
+    shards = split_range(n_rows - np.arange(n_rows), 4 * n_jobs)
+
+    shared = SharedArrays({"persons": persons})
+    try:
+        results = run_in_pool(pair_shard_worker,
+                              [(shared.descriptors, n, start, stop, int(counts_before[start])) for start, stop in shards],
+                              n_jobs=n_jobs)
+    finally:
+        shared.close()
+    if not results:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate([left for left, _ in results]), np.concatenate([right for _, right in results])
+
+
+def blocked_pair_indices(df: pd.DataFrame, n: int, blocking: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    creates the self pairs (k, k) and the candidate pairs (k, m) of the blocking stage
+    and subsamples the negative pairs
+    :param df: pd.DataFrame
+    :param n: int, only take every nt-h negative pair
+    :param blocking: dict, blocking configuration, the key "strategy" selects the blocking strategy
+    and all other keys are passed on as parameters of the strategy
+    :return: Tuple[np.ndarray], positional indices (left, right)
+    """
+    params = dict(blocking)
+    strategy = params.pop("strategy")
+    left, right = create_candidate_pairs(df, strategy, **params)
+    logger.logging.info(">>> Blocking with strategy " + strategy + " created " + str(len(left)) + " candidate pairs")
+    logger.logging.info(">>> Blocking recall: {:.4f}".format(blocking_recall(df, left, right)))
+
+    diagonal = np.arange(df.shape[0], dtype=np.int64)
+    left = np.concatenate([diagonal, left])
+    right = np.concatenate([diagonal, right])
+    order = np.lexsort((right, left))
+    left, right = left[order], right[order]
+
+    keep, _ = subsample_negative_pairs(person_codes(df), left, right, n)
+    return left[keep], right[keep]
+
+
+def pair_frame(df: pd.DataFrame, persons: np.ndarray, left: np.ndarray, right: np.ndarray) -> pd.DataFrame:
+    """
+    data frame of pairs with the positional indices, the contribution ids, the label same_person, person_group
+    and person_group_2nd. The contribution ids of a compact data frame are gathered as categorical codes.
+    person_group and person_group_2nd are the persons of the left and the right contribution, they assign the pairs
+    to the folds of the cross validation. Contributions without personId form a group of their own
+    :param df: pd.DataFrame
+    :param persons: np.ndarray, person codes of every contribution, see person_codes
+    :param left: np.ndarray, positional indices of the pairs
+    :param right: np.ndarray, positional indices of the pairs
+    :return: pd.DataFrame
+    """
+    contribution_ids = df["contribution_id"].values
+
+    df_pairs = pd.DataFrame({"left": left, "right": right})
+    df_pairs["contribution_id"] = contribution_ids.take(left)
+    df_pairs["contribution_id_2nd"] = contribution_ids.take(right)
+    df_pairs["same_person"] = ((persons.take(left) == persons.take(right)) & (persons.take(left) >= 0)).astype(np.int8)
+    for col, positions in (("person_group", left), ("person_group_2nd", right)):
+        groups = persons.take(positions)
+        df_pairs[col] = np.where(groups >= 0, groups, persons.max(initial=-1) + 1 + np.asarray(positions))
+    return df_pairs
+
+
+def group_pair_count(codes: np.ndarray) -> int:
+    """
+    number of pairs (k, m) with k < m of the contributions that share a code
+    :param codes: np.ndarray, group code of every contribution, -1 for no group
+    :return: int
+    """
+    sizes = np.bincount(codes[codes >= 0]).astype(np.int64)
+    return int((sizes * (sizes - 1) // 2).sum())
+
+
+def group_pair_indices(codes: np.ndarray, self_pairs: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    all pairs (k, m) with k < m, or k <= m with self pairs, of the contributions that share a code
+    :param codes: np.ndarray, group code of every contribution, -1 for no group
+    :param self_pairs: bool, include the pairs (k, k)
+    :return: Tuple[np.ndarray], positional indices (left, right)
+    """
+    valid = np.flatnonzero(codes >= 0)
+    members = valid[np.argsort(codes[valid], kind="stable")]
+    sizes = np.bincount(codes[valid]).astype(np.int64)
+    # the member at position i of a group of size s is paired with the s - i - 1 members after it
+    positions = np.arange(len(members), dtype=np.int64) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    counts = np.repeat(sizes, sizes) - positions - (0 if self_pairs else 1)
+    left = np.repeat(np.arange(len(members), dtype=np.int64), counts)
+    right = left + np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    return members[left], members[right + (0 if self_pairs else 1)]
+
+
+def choose_pairs(left: np.ndarray, right: np.ndarray, size: int,
+                 rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    a random subset of size pairs in the order of the given pairs
+    :param left: np.ndarray
+    :param right: np.ndarray
+    :param size: int
+    :param rng: np.random.Generator
+    :return: Tuple[np.ndarray]
+    """
+    if len(left) <= size:
+        return left, right
+    rows = np.sort(rng.choice(len(left), size=size, replace=False))
+    return left[rows], right[rows]
+
+
+def block_pair_sampler(blocks: np.ndarray, rng: np.random.Generator) -> Callable[[int], Tuple[np.ndarray, np.ndarray]]:
+    """
+    draws random pairs of distinct contributions of the same block, a block is drawn with a probability
+    proportional to its number of pairs so every pair of a block is equally likely
+    :param blocks: np.ndarray, block code of every contribution, -1 for no block
+    :param rng: np.random.Generator
+    :return: Callable, draws size pairs
+    """
+    valid = np.flatnonzero(blocks >= 0)
+    members = valid[np.argsort(blocks[valid], kind="stable")]
+    sizes = np.bincount(blocks[valid]).astype(np.int64)
+    starts = np.cumsum(sizes) - sizes
+    pairs = (sizes * (sizes - 1) // 2).astype(np.float64)
+
+    def draw(size: int) -> Tuple[np.ndarray, np.ndarray]:
+        chosen = rng.choice(len(sizes), size=size, p=pairs / pairs.sum())
+        i = rng.integers(0, sizes[chosen])
+        j = rng.integers(0, sizes[chosen] - 1)
+        j = j + (j >= i)
+        return members[starts[chosen] + i], members[starts[chosen] + j]
+    return draw
+
+
+def draw_pairs(draw: Callable[[int], Tuple[np.ndarray, np.ndarray]], accept: Callable, size: int, n_rows: int,
+               rng: np.random.Generator, max_rounds: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    draws distinct random pairs (k, m) with k < m by rejection, only the drawn pairs are generated
+    :param draw: Callable, draws a number of random pairs
+    :param accept: Callable, mask of the pairs (k, m) that belong to the stratum
+    :param size: int, number of pairs
+    :param n_rows: int, number of contributions
+    :param rng: np.random.Generator
+    :param max_rounds: int, the stratum may hold fewer distinct pairs than expected, give up after max_rounds
+    :return: Tuple[np.ndarray], positional indices (left, right) sorted by (left, right)
+    """
+    keys = np.array([], dtype=np.int64)
+    for _ in range(max_rounds):
+        if len(keys) >= size:
+            break
+        left, right = draw(int((size - len(keys)) * 1.2) + 16)
+        lo, hi = np.minimum(left, right).astype(np.int64), np.maximum(left, right).astype(np.int64)
+        ok = (lo != hi) & accept(lo, hi)
+        keys = np.unique(np.concatenate([keys, lo[ok] * n_rows + hi[ok]]))
+    return choose_pairs(keys // n_rows, keys % n_rows, size, rng)
+
+
+def sample_contribution_pairs(df: pd.DataFrame, negatives_per_positive: float = 10, hard_fraction: float = 0.5,
+                              key: str = "soundex_last_name", seed: int = 0,
+                              max_enumerated: int = 10000000) -> pd.DataFrame:
+    """
+    creates all positive pairs and a sample of the negative pairs without enumerating the pair space,
+    the negatives are drawn by random index generation from two strata: hard negatives share the blocking key,
+    e.g. colliding names, easy negatives do not. Every pair gets the sample_weight of its stratum,
+    the number of pairs of the stratum divided by the number of sampled pairs, positives get 1
+    :param df: pd.DataFrame
+    :param negatives_per_positive: float, number of negative pairs per positive pair
+    :param hard_fraction: float, share of the hard negatives among the negatives
+    :param key: str, blocking key of the hard negatives, one of BLOCKING_KEYS
+    :param seed: int
+    :param max_enumerated: int, a densely sampled stratum of easy negatives is enumerated up to this number of pairs
+    :return: pd.DataFrame, see pair_frame, with the column sample_weight
+    """
+    if key not in BLOCKING_KEYS:
+        raise ValueError("Unknown blocking key '{}', choose one of {}".format(key, ", ".join(BLOCKING_KEYS)))
+    rng = np.random.default_rng(seed)
+    persons = person_codes(df)
+    blocks, _ = pd.factorize(BLOCKING_KEYS[key](df).replace("", np.nan).values)
+    n_rows = len(persons)
+
+    # sizes of the strata of the pairs (k, m) with k < m
+    n_positives = group_pair_count(persons)
+    same_block_person = np.where((blocks >= 0) & (persons >= 0), blocks * (persons.max(initial=0) + 1) + persons, -1)
+    n_hard = group_pair_count(blocks) - group_pair_count(pd.factorize(same_block_person)[0])
+    n_easy = n_rows * (n_rows - 1) // 2 - n_positives - n_hard
+
+    def negative(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        return (persons[lo] != persons[hi]) | (persons[lo] < 0)
+
+    def easy(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        return negative(lo, hi) & ((blocks[lo] != blocks[hi]) | (blocks[lo] < 0))
+
+    def uniform(size: int) -> Tuple[np.ndarray, np.ndarray]:
+        return rng.integers(0, n_rows, size), rng.integers(0, n_rows, size)
+
+    positive_left, positive_right = group_pair_indices(persons, self_pairs=True)
+    target = int(round(negatives_per_positive * len(positive_left)))
+    hard_size = min(int(round(target * hard_fraction)), n_hard)
+    easy_size = min(target - hard_size, n_easy)
+
+    # a stratum that is sampled densely is enumerated, rejection sampling would mostly draw known pairs
+    if 2 * hard_size >= n_hard:
+        left, right = group_pair_indices(blocks)
+        hard_left, hard_right = choose_pairs(left[negative(left, right)], right[negative(left, right)], hard_size, rng)
+    else:
+        hard_left, hard_right = draw_pairs(block_pair_sampler(blocks, rng), negative, hard_size, n_rows, rng)
+    if 2 * easy_size >= n_easy and n_rows * (n_rows - 1) // 2 <= max_enumerated:
+        left, right = np.triu_indices(n_rows, k=1)
+        easy_left, easy_right = choose_pairs(left[easy(left, right)], right[easy(left, right)], easy_size, rng)
+    else:
+        easy_left, easy_right = draw_pairs(uniform, easy, easy_size, n_rows, rng)
+    logger.logging.info(">>> Sampled {} of {} hard and {} of {} easy negative pairs for {} positive pairs".format(
+        len(hard_left), n_hard, len(easy_left), n_easy, len(positive_left)))
+
+    left = np.concatenate([positive_left, hard_left, easy_left])
+    right = np.concatenate([positive_right, hard_right, easy_right])
+    weights = np.concatenate([np.ones(len(positive_left)),
+                              np.full(len(hard_left), n_hard / max(len(hard_left), 1)),
+                              np.full(len(easy_left), n_easy / max(len(easy_left), 1))])
+    order = np.lexsort((right, left))
+    df_pairs = pair_frame(df, persons, left[order], right[order])
+    df_pairs["sample_weight"] = weights[order].astype(np.float32)
     return df_pairs
+
+
+def create_contribution_pairs(df: pd.DataFrame, n: int, blocking: dict = None, n_jobs: int = 1,
+                              sampling: dict = None) -> pd.DataFrame:
+    """
+    creates pairs of contributions, a pair is stored as the positional indices (left, right)
+    of the two contributions in df, the attributes are gathered from df on demand
+    :param df: pd.DataFrame
+    :param n: int, only take every nt-h negative pair into the traning set
+    :param blocking: dict, optional blocking configuration, if given only the candidate pairs
+    of the blocking stage are created instead of all pairs
+    :param n_jobs: int, number of worker processes that enumerate all pairs if no blocking is used
+    :param sampling: dict, optional parameters of sample_contribution_pairs, if given all positive pairs
+    and a stratified sample of the negative pairs are created instead, n and blocking are not used
+    :return df_pairs:  pd.DataFrame
+    """
+    if sampling:
+        return sample_contribution_pairs(df, **sampling)
+    persons = person_codes(df)
+    if blocking:
+        left, right = blocked_pair_indices(df, n, blocking)
+    elif n_jobs > 1:
+        left, right = all_pair_indices_parallel(persons, n, n_jobs)
+    else:
+        left, right = all_pair_indices(persons, n)
+    return pair_frame(df, persons, left, right)
+
+
+def iterate_contribution_pairs(df: pd.DataFrame, n: int, blocking: dict = None,
+                               batch_size: int = 1000000, sampling: dict = None) -> Iterator[pd.DataFrame]:
+    """
+    creates the same pairs as create_contribution_pairs as a stream of batches,
+    without blocking and sampling only the pairs of the current batch are held in memory
+    :param df: pd.DataFrame
+    :param n: int, only take every nt-h negative pair into the traning set
+    :param blocking: dict, optional blocking configuration
+    :param batch_size: int, number of pairs per batch, the last pairs of a contribution may exceed it
+    :param sampling: dict, optional parameters of sample_contribution_pairs
+    :return: Iterator[pd.DataFrame]
+    """
+    if sampling:
+        df_pairs = sample_contribution_pairs(df, **sampling)
+        for start in range(0, len(df_pairs), batch_size):
+            yield df_pairs.iloc[start:start + batch_size].reset_index(drop=True)
+        return
+
+    persons = person_codes(df)
+    if blocking:
+        left, right = blocked_pair_indices(df, n, blocking)
+        for start in range(0, len(left), batch_size):
+            yield pair_frame(df, persons, left[start:start + batch_size], right[start:start + batch_size])
+        return
+
+    counts_before = np.r_[0, np.cumsum(negative_pair_counts(persons))]
+    batch_left, batch_right, batch_length = [], [], 0
+    for k in range(len(persons)):
+        left, right = all_pair_indices(persons, n, start=k, stop=k + 1, count=int(counts_before[k]))
+        batch_left.append(left)
+        batch_right.append(right)
+        batch_length += len(left)
+        if batch_length >= batch_size:
+            yield pair_frame(df, persons, np.concatenate(batch_left), np.concatenate(batch_right))
+            batch_left, batch_right, batch_length = [], [], 0
+    if batch_length > 0:
+        yield pair_frame(df, persons, np.concatenate(batch_left), np.concatenate(batch_right))
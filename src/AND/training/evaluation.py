@@ -1,43 +1,135 @@
 import numpy as np
 import pandas as pd
-from collections import Counter
 from typing import Tuple, List
-from sklearn.metrics import classification_report
+from AND.utils.feature_store import FeatureStore
 
-__all__ = ['evaluate_profiles', 'estimate_classification_scores']
+__all__ = ['CLUSTERING_SCORES', 'evaluate_profiles', 'evaluate_clustering', 'clustering_scores', 'estimate_classification_scores', 'estimate_classification_scores_from_store']
 
 
-def evaluate_profiles(profiles: List[set], df_gt: pd.DataFrame) -> Tuple[float]:
+def profile_person_labels(profiles: List[set], df_gt: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Computes purity and fragmentation of the profiles
-    :param profiles: lsit[set]
-    :param df_gt: pd.DataFrame
-    :return: List[
+    integer labels of the contributions of the profiles, the profile index and the person code of every
+    contribution, a contribution id that appears more than once in the ground truth gets its last personId
+    :param profiles: List[set]
+    :param df_gt: pd.DataFrame, with the columns contributionId and personId
+    :return: Tuple[np.ndarray], profile labels and person labels
     """
-    mapping = {}
-    for contributionId, personsId in df_gt[["contributionId", "personId"]].values:
-        mapping[contributionId] = personsId
+    lengths = np.fromiter((len(profile) for profile in profiles), dtype=np.int64, count=len(profiles))
+    contribution_ids = pd.Index([contribution for profile in profiles for contribution in profile], dtype=object)
+    gt = df_gt.drop_duplicates("contributionId", keep="last")
+    positions = pd.Index(gt["contributionId"].values).get_indexer(contribution_ids)
+    if (positions < 0).any():
+        raise KeyError(contribution_ids[positions < 0][0])
+    persons, _ = pd.factorize(gt["personId"].values)
+    return np.repeat(np.arange(len(profiles), dtype=np.int64), lengths), persons[positions]
 
-    purities = []
-    for profile in profiles:
-        personIds = [mapping[contribution] for contribution in profile]
-        c = Counter(personIds)
-        purities.append(c.most_common(1)[0][1] / len(personIds))
 
-    mean_purity = float(np.mean(purities))
+# scores of clustering_scores
+CLUSTERING_SCORES = ["mean_purity", "mean_fragmentation", "bcubed_precision", "bcubed_recall", "bcubed_f1",
+                     "pairwise_precision", "pairwise_recall", "pairwise_f1"]
+
+
+def clustering_scores(profile_labels: np.ndarray, person_labels: np.ndarray) -> dict:
+    """
+    purity, fragmentation, B-cubed and pairwise precision, recall and F1 of a clustering,
+    all scores are computed from the contingency table of profiles and persons.
+    Precision and recall are 1 when there are no predicted or true pairs, all scores are NaN without contributions
+    :param profile_labels: np.ndarray, profile of every contribution
+    :param person_labels: np.ndarray, person of every contribution
+    :return: dict
+    """
+    if len(profile_labels) == 0:
+        return {name: float("nan") for name in CLUSTERING_SCORES}
+    _, profile_codes = np.unique(profile_labels, return_inverse=True)
+    _, person_codes = np.unique(person_labels, return_inverse=True)
+    n_persons = int(person_codes.max()) + 1
+    cells, counts = np.unique(profile_codes.astype(np.int64) * n_persons + person_codes, return_counts=True)
+    profile_of_cell, person_of_cell = np.divmod(cells, n_persons)
+    counts = counts.astype(np.float64)
 
-    personId_list = []
-    for profile in profiles:
-        personIds = set([mapping[contribution] for contribution in profile])
-        personId_list.extend(personIds)
+    profile_sizes = np.bincount(profile_codes).astype(np.float64)
+    person_sizes = np.bincount(person_codes).astype(np.float64)
+    largest_share = np.zeros(len(profile_sizes))
+    np.maximum.at(largest_share, profile_of_cell, counts)
+    n = float(len(profile_codes))
 
-    c = Counter(personId_list)
-    mean_fragmentation = float(np.mean(list(c.values())))
-    return mean_purity, mean_fragmentation
+    def f1(precision: float, recall: float) -> float:
+        return 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+
+    bcubed_precision = float((counts ** 2 / profile_sizes[profile_of_cell]).sum() / n)
+    bcubed_recall = float((counts ** 2 / person_sizes[person_of_cell]).sum() / n)
+    true_positives = (counts * (counts - 1) / 2).sum()
+    predicted_pairs = (profile_sizes * (profile_sizes - 1) / 2).sum()
+    true_pairs = (person_sizes * (person_sizes - 1) / 2).sum()
+    pairwise_precision = float(true_positives / predicted_pairs) if predicted_pairs > 0 else 1.0
+    pairwise_recall = float(true_positives / true_pairs) if true_pairs > 0 else 1.0
+
+    return {"mean_purity": float(np.mean(largest_share / profile_sizes)),
+            "mean_fragmentation": float(np.mean(np.bincount(person_of_cell, minlength=n_persons))),
+            "bcubed_precision": bcubed_precision,
+            "bcubed_recall": bcubed_recall,
+            "bcubed_f1": f1(bcubed_precision, bcubed_recall),
+            "pairwise_precision": pairwise_precision,
+            "pairwise_recall": pairwise_recall,
+            "pairwise_f1": f1(pairwise_precision, pairwise_recall)}
+
+
+def evaluate_clustering(profiles: List[set], df_gt: pd.DataFrame) -> dict:
+    """
+    Computes purity, fragmentation, B-cubed and pairwise scores of the profiles
+    :param profiles: List[set]
+    :param df_gt: pd.DataFrame
+    :return: dict
+    """
+    return clustering_scores(*profile_person_labels(profiles, df_gt))
+
+
+def evaluate_profiles(profiles: List[set], df_gt: pd.DataFrame) -> Tuple[float]:
+    """
+    Computes purity and fragmentation of the profiles
+    :param profiles: lsit[set]
+    :param df_gt: pd.DataFrame
+    :return: Tuple[float], mean purity and mean fragmentation
+    """
+    scores = evaluate_clustering(profiles, df_gt)
+    return scores["mean_purity"], scores["mean_fragmentation"]
 
 
 def estimate_classification_scores(df: pd.DataFrame) -> dict:
     y_true = df["same_person"].values
     y_pred = df["prediction"].values
+    from sklearn.metrics import classification_report
     results = classification_report(y_true, y_pred, output_dict=True)
     return results["macro avg"]
+
+
+def estimate_classification_scores_from_store(store: FeatureStore, batch_size: int = 1000000) -> dict:
+    """
+    macro averaged classification scores of the predictions in a feature store,
+    the confusion matrix is accumulated batch wise, the scores equal estimate_classification_scores
+    :param store: FeatureStore, with the columns same_person and prediction
+    :param batch_size: int
+    :return: dict
+    """
+    confusion = np.zeros((2, 2), dtype=np.int64)
+    for start, stop in store.iter_batches(batch_size):
+        y_true = np.asarray(store.column("same_person")[start:stop], dtype=np.int64)
+        y_pred = np.asarray(store.column("prediction")[start:stop], dtype=np.int64)
+        confusion += np.bincount(2 * y_true + y_pred, minlength=4).reshape(2, 2)
+
+    labels = [label for label in range(2) if confusion[label, :].sum() + confusion[:, label].sum() > 0]
+    precisions, recalls, f1_scores = [], [], []
+    for label in labels:
+        true_positives = confusion[label, label]
+        predicted = confusion[:, label].sum()
+        actual = confusion[label, :].sum()
+        precision = true_positives / predicted if predicted > 0 else 0.0
+        recall = true_positives / actual if actual > 0 else 0.0
+        precisions.append(precision)
+        recalls.append(recall)
+        f1_scores.append(2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0)
+
+    return {"precision": float(np.mean(precisions)),
+            "recall": float(np.mean(recalls)),
+            "f1-score": float(np.mean(f1_scores)),
+            "support": float(confusion.sum())}
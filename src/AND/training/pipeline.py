@@ -0,0 +1,252 @@
+import AND.model.cleaning as cleaning
+import AND.utils.logger as logger
+import AND.utils.profiling as profiling
+from AND.model.artifact import ModelArtifact, save_model
+from AND.model.feature_matrix import FEATURE_NAMES, SIMILARITY_FEATURES, compute_features_vectorized
+from AND.model.graph import cluster_by_probability, create_graph, create_profiles, get_disconnected_subgraphs
+from AND.model.precompute import ContributionCache
+from AND.model.rf_classifier import rfClassifier
+from AND.training.data_preparation import combine_data_sets, create_contribution_pairs, create_train_test
+from AND.training.evaluation import estimate_classification_scores, estimate_classification_scores_from_store, \
+    evaluate_clustering
+from AND.training.streaming import edges_from_store, featurize_to_store
+from AND.utils.checkpoint import CheckpointStore
+from AND.utils.data_loader import file_hash
+from AND.utils.file import FileUtil
+
+__all__ = ['STAGES', 'TrainingPipeline']
+
+# stages of the pipeline in the order they depend on each other
+STAGES = ["load", "clean", "compact", "split", "pair", "featurize", "cross_validation", "fit", "predict", "cluster",
+          "evaluate"]
+
+
+class TrainingPipeline:
+    """
+    The stages of the training pipeline as checkpoints, a stage is computed when it or a downstream stage is
+    resolved, so every step of the pipeline can run on its own, e.g. from a subcommand of the command line.
+    The report methods resolve a stage and write its results like a full training run does.
+    """
+
+    def __init__(self, config: dict, checkpoints: bool = None):
+        """
+        :param config: dict, see read_configurations
+        :param checkpoints: bool, enables or disables the checkpoints, by default the checkpoints section of config
+        """
+        self.config = config
+        self.file_util = FileUtil(config)
+        self.parallel = config.get("parallel", {})
+        self.streaming = config.get("streaming")
+        self.clustering = config.get("clustering", {})
+        self.batch_size = self.streaming.get("batch_size", 1000000) if self.streaming else None
+        # string similarities are only computed for the features the classifier uses
+        self.features = config["rfClassifier"]["features"]
+
+        # ----- record time, memory and throughput of the stages, written next to scores.pkl
+        self.profiler = profiling.activate(profiling.Profiler(
+            enabled=config.get("profiling", {}).get("enabled", False),
+            cprofile=config.get("profiling", {}).get("cprofile", False)))
+        self.profiler.start()
+
+        # every stage is keyed by the keys of its upstream stages and its config section,
+        # with checkpoints enabled a rerun only computes the stages whose inputs changed
+        if checkpoints is None:
+            checkpoints = config.get("checkpoints", {}).get("enabled", False)
+        self.checkpoints = CheckpointStore(self.file_util.checkpoint_path, enabled=checkpoints)
+        input_hashes = [file_hash(self.file_util.data_path), file_hash(self.file_util.gt_path)] \
+            if self.checkpoints.enabled else []
+
+        self.artifact = ModelArtifact(self.file_util.model_path)
+        self.reuse_model = bool(config.get("model", {}).get("reuse")) and \
+            self.artifact.is_compatible(config["rfClassifier"])
+
+        stage = self.checkpoints.stage
+        self.loaded = stage("load", self.load, input_hashes)
+        self.cleaned = stage("clean", self.clean, self.loaded, cleaning.CLEANING_VERSION)
+        self.compacted = stage("compact", self.compact, self.cleaned)
+        self.splitted = stage("split", self.split, self.compacted, config["train_test_split"])
+        self.paired = stage("pair", self.pair, self.splitted, config["left_out_negative_sample_rate"],
+                            config.get("blocking"), config.get("sampling"))
+        self.featurized = stage("featurize", self.featurize, self.paired, FEATURE_NAMES, self.streaming,
+                                [name for name in self.features if name in SIMILARITY_FEATURES])
+        self.cross_validated = stage("cross_validation", self.cross_validate, self.featurized,
+                                     config["rfClassifier"])
+        self.fitted = stage("fit", self.fit, self.featurized, config["rfClassifier"],
+                            self.artifact.meta["created"] if self.reuse_model else None)
+        self.predicted = stage("predict", self.predict, self.fitted, self.clustering.get("backend") == "probability")
+        self.clustered = stage("cluster", self.cluster, self.predicted, self.clustering)
+        self.evaluated = stage("evaluate", self.evaluate, self.clustered)
+
+    # ----- stages
+
+    def load(self):
+        logger.logging.info("## Loading data sets")
+        data, gt = self.file_util.read_data()
+        profiling.count(rows=len(data))
+        return data, gt
+
+    def clean(self):
+        data, gt = self.loaded.value
+        logger.logging.info("## Combine ground truth and contributions data")
+        df = combine_data_sets(data, gt)
+        logger.logging.info("## Cleaning the text data columns")
+        profiling.count(rows=len(df))
+        return cleaning.cleaning_procedure(df, n_jobs=self.parallel.get("n_jobs", 1))
+
+    def compact(self):
+        df = self.cleaned.value
+        logger.logging.info("## Compacting the cleaned contributions")
+        profiling.count(rows=len(df))
+        return cleaning.compact_contributions(df)
+
+    def split(self):
+        df = self.compacted.value
+        logger.logging.info("## Creating the train test split")
+        profiling.count(rows=len(df))
+        return create_train_test(df, list(df["personId"].unique()), ratio=self.config["train_test_split"])
+
+    def pair(self):
+        config = self.config
+        df_train, df_test = self.splitted.value
+        logger.logging.info("## Creating contribution pairs for train data set")
+        df_train_pairs = create_contribution_pairs(df_train, n=config["left_out_negative_sample_rate"],
+                                                   blocking=config.get("blocking"),
+                                                   n_jobs=self.parallel.get("n_jobs", 1),
+                                                   sampling=config.get("sampling"))
+        logger.logging.info("## Creating contribution pairs for test data set")
+        df_test_pairs = create_contribution_pairs(df_test, n=config["left_out_negative_sample_rate"],
+                                                  blocking=config.get("blocking"),
+                                                  n_jobs=self.parallel.get("n_jobs", 1))
+        profiling.count(pairs=len(df_train_pairs) + len(df_test_pairs))
+        return df_train_pairs, df_test_pairs
+
+    def featurize(self):
+        config = self.config
+        df_train, df_test = self.splitted.value
+        # ----- precompute the attributes of every contribution once
+        logger.logging.info("## Precomputing contribution attributes")
+        cache_train = ContributionCache(df_train)
+        cache_test = ContributionCache(df_test)
+
+        if self.streaming:
+            # ----- create contribution pairs and compute features batch wise into on-disk feature stores,
+            # with checkpoints every feature set gets its own store
+            path = self.file_util.feature_store_path + \
+                (self.featurized.key[:16] + "/" if self.checkpoints.enabled else "")
+            logger.logging.info("## Streaming pairs and features of training data set to the feature store")
+            train_data = featurize_to_store(df_train, cache_train, path + "train/",
+                                            n=config["left_out_negative_sample_rate"],
+                                            blocking=config.get("blocking"), batch_size=self.batch_size,
+                                            features=self.features, sampling=config.get("sampling"))
+            logger.logging.info("## Streaming pairs and features of test data set to the feature store")
+            test_data = featurize_to_store(df_test, cache_test, path + "test/",
+                                           n=config["left_out_negative_sample_rate"],
+                                           blocking=config.get("blocking"), batch_size=self.batch_size,
+                                           features=self.features)
+            profiling.count(rows=len(df_train) + len(df_test), pairs=len(train_data) + len(test_data))
+            return train_data, test_data
+
+        df_train_pairs, df_test_pairs = self.paired.value
+        logger.logging.info("## Computing features for training data set")
+        train_data = compute_features_vectorized(df_train_pairs, cache_train, n_jobs=self.parallel.get("n_jobs", 1),
+                                                 chunk_size=self.parallel.get("chunk_size", 1000000),
+                                                 features=self.features)
+        logger.logging.info("## Computing features for test data set")
+        test_data = compute_features_vectorized(df_test_pairs, cache_test, n_jobs=self.parallel.get("n_jobs", 1),
+                                                chunk_size=self.parallel.get("chunk_size", 1000000),
+                                                features=self.features)
+        profiling.count(pairs=len(train_data) + len(test_data))
+        return train_data, test_data
+
+    def cross_validate(self):
+        train_data = self.featurized.value[0]
+        logger.logging.info("## Running cross validation")
+        profiling.count(pairs=len(train_data))
+        return rfClassifier(self.config["rfClassifier"]).run_cross_validation(train_data)
+
+    def fit(self):
+        if self.reuse_model:
+            logger.logging.info("## Loading the saved random forest model")
+            return self.artifact.classifier
+        train_data = self.featurized.value[0]
+        logger.logging.info("## Fitting random forest model")
+        profiling.count(pairs=len(train_data))
+        clfObject = rfClassifier(self.config["rfClassifier"])
+        clfObject.fit_classifier(train_data)
+        save_model(clfObject, self.file_util.model_path)
+        return clfObject
+
+    def predict(self):
+        df_train, df_test = self.splitted.value
+        test_data = self.featurized.value[1]
+        clfObject = self.fitted.value
+        logger.logging.info("## Predicting the contribution pairs")
+        profiling.count(pairs=len(test_data))
+        if self.streaming:
+            clfObject.predict_store(test_data, batch_size=self.batch_size)
+            df_edges = edges_from_store(test_data, df_test["contribution_id"].values, self.batch_size,
+                                        all_pairs=self.clustering.get("backend") == "probability")
+            nodes = list(df_test["contribution_id"].unique())
+            scores = estimate_classification_scores_from_store(test_data, batch_size=self.batch_size)
+        else:
+            test_data = clfObject.predict(test_data)
+            df_edges, nodes = test_data, None
+            scores = estimate_classification_scores(test_data)
+        return df_edges, nodes, scores
+
+    def cluster(self):
+        clustering = self.clustering
+        df_edges, nodes, scores = self.predicted.value
+        # ----- create author profiles -> find the connected components of the contributions
+        logger.logging.info("## Creating the author profiles")
+        profiling.count(pairs=len(df_edges))
+        if clustering.get("backend") == "networkx":
+            return get_disconnected_subgraphs(create_graph(df_edges, nodes=nodes))
+        elif clustering.get("backend") == "probability":
+            return cluster_by_probability(df_edges,
+                                          threshold=clustering.get("threshold", 0.5),
+                                          linkage=clustering.get("linkage", "single"),
+                                          max_cluster_size=clustering.get("max_cluster_size"),
+                                          nodes=nodes)
+        return create_profiles(df_edges, nodes=nodes)
+
+    def evaluate(self):
+        profiles, gt = self.clustered.value, self.loaded.value[1]
+        logger.logging.info("## Evaluating test set results")
+        profiling.count(rows=len(profiles))
+        return evaluate_clustering(profiles, gt)
+
+    # ----- reports
+
+    def report_training(self, cross_validation: bool = True) -> None:
+        """
+        evaluates the random forest with cross validation and fits it on the full training data set
+        :param cross_validation: bool, run the cross validation, it is skipped when a saved model is reused
+        :return: None
+        """
+        if cross_validation and not self.reuse_model:
+            cv_scores = self.cross_validated.value
+            self.file_util.report_cv_scores(cv_scores)
+            logger.logging.info("Cross validation f1-sores are: {}".format(' '.join(map(str, cv_scores["test_f1"]))))
+        self.file_util.report_feature_importances(self.fitted.value.importances)
+
+    def report_predictions(self) -> None:
+        scores = self.predicted.value[2]
+        logger.logging.info("Classification precision {:.4f}, recall {:.4f}, f1-score {:.4f}".format(
+            scores["precision"], scores["recall"], scores["f1-score"]))
+
+    def report_profiles(self) -> None:
+        profiles = self.clustered.value
+        self.file_util.report_profiles(profiles, self.splitted.value[1])
+        logger.logging.info(">>> Created " + str(len(profiles)) + " author profiles")
+
+    def report_evaluation(self) -> None:
+        clustering_scores = self.evaluated.value
+        self.file_util.report_test_results(clustering_scores["mean_purity"], clustering_scores["mean_fragmentation"],
+                                           self.predicted.value[2], clustering_scores=clustering_scores)
+        logger.logging.info("B-cubed f1-score is {:.4f}, pairwise f1-score is {:.4f}".format(
+            clustering_scores["bcubed_f1"], clustering_scores["pairwise_f1"]))
+
+    def write_profile(self) -> None:
+        self.profiler.stop()
+        self.profiler.write(self.file_util.results_test_path)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from typing import List
+import AND.utils.logger as logger
+from AND.model.feature_matrix import FEATURE_NAMES, compute_feature_matrix, stored_features
+from AND.model.precompute import ContributionCache
+from AND.training.data_preparation import iterate_contribution_pairs
+from AND.utils.feature_store import FeatureStore
+
+__all__ = ['featurize_to_store', 'edges_from_store']
+
+
+def featurize_to_store(df: pd.DataFrame, cache: ContributionCache, path: str, n: int, blocking: dict = None,
+                       batch_size: int = 1000000, features: List[str] = None, sampling: dict = None) -> FeatureStore:
+    """
+    creates the contribution pairs batch wise, computes their features and appends them to an on-disk
+    feature store with the columns of stored_features, only one batch of pairs is held in memory. Only the featurization and the prediction are
+    streamed, the cross validation and the fit load the training matrix, see rfClassifier.get_training_data
+    :param df: pd.DataFrame, cleaned contributions
+    :param cache: ContributionCache, precomputed attributes of df
+    :param path: str, directory of the feature store
+    :param n: int, only take every nt-h negative pair
+    :param blocking: dict, optional blocking configuration
+    :param batch_size: int, number of pairs per batch
+    :param features: List[str], optional features that are needed, see compute_feature_matrix
+    :param sampling: dict, optional parameters of sample_contribution_pairs
+    :return: FeatureStore
+    """
+    names = stored_features(features)
+    positions = [FEATURE_NAMES.index(name) for name in names]
+    store = FeatureStore.create(path, names)
+    for df_pairs in iterate_contribution_pairs(df, n, blocking=blocking, batch_size=batch_size, sampling=sampling):
+        matrix = compute_feature_matrix(df_pairs, cache, batch_size=batch_size, features=features)[:, positions]
+        columns = {"left": df_pairs["left"].values.astype(np.int64),
+                   "right": df_pairs["right"].values.astype(np.int64),
+                   "same_person": df_pairs["same_person"].values.astype(np.int8),
+                   "person_group": df_pairs["person_group"].values.astype(np.int64),
+                   "person_group_2nd": df_pairs["person_group_2nd"].values.astype(np.int64)}
+        if "sample_weight" in df_pairs.columns:
+            columns["sample_weight"] = df_pairs["sample_weight"].values.astype(np.float32)
+        store.append(columns, matrix)
+        logger.logging.info(">>> Stored features of " + str(len(store)) + " pairs")
+    return store
+
+
+def edges_from_store(store: FeatureStore, contribution_ids: np.ndarray, batch_size: int = 1000000,
+                     all_pairs: bool = False) -> pd.DataFrame:
+    """
+    collects the positively predicted pairs of a feature store, the pairs are read batch wise but all collected
+    pairs are held in memory, with all_pairs every pair of the store
+    :param store: FeatureStore, with the columns prediction and probability
+    :param contribution_ids: np.ndarray, contribution_id of the contributions the pair indices refer to
+    :param batch_size: int
+    :param all_pairs: bool, collect all pairs instead of the positive pairs, e.g. for average linkage clustering
+    :return: pd.DataFrame, with the columns contribution_id, contribution_id_2nd, prediction and probability
+    """
+    edges = []
+    for start, stop in store.iter_batches(batch_size):
+        predictions = np.asarray(store.column("prediction")[start:stop])
+        selected = np.ones(len(predictions), dtype=bool) if all_pairs else predictions == 1
+        edges.append(pd.DataFrame({
+            "contribution_id": contribution_ids.take(np.asarray(store.column("left")[start:stop])[selected]),
+            "contribution_id_2nd": contribution_ids.take(np.asarray(store.column("right")[start:stop])[selected]),
+            "prediction": predictions[selected],
+            "probability": np.asarray(store.column("probability")[start:stop])[selected],
+        }))
+    if not edges:
+        return pd.DataFrame(columns=["contribution_id", "contribution_id_2nd", "prediction", "probability"])
+    return pd.concat(edges, ignore_index=True)
@@ -0,0 +1,231 @@
+import time
+import itertools
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from typing import Dict, List
+import AND.model.cleaning as cleaning
+import AND.utils.logger as logger
+from AND.model.feature_matrix import compute_features_vectorized, stored_features
+from AND.model.precompute import ContributionCache
+from AND.training.data_preparation import combine_data_sets, create_contribution_pairs, create_train_test, \
+    person_codes
+from AND.training.evaluation import clustering_scores, estimate_classification_scores
+from AND.utils.checkpoint import CheckpointStore
+from AND.utils.data_loader import file_hash
+from AND.utils.file import FileUtil
+from AND.utils.helpers import read_configurations
+from AND.utils.parallel import SharedArrays, attach_shared_arrays, release_shared_arrays, run_in_pool
+
+__all__ = ['sweep_trials', 'sweep_features', 'run_trial', 'run_sweep']
+
+def sweep_trials(sweep: dict) -> List[dict]:
+    """
+    the trials of a sweep, every trial is one combination of max_depth, n_estimators and
+    left_out_negative_sample_rate, the thresholds are evaluated within the trials
+    :param sweep: dict, sweep configuration with the search (grid or random), n_trials, seed and the space,
+    a dict of lists of values
+    :return: List[dict]
+    """
+    space = {name: values for name, values in sweep["space"].items() if name != "threshold"}
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+    if sweep.get("search", "grid") == "grid":
+        return grid
+    if sweep.get("search") != "random":
+        raise ValueError("Unknown search '{}', choose grid or random".format(sweep.get("search")))
+    rng = np.random.default_rng(sweep.get("seed", 0))
+    n_trials = min(sweep.get("n_trials", 10), len(grid))
+    return [grid[k] for k in sorted(rng.choice(len(grid), size=n_trials, replace=False))]
+
+
+def sweep_features(df: pd.DataFrame, n: int, blocking: dict = None,
+                   features: List[str] = None) -> Dict[str, np.ndarray]:
+    """
+    pairs and features of a data set for one negative sample rate as flat arrays
+    :param df: pd.DataFrame, cleaned contributions
+    :param n: int, only take every nt-h negative pair
+    :param blocking: dict, optional blocking configuration
+    :param features: List[str], optional features that are needed, see compute_feature_matrix
+    :return: Dict[str, np.ndarray], the feature matrix of stored_features, labels, groups and pair indices
+    """
+    df_pairs = compute_features_vectorized(create_contribution_pairs(df, n=n, blocking=blocking),
+                                           ContributionCache(df), features=features)
+    return {"X": df_pairs[stored_features(features)].to_numpy(dtype=np.float32),
+            "y": df_pairs["same_person"].to_numpy(dtype=np.int8),
+            "left": df_pairs["left"].to_numpy(dtype=np.int64),
+            "right": df_pairs["right"].to_numpy(dtype=np.int64)}
+
+
+def pair_arrays(df_fit: pd.DataFrame, df_eval: pd.DataFrame, rate: int, blocking: dict = None,
+                features: List[str] = None) -> Dict[str, np.ndarray]:
+    """
+    features of the data set a trial is fitted on and of the data set it is evaluated on, see sweep_features
+    :param df_fit: pd.DataFrame, cleaned contributions the forest is fitted on
+    :param df_eval: pd.DataFrame, cleaned contributions the forest is evaluated on
+    :param rate: int, only take every nt-h negative pair
+    :param blocking: dict, optional blocking configuration
+    :param features: List[str], optional features that are needed, see compute_feature_matrix
+    :return: Dict[str, np.ndarray], the arrays of sweep_features prefixed with fit_ and eval_ and eval_persons
+    """
+    logger.logging.info("## Computing pairs and features for sample rate " + str(rate))
+    arrays = {}
+    for prefix, df in (("fit_", df_fit), ("eval_", df_eval)):
+        arrays.update({prefix + name: values for name, values in sweep_features(df, rate, blocking, features).items()})
+    arrays["eval_persons"] = person_codes(df_eval)
+    return arrays
+
+
+def run_trial(descriptors: dict, trial: dict, thresholds: List[float], features: List[str]) -> List[dict]:
+    """
+    fits a random forest on the shared fit features and evaluates it on the shared evaluation features
+    for every threshold, module level so it can run in a worker process
+    :param descriptors: dict, descriptors of the shared arrays of pair_arrays
+    :param trial: dict, parameters of the trial
+    :param thresholds: List[float], decision thresholds on the probability of the same person
+    :param features: List[str], features used by the classifier
+    :return: List[dict], one result row per threshold
+    """
+    # sklearn is only imported where a forest is fitted, it dominates the import time of the package
+    from sklearn.ensemble import RandomForestClassifier
+
+    arrays, handles = attach_shared_arrays(descriptors)
+    try:
+        columns = [stored_features(features).index(name) for name in features]
+        start = time.perf_counter()
+        clf = RandomForestClassifier(max_depth=trial["max_depth"], n_estimators=trial["n_estimators"],
+                                     random_state=0)
+        clf.fit(arrays["fit_X"][:, columns], arrays["fit_y"])
+        fit_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        probabilities = clf.predict_proba(arrays["eval_X"][:, columns])
+        probabilities = probabilities[:, list(clf.classes_).index(1)] if 1 in clf.classes_ \
+            else np.zeros(len(probabilities))
+        predict_seconds = time.perf_counter() - start
+
+        y_eval = np.array(arrays["eval_y"])
+        left, right = np.array(arrays["eval_left"]), np.array(arrays["eval_right"])
+        persons = np.array(arrays["eval_persons"])
+        # contributions without personId are persons of their own as in pair_frame, the shared code -1
+        # would count them as one person
+        missing = np.flatnonzero(persons < 0)
+        persons[missing] = persons.max(initial=-1) + 1 + np.arange(len(missing))
+        rows = []
+        for threshold in thresholds:
+            start = time.perf_counter()
+            predictions = (probabilities >= threshold).astype(np.int8)
+            scores = estimate_classification_scores(pd.DataFrame({"same_person": y_eval, "prediction": predictions}))
+            positive = predictions == 1
+            graph = coo_matrix((np.ones(int(positive.sum())), (left[positive], right[positive])),
+                               shape=(len(persons), len(persons)))
+            _, labels = connected_components(graph, directed=False)
+            rows.append(dict(trial, threshold=threshold,
+                             precision=scores["precision"], recall=scores["recall"], f1=scores["f1-score"],
+                             **clustering_scores(labels, persons),
+                             fit_seconds=fit_seconds, predict_seconds=predict_seconds,
+                             cluster_seconds=time.perf_counter() - start))
+        return rows
+    finally:
+        release_shared_arrays(arrays, handles)
+
+
+def run_sweep():
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("Start hyperparameter sweep")
+    logger.logging.info("##----------------------------------------")
+
+    logger.logging.info("## Loading config file")
+    config = read_configurations()
+    file_util = FileUtil(config)
+    sweep = config["sweep"]
+    parallel = config.get("parallel", {})
+    checkpoints = CheckpointStore(file_util.checkpoint_path, enabled=config.get("checkpoints", {}).get("enabled", False))
+    input_hashes = [file_hash(file_util.data_path), file_hash(file_util.gt_path)] if checkpoints.enabled else []
+
+    validation_split = sweep.get("validation_split", 0.75)
+
+    def split():
+        logger.logging.info("## Loading, cleaning and splitting the data sets")
+        data, gt = file_util.read_data()
+        df = cleaning.cleaning_procedure(combine_data_sets(data, gt), n_jobs=parallel.get("n_jobs", 1))
+        df = cleaning.compact_contributions(df)
+        df_train, df_test = create_train_test(df, list(df["personId"].unique()), ratio=config["train_test_split"])
+        # the trials are selected on a validation split of the training persons, the test split is only used
+        # to report the scores of the selected trial
+        df_fit, df_validation = create_train_test(df_train, list(df_train["personId"].unique()),
+                                                  ratio=validation_split)
+        return df_fit, df_validation, df_train, df_test
+
+    splitted = checkpoints.stage("sweep_split", split, input_hashes, cleaning.CLEANING_VERSION,
+                                 config["train_test_split"], validation_split)
+
+    trials = sweep_trials(sweep)
+    defaults = dict(max_depth=config["rfClassifier"]["max_depth"],
+                    n_estimators=config["rfClassifier"]["n_estimators"],
+                    left_out_negative_sample_rate=config["left_out_negative_sample_rate"])
+    trials = [dict(defaults, **trial) for trial in trials]
+    thresholds = sweep["space"].get("threshold", [0.5])
+    logger.logging.info(">>> Running " + str(len(trials)) + " trials with " + str(len(thresholds)) + " thresholds")
+
+    # ----- compute pairs and features once per sample rate and share them with the trials
+    features = config["rfClassifier"]["features"]
+    shared, feature_seconds = {}, {}
+    try:
+        for rate in sorted(set(trial["left_out_negative_sample_rate"] for trial in trials)):
+            def featurize() -> Dict[str, np.ndarray]:
+                df_fit, df_validation, _, _ = splitted.value
+                return pair_arrays(df_fit, df_validation, rate, blocking=config.get("blocking"), features=features)
+
+            start = time.perf_counter()
+            arrays = checkpoints.stage("sweep_features", featurize, splitted, rate, config.get("blocking"),
+                                       stored_features(features)).value
+            feature_seconds[rate] = time.perf_counter() - start
+            shared[rate] = SharedArrays(arrays)
+
+        logger.logging.info("## Running the trials on the validation split")
+        tasks = [(shared[trial["left_out_negative_sample_rate"]].descriptors, trial, thresholds, features)
+                 for trial in trials]
+        if sweep.get("n_jobs", 1) > 1:
+            results = run_in_pool(run_trial, tasks, sweep["n_jobs"])
+        else:
+            results = [run_trial(*task) for task in tasks]
+    finally:
+        for arrays in shared.values():
+            arrays.close()
+
+    df_results = pd.DataFrame([dict(row, trial=k, feature_seconds=feature_seconds[row["left_out_negative_sample_rate"]])
+                               for k, rows in enumerate(results) for row in rows])
+    df_results = df_results.sort_values("bcubed_f1", ascending=False, kind="stable").reset_index(drop=True)
+    best = df_results.iloc[0].to_dict()
+    logger.logging.info("Best trial on the validation split: {}".format(best))
+
+    # ----- refit the selected trial on the whole training split and evaluate it once on the test split
+    logger.logging.info("## Evaluating the best trial on the test split")
+    trial = trials[int(best["trial"])]
+
+    def featurize_test() -> Dict[str, np.ndarray]:
+        _, _, df_train, df_test = splitted.value
+        return pair_arrays(df_train, df_test, trial["left_out_negative_sample_rate"], blocking=config.get("blocking"),
+                           features=features)
+
+    arrays = SharedArrays(checkpoints.stage("sweep_test_features", featurize_test, splitted,
+                                            trial["left_out_negative_sample_rate"], config.get("blocking"),
+                                            stored_features(features)).value)
+    try:
+        test_scores = run_trial(arrays.descriptors, trial, [best["threshold"]], features)[0]
+    finally:
+        arrays.close()
+    file_util.report_sweep_results(df_results, test_scores)
+    logger.logging.info("Test scores of the best trial: {}".format(test_scores))
+
+    logger.logging.info("##----------------------------------------")
+    logger.logging.info("Completed successfully")
+    logger.logging.info("##----------------------------------------")
+    return df_results
+
+
+if __name__ == "__main__":
+    logger.setup_logging()
+    run_sweep()
@@ -0,0 +1,101 @@
+import os
+import json
+import pickle
+import hashlib
+from typing import Any, Callable
+import AND.utils.logger as logger
+import AND.utils.profiling as profiling
+
+__all__ = ['Checkpoint', 'CheckpointStore', 'fingerprint']
+
+
+def fingerprint(*parts) -> str:
+    """
+    content hash of json serializable parts, e.g. config sections, file hashes and keys of upstream stages
+    :param parts: json serializable values
+    :return: str, hex digest
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    """
+    Result of a pipeline stage. The key is derived from the keys of the upstream stages and the stage inputs,
+    the value is computed or read from the checkpoint file on first access, so a stage whose downstream stages
+    are all checkpointed is never computed nor read.
+    """
+
+    def __init__(self, store: 'CheckpointStore', stage: str, key: str, function: Callable[[], Any]):
+        self.store = store
+        self.stage = stage
+        self.key = key
+        self.function = function
+        self.done = False
+        self._value = None
+
+    @property
+    def value(self) -> Any:
+        if not self.done:
+            self._value = self.store.load_or_compute(self.stage, self.key, self.function)
+            self.done = True
+        return self._value
+
+
+class CheckpointStore:
+    """
+    Pickled stage results in a directory, the file of a stage is named after the stage and its key.
+    When disabled, stages are computed on every run and nothing is written.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+
+    def file(self, stage: str, key: str) -> str:
+        """
+        checkpoint file of a stage
+        :param stage: str
+        :param key: str
+        :return: str
+        """
+        return os.path.join(self.path, "{}-{}.pkl".format(stage, key[:16]))
+
+    def stage(self, stage: str, function: Callable[[], Any], *inputs) -> Checkpoint:
+        """
+        declares a stage
+        :param stage: str, name of the stage
+        :param function: Callable, computes the result of the stage, reads upstream results with .value
+        :param inputs: upstream Checkpoints and json serializable inputs, e.g. the config section of the stage
+        :return: Checkpoint
+        """
+        key = fingerprint(stage, *[i.key if isinstance(i, Checkpoint) else i for i in inputs])
+        return Checkpoint(self, stage, key, function)
+
+    def load_or_compute(self, stage: str, key: str, function: Callable[[], Any]) -> Any:
+        """
+        reads the checkpoint of a stage or computes the stage and writes its checkpoint
+        :param stage: str
+        :param key: str
+        :param function: Callable
+        :return: Any
+        """
+        file = self.file(stage, key)
+        with profiling.stage(stage) as record:
+            if self.enabled and os.path.exists(file):
+                try:
+                    with open(file, "rb") as handle:
+                        value = pickle.load(handle)
+                    logger.logging.info(">>> Reusing checkpoint of stage " + stage)
+                    record["checkpoint"] = "loaded"
+                    return value
+                except (OSError, EOFError, pickle.UnpicklingError) as error:
+                    logger.logging.info(">>> Could not read checkpoint of stage " + stage + ": " + str(error))
+
+            value = function()
+            record["checkpoint"] = "computed"
+        if self.enabled:
+            os.makedirs(self.path, exist_ok=True)
+            with open(file + ".tmp", "wb") as handle:
+                pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(file + ".tmp", file)
+        return value
@@ -0,0 +1,175 @@
+import os
+import gc
+import hashlib
+import numpy as np
+import pandas as pd
+from typing import Iterator, List
+import AND.utils.logger as logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+__all__ = ['CONTRIBUTION_COLUMNS', 'GROUND_TRUTH_COLUMNS', 'file_hash', 'read_json_columns', 'iterate_json_chunks',
+           'load_table']
+
+CONTRIBUTION_COLUMNS = ['contribution_id',
+                        'first_name',
+                        'middle_name',
+                        'last_name',
+                        'full_name',
+                        'workplace',
+                        'workplace_locations',
+                        'focus_areas',
+                        'gpes',
+                        'orgs']
+
+GROUND_TRUTH_COLUMNS = ['contributionId',
+                        'personId']
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """
+    sha1 of the content of a file, read block wise
+    :param path: str
+    :param block_size: int, bytes per read
+    :return: str, hex digest
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_json_lines(path: str) -> bool:
+    """
+    whether a file holds one JSON record per line, decided by the file extension
+    :param path: str
+    :return: bool
+    """
+    return path.endswith((".jsonl", ".ndjson"))
+
+
+def read_json_columns(path: str, columns: List[str] = None, chunksize: int = 100000) -> pd.DataFrame:
+    """
+    reads columns of a JSON file, JSON Lines files are streamed in chunks of chunksize records
+    and only the requested columns of every chunk are kept
+    :param path: str
+    :param columns: List[str], optional columns to load
+    :param chunksize: int, records per chunk of a JSON Lines file
+    :return: pd.DataFrame
+    """
+    if not is_json_lines(path):
+        df = pd.read_json(path)
+        return df if columns is None else df[columns]
+    chunks = [chunk if columns is None else chunk[columns]
+              for chunk in pd.read_json(path, lines=True, chunksize=chunksize)]
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def iterate_json_chunks(path: str, columns: List[str] = None, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+    """
+    iterates over the chunks of a JSON Lines file without holding the whole file in memory,
+    a plain JSON file is read at once and yielded as a single chunk
+    :param path: str
+    :param columns: List[str], optional columns to load
+    :param chunksize: int, records per chunk of a JSON Lines file
+    :return: Iterator[pd.DataFrame]
+    """
+    if not is_json_lines(path):
+        yield read_json_columns(path, columns, chunksize)
+        return
+    for chunk in pd.read_json(path, lines=True, chunksize=chunksize):
+        yield chunk if columns is None else chunk[columns]
+
+
+def write_parquet(df: pd.DataFrame, path: str) -> None:
+    """
+    writes a data frame to a parquet file, the file is renamed into place once complete
+    :param df: pd.DataFrame
+    :param path: str
+    :return: None
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def arrow_to_python(array) -> list:
+    """
+    python values of an arrow array, nested lists are rebuilt from the flat values and the offsets
+    which is much faster than converting every row on its own
+    :param array: pyarrow.Array
+    :return: list
+    """
+    if pa.types.is_list(array.type) or pa.types.is_large_list(array.type):
+        offsets = array.offsets.to_numpy()
+        offsets = (offsets - offsets[0]).tolist()
+        values = arrow_to_python(array.flatten())
+        rows = [values[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+        if array.null_count > 0:
+            for k in np.flatnonzero(array.is_null().to_numpy(zero_copy_only=False)):
+                rows[k] = None
+        return rows
+    return array.to_numpy(zero_copy_only=False).tolist()
+
+
+def read_parquet(path: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+    reads a parquet file written by write_parquet, list columns are converted back to python lists
+    so the data frame equals the one read from JSON
+    :param path: str
+    :param columns: List[str], optional columns to load
+    :return: pd.DataFrame
+    """
+    table = pq.read_table(path, columns=columns)
+    data = {}
+    # the rebuilt lists hold no reference cycles, pausing the garbage collector avoids repeated collections
+    # triggered by the millions of new list objects
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for name, column in zip(table.column_names, table.columns):
+            if pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+                values = np.empty(len(column), dtype=object)
+                values[:] = arrow_to_python(column.combine_chunks())
+                data[name] = values
+            else:
+                data[name] = column.to_pandas()
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return pd.DataFrame(data)
+
+
+def load_table(path: str, columns: List[str] = None, cache_path: str = None, chunksize: int = 100000) -> pd.DataFrame:
+    """
+    loads columns of a JSON or JSON Lines file, the first load converts the file into a parquet cache
+    keyed by the hash of the file content, later loads read the cache
+    :param path: str, JSON file
+    :param columns: List[str], optional columns to load
+    :param cache_path: str, optional cache directory, no caching without it or without pyarrow
+    :param chunksize: int, records per chunk of a JSON Lines file
+    :return: pd.DataFrame
+    """
+    if cache_path is None or pq is None:
+        return read_json_columns(path, columns, chunksize)
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_file = os.path.join(cache_path, "{}-{}.parquet".format(stem, file_hash(path)[:16]))
+    if os.path.exists(cache_file):
+        cached_columns = pq.read_schema(cache_file).names
+        if columns is None or all(col in cached_columns for col in columns):
+            logger.logging.info(">>> Reading cached " + cache_file)
+            return read_parquet(cache_file, columns)
+
+    df = read_json_columns(path, columns, chunksize)
+    write_parquet(df, cache_file)
+    logger.logging.info(">>> Cached " + path + " as " + cache_file)
+    return df
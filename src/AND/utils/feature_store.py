@@ -0,0 +1,162 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Tuple
+
+__all__ = ['FeatureStore']
+
+
+class FeatureStore:
+    """
+    On-disk columnar store of the pairwise contributions and their feature matrix.
+    Every column is a raw binary file that is appended batch by batch and read back as a memory map,
+    the feature matrix is stored row major as float32. meta.json holds the number of rows,
+    the feature names and the dtypes of the columns.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as handle:
+            meta = json.load(handle)
+        self.n_rows = meta["n_rows"]
+        self.feature_names = meta["feature_names"]
+        self.dtypes = meta["dtypes"]
+
+    @classmethod
+    def create(cls, path: str, feature_names: List[str]) -> 'FeatureStore':
+        """
+        creates an empty store, an existing store in path is overwritten
+        :param path: str, directory of the store
+        :param feature_names: List[str], names of the columns of the feature matrix
+        :return: FeatureStore
+        """
+        os.makedirs(path, exist_ok=True)
+        for file in os.listdir(path):
+            if file.endswith(".bin") or file == "meta.json":
+                os.remove(os.path.join(path, file))
+        store = cls.__new__(cls)
+        store.path = path
+        store.n_rows = 0
+        store.feature_names = list(feature_names)
+        store.dtypes = {"features": "<f4"}
+        store.flush()
+        return store
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def __reduce__(self):
+        # a pickled store is reopened from disk, so it sees columns written after it was pickled
+        return FeatureStore, (self.path,)
+
+    def file(self, name: str) -> str:
+        """
+        path of the binary file of a column
+        :param name: str
+        :return: str
+        """
+        return os.path.join(self.path, name + ".bin")
+
+    def flush(self) -> None:
+        """
+        writes the meta data of the store
+        :return: None
+        """
+        meta = dict(n_rows=self.n_rows, feature_names=self.feature_names, dtypes=self.dtypes)
+        with open(os.path.join(self.path, "meta.json"), "w") as handle:
+            json.dump(meta, handle)
+
+    def append(self, columns: Dict[str, np.ndarray], features: np.ndarray) -> None:
+        """
+        appends a batch of pairs to the store
+        :param columns: Dict[str, np.ndarray], one dimensional columns of the batch, e.g. left, right, same_person
+        :param features: np.ndarray, feature matrix of the batch
+        :return: None
+        """
+        for name, values in columns.items():
+            dtype = self.dtypes.setdefault(name, np.asarray(values).dtype.str)
+            with open(self.file(name), "ab") as handle:
+                np.ascontiguousarray(values, dtype=dtype).tofile(handle)
+        with open(self.file("features"), "ab") as handle:
+            np.ascontiguousarray(features, dtype=np.float32).tofile(handle)
+        self.n_rows += len(features)
+        self.flush()
+
+    def write_column(self, name: str, values: np.ndarray, start: int = 0) -> None:
+        """
+        writes (part of) a column that is computed after the pairs were stored, e.g. the predictions
+        :param name: str, name of the column
+        :param values: np.ndarray, values of the rows start:start + len(values)
+        :param start: int, first row
+        :return: None
+        """
+        values = np.asarray(values)
+        if self.n_rows == 0:
+            return
+        if name not in self.dtypes:
+            self.dtypes[name] = values.dtype.str
+            np.memmap(self.file(name), dtype=self.dtypes[name], mode="w+", shape=(self.n_rows,)).flush()
+            self.flush()
+        column = np.memmap(self.file(name), dtype=self.dtypes[name], mode="r+", shape=(self.n_rows,))
+        column[start:start + len(values)] = values
+        column.flush()
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        memory map of a column
+        :param name: str
+        :return: np.ndarray
+        """
+        if self.n_rows == 0:
+            return np.array([], dtype=self.dtypes[name])
+        return np.memmap(self.file(name), dtype=self.dtypes[name], mode="r", shape=(self.n_rows,))
+
+    def features(self, names: List[str] = None, start: int = 0, stop: int = None,
+                 rows: np.ndarray = None) -> np.ndarray:
+        """
+        memory map of the rows start:stop of the feature matrix, or an in-memory copy of the selected feature columns
+        and rows, only the selected rows are read from disk
+        :param names: List[str], optional feature names
+        :param start: int
+        :param stop: int
+        :param rows: np.ndarray, optional sorted positions of the rows within start:stop
+        :return: np.ndarray
+        """
+        if self.n_rows == 0:
+            matrix = np.empty((0, len(self.feature_names)), dtype=np.float32)
+        else:
+            matrix = np.memmap(self.file("features"), dtype=np.float32, mode="r",
+                               shape=(self.n_rows, len(self.feature_names)))[start:stop]
+        columns = list(range(len(self.feature_names))) if names is None else \
+            [self.feature_names.index(name) for name in names]
+        if rows is not None:
+            return matrix[np.ix_(rows, columns)]
+        if names is None:
+            return matrix
+        return matrix[:, columns]
+
+    def iter_batches(self, batch_size: int) -> Iterator[Tuple[int, int]]:
+        """
+        row ranges of the batches of the store
+        :param batch_size: int
+        :return: Iterator[Tuple[int, int]], (start, stop)
+        """
+        for start in range(0, self.n_rows, batch_size):
+            yield start, min(start + batch_size, self.n_rows)
+
+    def to_frame(self, columns: List[str], start: int = 0, stop: int = None) -> pd.DataFrame:
+        """
+        loads columns of the rows start:stop into a data frame
+        :param columns: List[str], names of columns or features
+        :param start: int
+        :param stop: int
+        :return: pd.DataFrame
+        """
+        data = {}
+        for name in columns:
+            if name in self.feature_names:
+                data[name] = self.features([name], start, stop)[:, 0]
+            else:
+                data[name] = np.array(self.column(name)[start:stop])
+        return pd.DataFrame(data)
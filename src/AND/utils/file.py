@@ -3,6 +3,8 @@ from pathlib import Path
 from typing import List
 import pandas as pd
 import AND.utils.logger as logger
+from AND.utils.data_loader import CONTRIBUTION_COLUMNS, GROUND_TRUTH_COLUMNS, load_table
+from AND.utils.profile_store import ProfileStore
 import pickle
 
 __all__ = ['FileUtil']
@@ -17,18 +19,34 @@ class FileUtil:
         self.persons_path = os.path.join(prefix, config["data"]["persons"])
         self.results_training_path = os.path.join(prefix, config["results"]["training"])
         self.results_test_path = os.path.join(prefix, config["results"]["test"])
+        self.profiles_path = os.path.join(self.results_test_path, "author_profiles/")
+        self.feature_store_path = os.path.join(prefix, config.get("streaming", {}).get("path", "results/feature_store/"))
+        self.model_path = os.path.join(prefix, config.get("model", {}).get("path", "results/model/rf_model.pkl"))
+        self.checkpoint_path = os.path.join(prefix, config.get("checkpoints", {}).get("path", "results/checkpoints/"))
+        self.distributed_path = os.path.join(prefix, config.get("distributed", {}).get("path", "results/distributed/"))
+        loading = config.get("loading", {})
+        self.cache_path = os.path.join(prefix, loading.get("cache_path", "results/cache/")) \
+            if loading.get("cache", True) else None
+        self.chunksize = loading.get("chunksize", 100000)
         self.config = config
 
     def read_data(self) -> List[pd.DataFrame]:
         """
-        Loads the data into data frames
+        Loads the columns of the contributions and the ground truth that are used into data frames,
+        JSON Lines files are streamed in chunks and the data is cached as parquet keyed by the file hash
         :return: List[pd.DataFrame]
         """
-        data = pd.read_json(self.data_path)
-        gt = pd.read_json(self.gt_path)
-        persons = pd.read_json(self.persons_path)
+        data = load_table(self.data_path, CONTRIBUTION_COLUMNS, self.cache_path, self.chunksize)
+        gt = load_table(self.gt_path, GROUND_TRUTH_COLUMNS, self.cache_path, self.chunksize)
         logger.logging.info(">>> Loaded data successfully")
-        return [data, gt, persons]
+        return [data, gt]
+
+    def read_persons(self) -> pd.DataFrame:
+        """
+        Loads the persons data set
+        :return: pd.DataFrame
+        """
+        return load_table(self.persons_path, None, self.cache_path, self.chunksize)
 
     def report_cv_scores(self, cv_scores: dict) -> None:
         result_object = dict(
@@ -50,23 +68,56 @@ class FileUtil:
         with open(file, 'wb') as handle:
             pickle.dump(result_object, handle)
 
-    def report_profiles(self, profiles: List[set], df_test: pd.DataFrame) -> None:
+    def report_profiles(self, profiles: List[set], df_test: pd.DataFrame) -> ProfileStore:
+        """
+        Writes the author profiles as a memory-mappable profile store
+        :param profiles: List[set]
+        :param df_test: pd.DataFrame, contributions of the test data set
+        :return: ProfileStore
+        """
+        return ProfileStore.write(self.profiles_path, profiles, meta=dict(config=self.config),
+                                  strings=dict(testpersonid=list(df_test["personId"].unique())))
+
+    def report_sweep_results(self, df_results: pd.DataFrame, test_scores: dict = None) -> None:
+        """
+        Writes the validation scores of the trials and the test scores of the selected trial
+        :param df_results: pd.DataFrame, validation scores, one row per trial and threshold
+        :param test_scores: dict, test scores of the selected trial
+        :return: None
+        """
         result_object = dict(
             config=self.config,
-            profiles=profiles,
-            testpersonid=list(df_test["personId"].unique())
+            results=df_results,
+            test=test_scores
         )
 
-        file = self.results_test_path + 'author_profiles.pkl'
+        file = self.results_training_path + 'sweep_results.pkl'
         with open(file, 'wb') as handle:
             pickle.dump(result_object, handle)
+        df_results.to_csv(self.results_training_path + 'sweep_results.csv', index=False)
+
+    def load_profiles(self) -> List[set]:
+        """
+        Loads the author profiles written by report_profiles
+        :return: List[set]
+        """
+        return self.load_profile_store().profiles()
+
+    def load_profile_store(self) -> ProfileStore:
+        """
+        Opens the profile store written by report_profiles, single profiles are read without loading the store
+        :return: ProfileStore
+        """
+        return ProfileStore(self.profiles_path)
 
-    def report_test_results(self, mean_purity: float, mean_fragmentation: float, scores: dict):
+    def report_test_results(self, mean_purity: float, mean_fragmentation: float, scores: dict,
+                            clustering_scores: dict = None):
         result_object = dict(
             config=self.config,
             mean_purity=mean_purity,
             mean_fragmentation=mean_fragmentation,
-            classificatin_scores=scores
+            classificatin_scores=scores,
+            clustering_scores=clustering_scores
         )
 
         file = self.results_test_path + 'scores.pkl'
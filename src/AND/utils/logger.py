@@ -2,26 +2,34 @@ import logging
 import os
 from pathlib import Path
 
-for handler in logging.root.handlers[:]:
-    logging.root.removeHandler(handler)
+__all__ = ['DEFAULT_LOG_FILE', 'setup_logging']
 
 prefix = Path(os.path.abspath(os.path.realpath(__file__))).parents[3]
 
-try:
-    logging.basicConfig(filename=prefix / "results/logs/logger.log",
-                        level=logging.INFO,
-                        format='%(asctime)s - %(levelname)s - %(message)s',
-                        filemode="w")
+DEFAULT_LOG_FILE = prefix / "results/logs/logger.log"
 
-    # define a new Handler to log to console as well
-    console = logging.StreamHandler()
-    console.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    console.setFormatter(formatter)
-    logging.getLogger('').addHandler(console)
 
-except FileNotFoundError:
-    print(
-        "Could not find logger file in {prefix}/results/logs/logger.log"
-    )
-    raise FileNotFoundError
+def setup_logging(log_file: str = DEFAULT_LOG_FILE, level: int = logging.INFO, console: bool = True) -> None:
+    """
+    configures the root logger of an entry point, importing the package configures nothing
+    :param log_file: str, file the log is written to, the directory is created if it is missing, None for no file
+    :param level: int, e.g. logging.INFO
+    :param console: bool, log to the console as well
+    :return: None
+    """
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+        handler.close()
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = []
+    if log_file is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, mode="w"))
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        logging.root.addHandler(handler)
+    logging.root.setLevel(level)
@@ -0,0 +1,92 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Tuple
+
+__all__ = ['SharedArrays', 'attach_shared_arrays', 'release_shared_arrays', 'run_in_pool', 'split_range']
+
+
+class SharedArrays:
+    """
+    Copies numpy arrays into shared memory blocks, worker processes attach to the blocks
+    with attach_shared_arrays instead of receiving a pickled copy of the arrays.
+    The creating process owns the blocks and has to call close() when the workers are done.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.blocks = {}
+        self.arrays = {}
+        self.descriptors = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+            self.blocks[name] = block
+            self.arrays[name] = shared
+            self.descriptors[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self) -> None:
+        """
+        releases and removes the shared memory blocks
+        :return: None
+        """
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+
+def attach_shared_arrays(descriptors: Dict[str, Tuple]) -> Tuple[Dict[str, np.ndarray], List]:
+    """
+    attaches to shared memory blocks created by SharedArrays
+    :param descriptors: Dict[str, Tuple], SharedArrays.descriptors
+    :return: Tuple, the arrays and the shared memory handles that have to be released after use
+    """
+    arrays, handles = {}, []
+    for name, (block_name, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        handles.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays, handles
+
+
+def release_shared_arrays(arrays: Dict[str, np.ndarray], handles: List) -> None:
+    """
+    detaches a worker process from the shared memory blocks, all views on the arrays must be dropped before
+    :param arrays: Dict[str, np.ndarray]
+    :param handles: List, shared memory handles returned by attach_shared_arrays
+    :return: None
+    """
+    arrays.clear()
+    for block in handles:
+        block.close()
+
+
+def split_range(weights: np.ndarray, n_shards: int) -> List[Tuple[int, int]]:
+    """
+    splits range(len(weights)) into contiguous shards with roughly equal total weight
+    :param weights: np.ndarray, work per element
+    :param n_shards: int
+    :return: List[Tuple[int, int]], (start, stop) of the non empty shards
+    """
+    ends = np.cumsum(weights, dtype=np.float64)
+    if len(ends) == 0:
+        return []
+    targets = ends[-1] * np.arange(1, n_shards) / n_shards
+    boundaries = np.unique(np.r_[0, np.searchsorted(ends, targets, side="right"), len(weights)])
+    return [(int(start), int(stop)) for start, stop in zip(boundaries[:-1], boundaries[1:]) if stop > start]
+
+
+def run_in_pool(function: Callable, tasks: List[tuple], n_jobs: int) -> List:
+    """
+    runs function(*task) for every task in a process pool and returns the results in the order of the tasks
+    :param function: Callable, module level function
+    :param tasks: List[tuple], the arguments of the calls
+    :param n_jobs: int, number of worker processes
+    :return: List
+    """
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(function, *task) for task in tasks]
+        return [future.result() for future in futures]
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import zlib
+import numpy as np
+from typing import Dict, Hashable, List, Tuple
+
+__all__ = ['PROFILE_STORE_VERSION', 'ProfileStore']
+
+PROFILE_STORE_VERSION = 1
+
+
+def encode_ids(ids: List[Hashable]) -> Tuple[List[bytes], np.ndarray, np.ndarray]:
+    """
+    encodes ids as one flat utf-8 byte array
+    :param ids: List, str or int ids
+    :return: Tuple, the encoded ids, the bytes and the offsets with offsets[k]:offsets[k + 1] the bytes of id k
+    """
+    encoded = [str(i).encode("utf-8") for i in ids]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return encoded, np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def hash_table(encoded: List[bytes]) -> np.ndarray:
+    """
+    open addressing hash table of the positions of the keys with linear probing, the slot of a key is its crc32
+    modulo the size of the table, which is a power of two with at least twice as many slots as keys.
+    The keys are placed in rounds, in round r every key that is not placed yet tries the r-th slot after its
+    own slot and the first of the keys that try the same free slot gets it, so the slots between the slot of a key
+    and its position are all taken and a lookup finds the key before it hits a free slot.
+    :param encoded: List[bytes], distinct keys
+    :return: np.ndarray, position of the key in every slot, -1 for free slots
+    """
+    size = 8
+    while size < 2 * len(encoded):
+        size *= 2
+    table = np.full(size, -1, dtype=np.int64)
+    hashes = np.fromiter((zlib.crc32(key) for key in encoded), dtype=np.int64, count=len(encoded))
+    pending = np.arange(len(encoded), dtype=np.int64)
+    probe = 0
+    while len(pending):
+        slots = (hashes[pending] + probe) & (size - 1)
+        free = table[slots] < 0
+        slots, candidates = slots[free], pending[free]
+        taken, first = np.unique(slots, return_index=True)
+        table[taken] = candidates[first]
+        placed = np.zeros(len(encoded), dtype=bool)
+        placed[candidates[first]] = True
+        pending = pending[~placed[pending]]
+        probe += 1
+    return table
+
+
+class ProfileStore:
+    """
+    On-disk columnar store of the author profiles. The contribution ids are stored grouped by profile as utf-8
+    bytes with an offsets index, the members of profile k are the positions profile_offsets[k]:profile_offsets[k + 1]
+    and labels holds the profile id of every position. A persisted hash table maps a contribution id to its
+    position, so one profile or the profile of one contribution is read from the memory maps in O(1)
+    without loading the whole store. meta.json holds the sizes, the type of the ids and meta data of the run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as handle:
+            self.meta = json.load(handle)
+        if self.meta["version"] != PROFILE_STORE_VERSION:
+            raise ValueError("Profile store version {} is not supported, expected {}".format(
+                self.meta["version"], PROFILE_STORE_VERSION))
+        self.n_profiles = self.meta["n_profiles"]
+        self.n_contributions = self.meta["n_contributions"]
+        self.id_type = int if self.meta["id_type"] == "int" else str
+        self.columns = {}
+
+    @classmethod
+    def write(cls, path: str, profiles: List[set], meta: dict = None,
+              strings: Dict[str, List[Hashable]] = None) -> 'ProfileStore':
+        """
+        writes profiles to a store, an existing store in path is overwritten
+        :param path: str, directory of the store
+        :param profiles: List[set], sets of contribution ids, the profile id is the position in the list
+        :param meta: dict, json serializable meta data, e.g. the config of the run
+        :param strings: Dict[str, List], further lists of ids that are stored as string columns
+        :return: ProfileStore
+        """
+        os.makedirs(path, exist_ok=True)
+        for file in os.listdir(path):
+            if file.endswith(".bin") or file == "meta.json":
+                os.remove(os.path.join(path, file))
+
+        members = [sorted(profile) for profile in profiles]
+        lengths = np.array([len(profile) for profile in members], dtype=np.int64)
+        ids = [contribution for profile in members for contribution in profile]
+        id_type = "int" if ids and all(isinstance(i, (int, np.integer)) for i in ids) else "str"
+        encoded, data, offsets = encode_ids(ids)
+
+        profile_offsets = np.zeros(len(members) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=profile_offsets[1:])
+        columns = {"id_bytes": data, "id_offsets": offsets, "profile_offsets": profile_offsets,
+                   "labels": np.repeat(np.arange(len(members), dtype=np.int64), lengths),
+                   "index": hash_table(encoded)}
+        for name, values in (strings or {}).items():
+            _, columns[name + "_bytes"], columns[name + "_offsets"] = encode_ids(values)
+
+        dtypes = {}
+        for name, values in columns.items():
+            dtypes[name] = values.dtype.str
+            values.tofile(os.path.join(path, name + ".bin"))
+        # meta.json is written last, a store without it is incomplete
+        with open(os.path.join(path, "meta.json"), "w") as handle:
+            json.dump(dict(version=PROFILE_STORE_VERSION, created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                           n_profiles=len(members), n_contributions=len(ids), id_type=id_type,
+                           dtypes=dtypes, strings=sorted(strings or {}), meta=meta or {}),
+                      handle, default=str)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.n_profiles
+
+    def __contains__(self, contribution_id: Hashable) -> bool:
+        return self.position(contribution_id) >= 0
+
+    def __reduce__(self):
+        # a pickled store is reopened from disk, e.g. in a worker process
+        return ProfileStore, (self.path,)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        memory map of a column, the maps are opened on first access
+        :param name: str
+        :return: np.ndarray
+        """
+        if name not in self.columns:
+            file = os.path.join(self.path, name + ".bin")
+            dtype = np.dtype(self.meta["dtypes"][name])
+            if os.path.getsize(file) == 0:
+                self.columns[name] = np.array([], dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(file, dtype=dtype, mode="r")
+        return self.columns[name]
+
+    def key(self, position: int) -> bytes:
+        """
+        encoded contribution id at a position
+        :param position: int
+        :return: bytes
+        """
+        offsets = self.column("id_offsets")
+        return self.column("id_bytes")[offsets[position]:offsets[position + 1]].tobytes()
+
+    def position(self, contribution_id: Hashable) -> int:
+        """
+        position of a contribution id, looked up in the hash table
+        :param contribution_id: str or int
+        :return: int, -1 if the contribution is not in the store
+        """
+        key = str(contribution_id).encode("utf-8")
+        table = self.column("index")
+        slot = zlib.crc32(key) & (len(table) - 1)
+        while True:
+            position = int(table[slot])
+            if position < 0 or self.key(position) == key:
+                return position
+            slot = (slot + 1) & (len(table) - 1)
+
+    def profile_id(self, contribution_id: Hashable) -> int:
+        """
+        id of the profile of a contribution
+        :param contribution_id: str or int
+        :return: int
+        """
+        position = self.position(contribution_id)
+        if position < 0:
+            raise KeyError(contribution_id)
+        return int(self.column("labels")[position])
+
+    def profile(self, profile_id: int) -> set:
+        """
+        contribution ids of a profile
+        :param profile_id: int
+        :return: set
+        """
+        if not 0 <= profile_id < self.n_profiles:
+            raise IndexError("Profile {} is not in the store of {} profiles".format(profile_id, self.n_profiles))
+        offsets = self.column("profile_offsets")
+        return set(self.decode("id", offsets[profile_id], offsets[profile_id + 1]))
+
+    def profile_of(self, contribution_id: Hashable) -> set:
+        """
+        profile of a contribution
+        :param contribution_id: str or int
+        :return: set
+        """
+        return self.profile(self.profile_id(contribution_id))
+
+    def decode(self, name: str, start: int = 0, stop: int = None) -> List[Hashable]:
+        """
+        decodes the values start:stop of a string column
+        :param name: str, id or the name of a column of ProfileStore.write strings
+        :param start: int
+        :param stop: int
+        :return: List
+        """
+        offsets = self.column(name + "_offsets")
+        stop = len(offsets) - 1 if stop is None else stop
+        bounds = np.asarray(offsets[start:stop + 1]) - offsets[start]
+        raw = self.column(name + "_bytes")[offsets[start]:offsets[stop]].tobytes()
+        values = [raw[first:last].decode("utf-8") for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+        return [self.id_type(value) for value in values] if name == "id" else values
+
+    def labels(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        all contribution ids and their profile ids
+        :return: Tuple[np.ndarray], contribution ids and profile ids
+        """
+        return np.array(self.decode("id"), dtype=object), np.array(self.column("labels"))
+
+    def profiles(self) -> List[set]:
+        """
+        all profiles
+        :return: List[set]
+        """
+        ids, offsets = self.decode("id"), self.column("profile_offsets").tolist()
+        return [set(ids[start:stop]) for start, stop in zip(offsets[:-1], offsets[1:])]
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import resource
+import threading
+import cProfile
+from contextlib import contextmanager
+from typing import Iterator
+
+__all__ = ['Profiler', 'activate', 'count', 'section', 'stage']
+
+
+def current_rss() -> int:
+    """
+    current resident set size of the process in bytes, None where /proc is not available
+    :return: int
+    """
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss() -> int:
+    """
+    peak resident set size of the process so far in bytes
+    :return: int
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def children_cpu() -> float:
+    """
+    cpu time of the terminated child processes, e.g. the workers of the process pools
+    :return: float, seconds
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class RssSampler(threading.Thread):
+    """
+    Samples the resident set size in the background to get the peak memory of a single stage,
+    the peak of the process (ru_maxrss) only ever grows and says nothing about later stages.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss() or 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss() or 0)
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return max(self.peak, current_rss() or 0)
+
+
+class Profiler:
+    """
+    Records wall time, cpu time, peak memory, row and pair counts and the throughput of the pipeline stages,
+    and the accumulated time of the sections within a stage, e.g. the feature functions.
+    A disabled profiler records nothing, so the instrumentation can stay in place.
+    """
+
+    def __init__(self, enabled: bool = True, cprofile: bool = False):
+        self.enabled = enabled
+        self.stages = []
+        self.sections = {}
+        self.active = []
+        self.nested = []
+        self.cprofile = cProfile.Profile() if enabled and cprofile else None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        """
+        measures a stage
+        :param name: str
+        :return: Iterator[dict], the record of the stage, counts can be added with count
+        """
+        if not self.enabled:
+            yield {}
+            return
+        record = dict(stage=name)
+        sampler = RssSampler() if current_rss() is not None else None
+        if sampler is not None:
+            sampler.start()
+        self.active.append(record)
+        wall, cpu, cpu_children = time.perf_counter(), time.process_time(), children_cpu()
+        nested = dict(wall=0.0, cpu=0.0, cpu_children=0.0)
+        self.nested.append(nested)
+        try:
+            yield record
+        finally:
+            # stages that are resolved within this stage, e.g. upstream stages, are reported on their own
+            total = dict(wall=time.perf_counter() - wall,
+                         cpu=time.process_time() - cpu,
+                         cpu_children=children_cpu() - cpu_children)
+            record["wall_seconds"] = total["wall"] - nested["wall"]
+            record["cpu_seconds"] = total["cpu"] - nested["cpu"]
+            record["cpu_seconds_children"] = total["cpu_children"] - nested["cpu_children"]
+            record["peak_rss_bytes"] = sampler.stop() if sampler is not None else max_rss()
+            for key in ("rows", "pairs"):
+                if key in record and record["wall_seconds"] > 0:
+                    record[key + "_per_second"] = record[key] / record["wall_seconds"]
+            self.active.remove(record)
+            self.nested.pop()
+            if self.nested:
+                for key in total:
+                    self.nested[-1][key] += total[key]
+            self.stages.append(record)
+
+    def count(self, **counts) -> None:
+        """
+        adds counts, e.g. rows=... or pairs=..., to the innermost running stage
+        :param counts: int
+        :return: None
+        """
+        if self.enabled and self.active:
+            record = self.active[-1]
+            for key, value in counts.items():
+                record[key] = record.get(key, 0) + int(value)
+
+    @contextmanager
+    def section(self, name: str, pairs: int = 0) -> Iterator[None]:
+        """
+        accumulates the time spent in a section over all its calls
+        :param name: str, e.g. the name of a feature function
+        :param pairs: int, number of pairs processed by the call
+        :return: Iterator[None]
+        """
+        if not self.enabled:
+            yield
+            return
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = self.sections.setdefault(name, dict(calls=0, pairs=0, wall_seconds=0.0, cpu_seconds=0.0))
+            record["calls"] += 1
+            record["pairs"] += int(pairs)
+            record["wall_seconds"] += time.perf_counter() - wall
+            record["cpu_seconds"] += time.process_time() - cpu
+
+    def start(self) -> None:
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self) -> None:
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+    def report(self) -> dict:
+        """
+        structured report of the recorded stages and sections
+        :return: dict
+        """
+        sections = {}
+        for name, record in self.sections.items():
+            sections[name] = dict(record)
+            if record["wall_seconds"] > 0:
+                sections[name]["pairs_per_second"] = record["pairs"] / record["wall_seconds"]
+        return dict(stages=list(self.stages), sections=sections, process_peak_rss_bytes=max_rss())
+
+    def write(self, path: str) -> None:
+        """
+        writes the report as profile.json and, if enabled, the cProfile statistics as profile.prof into path
+        :param path: str, directory
+        :return: None
+        """
+        if not self.enabled:
+            return
+        with open(os.path.join(path, "profile.json"), "w") as handle:
+            json.dump(self.report(), handle, indent=2)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(os.path.join(path, "profile.prof"))
+
+
+# profiler of the running pipeline, disabled unless a pipeline activates its own
+PROFILER = Profiler(enabled=False)
+
+
+def activate(profiler: Profiler) -> Profiler:
+    """
+    makes a profiler the profiler of the running pipeline
+    :param profiler: Profiler
+    :return: Profiler
+    """
+    global PROFILER
+    PROFILER = profiler
+    return profiler
+
+
+def stage(name: str):
+    return PROFILER.stage(name)
+
+
+def section(name: str, pairs: int = 0):
+    return PROFILER.section(name, pairs)
+
+
+def count(**counts) -> None:
+    PROFILER.count(**counts)
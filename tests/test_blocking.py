@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+import AND.model.cleaning as cleaning
+from AND.benchmark.synthetic import generate_corpus
+from AND.model.blocking import BLOCKING_STRATEGIES, blocking_recall, create_candidate_pairs
+from AND.training.data_preparation import combine_data_sets
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["plain", "compact"])
+def contributions(request) -> pd.DataFrame:
+    raw, gt = generate_corpus(300, seed=5)
+    df = cleaning.cleaning_procedure(combine_data_sets(raw, gt))
+    return cleaning.compact_contributions(df) if request.param else df
+
+
+@pytest.mark.parametrize("strategy", sorted(BLOCKING_STRATEGIES))
+def test_blocking_strategy_pairs(contributions, strategy):
+    left, right = BLOCKING_STRATEGIES[strategy](contributions)
+    keys = left.astype(np.int64) * len(contributions) + right
+
+    assert len(left) == len(right) > 0
+    assert (left < right).all()
+    assert len(np.unique(keys)) == len(keys)
+    assert right.max() < len(contributions)
+
+    candidate_left, candidate_right = create_candidate_pairs(contributions, strategy)
+    assert np.array_equal(np.sort(keys), candidate_left * len(contributions) + candidate_right)
+    # the blocking finds almost all matching pairs among a small share of all pairs
+    assert blocking_recall(contributions, candidate_left, candidate_right) >= 0.9
+    assert len(candidate_left) < 0.1 * len(contributions) * (len(contributions) - 1) / 2
+
+
+def test_create_candidate_pairs_unknown_strategy(contributions):
+    with pytest.raises(ValueError):
+        create_candidate_pairs(contributions, "last_name")
+
+
+def test_blocking_recall():
+    df = pd.DataFrame({"personId": ["a", "a", "a", "b", "b", "c"]})
+
+    # two of the four matching pairs, the pair (2, 5) of different persons does not count
+    assert blocking_recall(df, np.array([0, 3, 2]), np.array([1, 4, 5])) == 0.5
+    assert blocking_recall(df.iloc[[0, 3, 5]], np.array([0]), np.array([1])) == 1.0
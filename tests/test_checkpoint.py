@@ -0,0 +1,73 @@
+import os
+import pytest
+from AND.utils.checkpoint import CheckpointStore
+from AND.utils.data_loader import file_hash
+
+
+@pytest.fixture
+def data_file(tmp_path) -> str:
+    path = str(tmp_path / "contributions.jsonl")
+    with open(path, "w") as handle:
+        handle.write('{"contribution_id": 1}\n')
+    return path
+
+
+def run(path: str, data_file: str, split: float, rate: int, enabled: bool = True) -> tuple:
+    # a two stage pipeline in a fresh store as in a new run, returns the result and the stages that were computed
+    store, computed = CheckpointStore(path, enabled=enabled), []
+
+    def load():
+        computed.append("load")
+        with open(data_file) as handle:
+            return {"lines": handle.read().count("\n"), "split": split}
+
+    def pairs():
+        computed.append("pairs")
+        return dict(loaded.value, rate=rate)
+
+    loaded = store.stage("load", load, file_hash(data_file), split)
+    return store.stage("pairs", pairs, loaded, rate).value, computed
+
+
+def test_checkpoint_is_reused_with_unchanged_fingerprint(tmp_path, data_file):
+    path = str(tmp_path / "checkpoints")
+    value, computed = run(path, data_file, 0.6, 3)
+
+    assert computed == ["pairs", "load"]
+    assert len(os.listdir(path)) == 2
+    # the last stage is read from its checkpoint, the upstream stage is neither computed nor read
+    assert run(path, data_file, 0.6, 3) == (value, [])
+
+
+def test_checkpoint_is_recomputed_when_an_input_changes(tmp_path, data_file):
+    path = str(tmp_path / "checkpoints")
+    run(path, data_file, 0.6, 3)
+
+    # a config value of the last stage only recomputes the last stage
+    assert run(path, data_file, 0.6, 5) == ({"lines": 1, "split": 0.6, "rate": 5}, ["pairs"])
+    # a config value of the first stage changes the keys of both stages
+    assert run(path, data_file, 0.7, 3) == ({"lines": 1, "split": 0.7, "rate": 3}, ["pairs", "load"])
+    # so does a change of the input file
+    with open(data_file, "a") as handle:
+        handle.write('{"contribution_id": 2}\n')
+    assert run(path, data_file, 0.6, 3) == ({"lines": 2, "split": 0.6, "rate": 3}, ["pairs", "load"])
+    assert run(path, data_file, 0.6, 3)[1] == []
+
+
+def test_unreadable_checkpoint_is_recomputed(tmp_path, data_file):
+    path = str(tmp_path / "checkpoints")
+    value, _ = run(path, data_file, 0.6, 3)
+    for file in os.listdir(path):
+        if file.startswith("pairs"):
+            with open(os.path.join(path, file), "wb") as handle:
+                handle.write(b"not a pickle")
+
+    # the broken checkpoint of the last stage is recomputed from the checkpoint of the first stage
+    assert run(path, data_file, 0.6, 3) == (value, ["pairs"])
+
+
+def test_disabled_checkpoints_compute_every_run(tmp_path, data_file):
+    path = str(tmp_path / "checkpoints")
+    for _ in range(2):
+        assert run(path, data_file, 0.6, 3, enabled=False)[1] == ["pairs", "load"]
+    assert not os.path.exists(path)
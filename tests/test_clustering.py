@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from AND.model.graph import ProbabilityClustering, cluster_by_probability, create_graph, get_disconnected_subgraphs
+
+
+def as_partition(profiles) -> list:
+    return sorted(sorted(profile) for profile in profiles)
+
+
+def random_pairs(n_nodes: int, n_pairs: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    left, right = rng.integers(0, n_nodes, n_pairs), rng.integers(0, n_nodes, n_pairs)
+    keep = left != right
+    return pd.DataFrame({"contribution_id": left[keep], "contribution_id_2nd": right[keep],
+                         "probability": rng.random(keep.sum())})
+
+
+def two_groups(weak: float) -> pd.DataFrame:
+    # two groups of four with confident pairs inside, one strong pair between them and weak pairs for the rest
+    group_a, group_b = [0, 1, 2, 3], [4, 5, 6, 7]
+    pairs = [(i, j, 0.99) for group in (group_a, group_b) for i in group for j in group if i < j]
+    pairs += [(i, j, 0.9 if (i, j) == (0, 4) else weak) for i in group_a for j in group_b]
+    return pd.DataFrame(pairs, columns=["contribution_id", "contribution_id_2nd", "probability"])
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_single_linkage_without_cap_equals_connected_components(seed):
+    df = random_pairs(60, 70, seed)
+    nodes = list(range(65))
+    edges = df.assign(prediction=(df["probability"] >= 0.5).astype(np.int8))
+    expected = as_partition(get_disconnected_subgraphs(create_graph(edges, nodes=nodes)))
+
+    clustering = ProbabilityClustering(threshold=0.5, nodes=nodes)
+    clustering.add_scored_pairs(df["contribution_id"].values, df["contribution_id_2nd"].values,
+                                df["probability"].values)
+    lazy = cluster_by_probability(df, nodes=nodes, score=lambda chunk: chunk["probability"].values, chunk_size=9)
+
+    assert 1 < len(expected) < len(nodes)
+    assert as_partition(cluster_by_probability(df, threshold=0.5, nodes=nodes)) == expected
+    assert as_partition(clustering.profiles()) == expected
+    assert as_partition(lazy) == expected
+
+
+def test_average_linkage_does_not_merge_on_one_strong_pair():
+    df = two_groups(weak=0.05)
+
+    assert as_partition(cluster_by_probability(df, linkage="single")) == [list(range(8))]
+    # the mean over the sixteen pairs between the groups is (0.9 + 15 * 0.05) / 16, far below the threshold
+    assert as_partition(cluster_by_probability(df, linkage="average")) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    # with mostly confident pairs between the groups the mean reaches the threshold
+    assert as_partition(cluster_by_probability(two_groups(weak=0.6), linkage="average")) == [list(range(8))]
+
+
+@pytest.mark.parametrize("linkage", ["single", "average"])
+def test_max_cluster_size_is_respected(linkage):
+    df = random_pairs(40, 200, 3)
+    df["probability"] = 0.5 + df["probability"] / 2
+
+    profiles = cluster_by_probability(df, threshold=0.5, linkage=linkage, max_cluster_size=4)
+
+    assert max(len(profile) for profile in profiles) <= 4
+    assert sorted(i for profile in profiles for i in profile) == sorted(set(df["contribution_id"]) |
+                                                                       set(df["contribution_id_2nd"]))
+    assert len(cluster_by_probability(df, threshold=0.5, linkage="single")) < len(profiles)
@@ -0,0 +1,67 @@
+import os
+import pytest
+import AND.model.cleaning as cleaning
+import AND.utils.logger as logger
+from AND.benchmark.synthetic import generate_corpus
+from AND.distributed.__main__ import run_distributed
+from AND.model.artifact import save_model
+from AND.model.feature_matrix import compute_features_vectorized
+from AND.model.graph import create_profiles
+from AND.model.precompute import ContributionCache
+from AND.model.rf_classifier import rfClassifier
+from AND.training.data_preparation import combine_data_sets, create_contribution_pairs
+
+BLOCKING = {"strategy": "soundex_last_name"}
+FEATURES = ["exact_match_first_name_cleaned", "exact_match_last_name_cleaned", "soundex_first_name_cleaned",
+            "soundex_last_name_cleaned", "exact_match_workplace_cleaned", "no_shared_focus_area", "no_shared_orgs",
+            "min_distance_km"]
+
+
+def disambiguate(df, classifier):
+    df = cleaning.compact_contributions(cleaning.cleaning_procedure(df))
+    pairs = create_contribution_pairs(df, n=1, blocking=BLOCKING)
+    pairs = classifier.predict(compute_features_vectorized(pairs, ContributionCache(df), features=classifier.features))
+    return create_profiles(pairs, nodes=list(df["contribution_id"].unique()))
+
+
+@pytest.fixture
+def corpus():
+    return generate_corpus(300, seed=5)
+
+
+@pytest.fixture
+def classifier(corpus):
+    raw, gt = corpus
+    classifier = rfClassifier(dict(max_depth=5, n_estimators=10, n_folds=3, col_label="same_person",
+                                   features=FEATURES))
+    df = cleaning.compact_contributions(cleaning.cleaning_procedure(combine_data_sets(raw.copy(), gt)))
+    pairs = create_contribution_pairs(df, n=1, blocking=BLOCKING)
+    classifier.fit_classifier(compute_features_vectorized(pairs, ContributionCache(df), features=FEATURES))
+    return classifier
+
+
+@pytest.fixture
+def config(corpus, classifier, tmp_path, monkeypatch):
+    # the local workers log next to the log file
+    monkeypatch.setattr(logger, "DEFAULT_LOG_FILE", str(tmp_path / "logger.log"))
+    raw, gt = corpus
+    raw.to_json(tmp_path / "contributions.jsonl", orient="records", lines=True)
+    gt.to_json(tmp_path / "ground_truth.jsonl", orient="records", lines=True)
+    save_model(classifier, str(tmp_path / "model.pkl"))
+    # absolute paths are kept by FileUtil, the small chunks partition the contributions in several chunks
+    return dict(data=dict(data=str(tmp_path / "contributions.jsonl"), ground_truth=str(tmp_path / "ground_truth.jsonl"),
+                          persons=str(tmp_path / "persons.jsonl")),
+                results=dict(training=str(tmp_path / "training"), test=str(tmp_path / "test")),
+                model=dict(path=str(tmp_path / "model.pkl")), loading=dict(cache=False, chunksize=70),
+                distributed=dict(path=str(tmp_path / "distributed")), blocking=BLOCKING)
+
+
+def test_run_distributed_equals_single_process(corpus, classifier, config):
+    raw, gt = corpus
+    expected = disambiguate(combine_data_sets(raw.copy(), gt), classifier)
+
+    profiles = run_distributed(config, n_shards=4, n_workers=2)
+
+    assert len(expected) > 1
+    assert sorted(map(sorted, profiles)) == sorted(map(sorted, expected))
+    assert len(os.listdir(os.path.join(config["distributed"]["path"], "shards"))) == 4
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from AND.training.evaluation import CLUSTERING_SCORES, clustering_scores, evaluate_clustering
+
+# three persons with three, two and one contributions
+PERSONS = np.array(["a", "a", "a", "b", "b", "c"])
+
+
+def assert_scores(scores: dict, expected: dict):
+    assert set(scores) == set(CLUSTERING_SCORES)
+    for name in CLUSTERING_SCORES:
+        assert scores[name] == pytest.approx(expected[name]), name
+
+
+def test_clustering_scores_perfect_clustering():
+    scores = clustering_scores(np.array([7, 7, 7, 3, 3, 5]), PERSONS)
+
+    assert_scores(scores, {name: 1.0 for name in CLUSTERING_SCORES})
+
+
+def test_clustering_scores_one_cluster():
+    scores = clustering_scores(np.zeros(6, dtype=int), PERSONS)
+
+    # 14 / 36 = (3 ** 2 + 2 ** 2 + 1 ** 2) / 6 / 6, 4 of the 15 predicted pairs are true pairs
+    assert_scores(scores, dict(mean_purity=0.5, mean_fragmentation=1.0,
+                               bcubed_precision=14 / 36, bcubed_recall=1.0, bcubed_f1=2 * 14 / 50,
+                               pairwise_precision=4 / 15, pairwise_recall=1.0, pairwise_f1=8 / 19))
+
+
+def test_clustering_scores_singletons():
+    scores = clustering_scores(np.arange(6), PERSONS)
+
+    # without predicted pairs the pairwise precision is 1
+    assert_scores(scores, dict(mean_purity=1.0, mean_fragmentation=2.0,
+                               bcubed_precision=1.0, bcubed_recall=0.5, bcubed_f1=2 / 3,
+                               pairwise_precision=1.0, pairwise_recall=0.0, pairwise_f1=0.0))
+
+
+def test_clustering_scores_split_and_merge():
+    # a is split into {a, a, b} and {a}, b is split over {a, a, b} and {b}
+    scores = clustering_scores(np.array([0, 0, 1, 0, 2, 3]), PERSONS)
+
+    # B-cubed precision (5 / 3 + 1 + 1 + 1) / 6, recall (5 / 3 + 1 + 1) / 6,
+    # one of the three predicted pairs and of the four true pairs is found
+    assert_scores(scores, dict(mean_purity=11 / 12, mean_fragmentation=5 / 3,
+                               bcubed_precision=7 / 9, bcubed_recall=11 / 18, bcubed_f1=154 / 225,
+                               pairwise_precision=1 / 3, pairwise_recall=1 / 4, pairwise_f1=2 / 7))
+
+
+def test_clustering_scores_without_contributions():
+    scores = clustering_scores(np.array([], dtype=int), np.array([], dtype=int))
+
+    assert all(np.isnan(scores[name]) for name in CLUSTERING_SCORES)
+
+
+def test_evaluate_clustering_matches_clustering_scores():
+    df_gt = pd.DataFrame({"contributionId": ["c1", "c2", "c3", "c4", "c5", "c6"], "personId": PERSONS})
+    profiles = [{"c1", "c2", "c4"}, {"c3"}, {"c5"}, {"c6"}]
+
+    assert_scores(evaluate_clustering(profiles, df_gt), clustering_scores(np.array([0, 0, 1, 0, 2, 3]), PERSONS))
+    with pytest.raises(KeyError):
+        evaluate_clustering([{"c1", "c7"}], df_gt)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+import AND.model.cleaning as cleaning
+import AND.model.feature_engineering as feature_engineering
+from AND.benchmark.synthetic import generate_corpus
+from AND.model.feature_matrix import FEATURE_NAMES, SIMILARITY_FEATURES, compute_feature_matrix
+from AND.model.precompute import ContributionCache
+from AND.training.data_preparation import combine_data_sets, create_contribution_pairs
+
+# features of feature_engineering.compute_features, the similarity features have no reference implementation
+REFERENCE_FEATURES = [name for name in FEATURE_NAMES if name not in SIMILARITY_FEATURES]
+
+
+@pytest.fixture(scope="module")
+def contributions() -> pd.DataFrame:
+    raw, gt = generate_corpus(60, seed=3)
+    return cleaning.cleaning_procedure(combine_data_sets(raw, gt))
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_compute_feature_matrix_equals_compute_features(contributions, compact):
+    df = cleaning.compact_contributions(contributions.copy()) if compact else contributions
+    pairs = create_contribution_pairs(df, n=1)
+    expected = feature_engineering.compute_features(pairs.copy(), contributions=contributions)[REFERENCE_FEATURES]
+
+    matrix = compute_feature_matrix(pairs, ContributionCache(df), batch_size=97)
+    actual = matrix[:, [FEATURE_NAMES.index(name) for name in REFERENCE_FEATURES]]
+
+    assert len(pairs) > 0
+    for k, name in enumerate(REFERENCE_FEATURES):
+        assert np.isclose(actual[:, k], expected[name].to_numpy(dtype=np.float64), equal_nan=True).all(), name
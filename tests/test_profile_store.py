@@ -0,0 +1,84 @@
+import zlib
+import pytest
+from AND.utils.profile_store import ProfileStore, hash_table
+
+PROFILES = [{"c-1", "c-7", "c-3"}, {"c-2"}, {"c-10", "c-4"}, {"c-5", "c-6", "c-8", "c-9"}]
+
+
+# ids whose crc32 falls into the same slot of a hash table of the given size
+def colliding_ids(slot: int, size: int, n: int) -> list:
+    ids = (str(k) for k in range(100000))
+    return [i for i in ids if zlib.crc32(i.encode("utf-8")) & (size - 1) == slot][:n]
+
+
+@pytest.mark.parametrize("profiles", [PROFILES, [{1, 5}, {2}, {3, 4, 6}]])
+def test_profile_store_round_trip(tmp_path, profiles):
+    store = ProfileStore.write(str(tmp_path / "profiles"), profiles, meta={"run": 1}, strings={"names": ["a", "b"]})
+
+    assert len(store) == len(profiles)
+    assert store.profiles() == profiles
+    for profile_id, profile in enumerate(profiles):
+        assert store.profile(profile_id) == profile
+        for contribution_id in profile:
+            assert contribution_id in store
+            assert store.profile_id(contribution_id) == profile_id
+            assert store.profile_of(contribution_id) == profile
+    ids, labels = store.labels()
+    assert {(i, label) for i, label in zip(ids, labels)} == \
+        {(i, k) for k, profile in enumerate(profiles) for i in profile}
+    assert store.decode("names") == ["a", "b"]
+
+
+def test_profile_store_missing_id(tmp_path):
+    store = ProfileStore.write(str(tmp_path / "profiles"), PROFILES)
+
+    assert "c-11" not in store
+    assert store.position("c-11") == -1
+    with pytest.raises(KeyError):
+        store.profile_id("c-11")
+    with pytest.raises(IndexError):
+        store.profile(len(PROFILES))
+
+
+def test_hash_table_collisions_wrap_around():
+    # four ids in the last slot of a table of eight slots, the probes wrap around to the first slots
+    ids = colliding_ids(7, 8, 4)
+    table = hash_table([i.encode("utf-8") for i in ids])
+
+    assert len(table) == 8
+    assert sorted(table[[7, 0, 1, 2]]) == [0, 1, 2, 3]
+    assert (table[3:7] == -1).all()
+
+
+def test_profile_store_collisions_wrap_around(tmp_path):
+    ids = colliding_ids(7, 8, 5)
+    profiles = [{ids[0], ids[1]}, {ids[2]}, {ids[3]}]
+    store = ProfileStore.write(str(tmp_path / "profiles"), profiles)
+
+    assert len(store.column("index")) == 8
+    for profile_id, profile in enumerate(profiles):
+        for contribution_id in profile:
+            assert store.profile_id(contribution_id) == profile_id
+    # a missing id of the same slot probes past all of the colliding ids
+    assert store.position(ids[4]) == -1
+
+
+def test_profile_store_reopens_from_disk(tmp_path):
+    path = str(tmp_path / "profiles")
+    ProfileStore.write(path, PROFILES, meta={"threshold": 0.5})
+    store = ProfileStore(path)
+
+    assert store.meta["meta"] == {"threshold": 0.5}
+    assert store.meta["n_contributions"] == sum(len(profile) for profile in PROFILES)
+    assert store.profile_of("c-9") == PROFILES[3]
+    assert store.profiles() == PROFILES
+
+    # the store is overwritten in place and an unsupported version is refused
+    ProfileStore.write(path, [{"c-1"}])
+    assert ProfileStore(path).profiles() == [{"c-1"}]
+    with open(tmp_path / "profiles" / "meta.json") as handle:
+        meta = handle.read()
+    with open(tmp_path / "profiles" / "meta.json", "w") as handle:
+        handle.write(meta.replace('"version": 1', '"version": 0'))
+    with pytest.raises(ValueError):
+        ProfileStore(path)
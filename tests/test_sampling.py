@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+import AND.model.cleaning as cleaning
+from AND.benchmark.synthetic import generate_corpus
+from AND.model.feature_matrix import compute_features_vectorized
+from AND.model.precompute import ContributionCache
+from AND.model.rf_classifier import rfClassifier
+from AND.training.data_preparation import block_pair_sampler, combine_data_sets, sample_contribution_pairs
+
+FEATURES = ["exact_match_first_name_cleaned", "exact_match_last_name_cleaned", "soundex_first_name_cleaned",
+            "soundex_last_name_cleaned", "no_shared_orgs"]
+
+
+@pytest.fixture(scope="module")
+def contributions() -> pd.DataFrame:
+    raw, gt = generate_corpus(200, seed=3)
+    return cleaning.compact_contributions(cleaning.cleaning_procedure(combine_data_sets(raw, gt)))
+
+
+def true_negative_count(df: pd.DataFrame) -> int:
+    sizes = df["personId"].value_counts().values.astype(np.int64)
+    return len(df) * (len(df) - 1) // 2 - int((sizes * (sizes - 1) // 2).sum())
+
+
+# the strata are enumerated or drawn by rejection sampling depending on how densely they are sampled
+@pytest.mark.parametrize("negatives_per_positive, hard_fraction", [(5, 0.5), (5, 0.02), (20, 0.5)])
+def test_sample_contribution_pairs(contributions, negatives_per_positive, hard_fraction):
+    pairs = sample_contribution_pairs(contributions, negatives_per_positive=negatives_per_positive,
+                                      hard_fraction=hard_fraction, seed=1)
+    positives, negatives = pairs[pairs["same_person"] == 1], pairs[pairs["same_person"] == 0]
+
+    assert not pairs.duplicated(["left", "right"]).any()
+    assert (pairs["left"] <= pairs["right"]).all()
+    assert (pairs.loc[pairs["left"] == pairs["right"], "same_person"] == 1).all()
+    # all positive pairs (self pairs included) and exactly negatives_per_positive negatives per positive
+    sizes = contributions["personId"].value_counts().values
+    assert len(positives) == int((sizes * (sizes + 1) // 2).sum())
+    assert len(negatives) == negatives_per_positive * len(positives)
+    # the positives keep weight 1, the weights of the negatives add up to the number of negative pairs
+    assert (positives["sample_weight"] == 1).all()
+    assert negatives["sample_weight"].min() >= 1
+    assert negatives["sample_weight"].nunique() == 2
+    total = negatives["sample_weight"].to_numpy(dtype=np.float64).sum()
+    assert np.isclose(total, true_negative_count(contributions), rtol=1e-4)
+
+
+def test_block_pair_sampler_draws_pairs_of_a_block_uniformly():
+    blocks = np.array([0, 1, 0, 1, -1, 1])
+    left, right = block_pair_sampler(blocks, np.random.default_rng(0))(40000)
+
+    assert (left != right).all()
+    assert (blocks[left] == blocks[right]).all() and (blocks[left] >= 0).all()
+    # the block of size 2 holds one of the four pairs, every pair is drawn with probability 1 / 4
+    keys = np.minimum(left, right) * len(blocks) + np.maximum(left, right)
+    _, counts = np.unique(keys, return_counts=True)
+    assert len(counts) == 4
+    assert np.allclose(counts / len(keys), 0.25, atol=0.02)
+
+
+@pytest.mark.parametrize("sample_weights", [True, False])
+def test_sample_weights_reach_cross_validation_and_fit(contributions, monkeypatch, sample_weights):
+    pairs = sample_contribution_pairs(contributions, negatives_per_positive=5, seed=1)
+    pairs = compute_features_vectorized(pairs, ContributionCache(contributions), features=FEATURES)
+    weights = []
+    fit = RandomForestClassifier.fit
+
+    def spy(self, X, y, sample_weight=None):
+        weights.append(sample_weight)
+        return fit(self, X, y, sample_weight=sample_weight)
+
+    monkeypatch.setattr(RandomForestClassifier, "fit", spy)
+    classifier = rfClassifier(dict(max_depth=3, n_estimators=5, n_folds=3, col_label="same_person",
+                                   features=FEATURES, sample_weights=sample_weights))
+    classifier.run_cross_validation(pairs)
+    classifier.fit_classifier(pairs)
+
+    assert len(weights) == 4
+    if not sample_weights:
+        assert all(w is None for w in weights)
+        return
+    # every fold is fitted on a part of the weights, the final model on all of them
+    for w in weights[:3]:
+        assert 0 < len(w) < len(pairs) and set(np.unique(w)) <= set(np.unique(pairs["sample_weight"]))
+    assert np.array_equal(weights[3], pairs["sample_weight"].values)